@@ -33,6 +33,16 @@ If PATH is an .arc file, this tool will extract that file.
 If PATH is a folder, this tool will pack all files in that folder to
 an .arc file.
 
+Add --dedupe to store identical files only once when packing a folder:
+their entries in the file info table point to the same data.
+
+Usage: python arc.py ARC FILE [FILE ...]
+
+Replace (or add) the members of ARC which have the same names as the
+given files. The archive is changed in place: a member which still fits
+in its slot is overwritten, otherwise only the part of the archive after
+it is written again.
+
 Due to Windows' Command Prompt doesn't support Unicode file name right
 out of the box, you have to use `chcp 65501` to change the code page
 to UTF-8 before using this tool. Alternatively, you can create a .bat
@@ -48,7 +58,6 @@ whenever you want to use this tool.
 
 from __future__ import print_function
 import os
-import platform
 import sys
 from collections import namedtuple
 from struct import unpack, pack
@@ -56,13 +65,29 @@ if sys.version_info[0] > 2:
     unicode = str
     xrange = range
 
-try:
-    from cStringIO import StringIO as BytesIO
-except ImportError:
-    from io import BytesIO
+import atomic
+import profiling
+import sjis
+
+ALIGNMENT = 0x100 # Files in the data region are aligned to 0x100 bytes
+HEADER_LENGTH = 0x80 # The data region begins at 0x80 in the file
+
+
+def _padding(length):
+    return -length % ALIGNMENT
+
 
 class Arc(object):
-    """An arc file object."""
+    """An arc file object.
+
+    Changes made by append_file(), replace_file() and remove_file() are
+    tracked, so that save_in_place() only writes the parts of the file which
+    changed.
+
+    Several entries of the file info table may point to the same data (see
+    append_file() with `dedupe`); replacing or removing one of them does not
+    change the others.
+    """
     FileInfo = namedtuple('FileInfo', ['name', 'index', 'length', 'offset'])
 
     def __init__(self, header=None, raw=None):
@@ -78,9 +103,21 @@ class Arc(object):
             self.__init_empty()
 
     def __init_empty(self):
-        self.__data = b''
+        self.__data = bytearray()
         self.__info_table = []
-
+        self.__saved_size = None # Nothing on disk
+        self.__data_begin = None
+        self.__info_offset = None
+        self.__digests = None
+        self.__mark_saved()
+
+    def __mark_saved(self):
+        # Data offset from which the layout changed, and indexes of the files
+        # which were overwritten in their slots
+        self.__shift_from = None
+        self.__patched = set()
+
+    @profiling.profiled('arc.parse', lambda self, header, raw: len(raw))
     def __init(self, header, raw):
         # Header
         size, data_length, p1_count, p2_count = \
@@ -128,13 +165,20 @@ class Arc(object):
         for file_index in xrange(file_count):
             offset = info_offset + file_index * 16
             name_offset, index, length, file_offset =\
-                unpack('4I', self.__data[offset:offset + 16])
+                unpack('<4I', raw[offset:offset + 16])
             self.__info_table.append(self.FileInfo._make((
-                self.__label_dict[name_offset].decode('shift-jis'),
+                sjis.decode(self.__label_dict[name_offset]),
                 index,
                 length,
                 file_offset
             )))
+        # Where the data region and the file info table are on disk, for
+        # save_in_place(); offsets are from the end of the 0x20-byte header
+        self.__data_begin = data_begin
+        self.__info_offset = info_offset
+        self.__saved_size = 0x20 + len(raw)
+        self.__digests = None
+        self.__mark_saved()
 
     def get_file_count(self):
         """Get the number of files in the Arc object."""
@@ -157,75 +201,358 @@ class Arc(object):
             raise ValueError("Out-of-bound file index.")
 
         info = self.__info_table[file_index]
-        return self.__data[info.offset:info.offset + info.length]
+        return bytes(self.__data[info.offset:info.offset + info.length])
 
-    def append_file(self, name, data):
+    def find_file(self, name):
+        """Get the index of a file. Raise KeyError if there is no such file.
+        """
+        for info in self.__info_table:
+            if info.name == name:
+                return info.index
+        raise KeyError(name)
+
+    def __writable_data(self):
+        # Loaded archives keep the data region as immutable bytes until the
+        # first change
+        if not isinstance(self.__data, bytearray):
+            self.__data = bytearray(self.__data)
+        return self.__data
+
+    def __slot(self, file_index):
+        """Get the (offset, length) of the slot of a file, including the
+        padding. The slot ends where the data of the next file begins, so it
+        keeps the space left by data which was replaced by shorter data."""
+        info = self.__info_table[file_index]
+        end = len(self.__data)
+        for other in self.__info_table:
+            if info.offset < other.offset < end:
+                end = other.offset
+        return info.offset, end - info.offset
+
+    def __is_shared(self, file_index):
+        """Check whether other files begin at the offset of a file."""
+        offset = self.__info_table[file_index].offset
+        return any(info.offset == offset and info.index != file_index
+                   for info in self.__info_table)
+
+    def __shift(self, start, delta):
+        """Move the data of the files after data offset `start` by `delta`
+        bytes, and record that the layout changed from `start`."""
+        table = self.__info_table
+        if delta:
+            for i in xrange(len(table)):
+                if table[i].offset > start:
+                    table[i] = table[i]._replace(offset=table[i].offset +
+                                                 delta)
+        if self.__shift_from is None or start < self.__shift_from:
+            self.__shift_from = start
+
+    def __find_copy(self, data, digest):
+        """Get the offset of stored data which is the same as `data`, or
+        None."""
+        import hashlib
+        if self.__digests is None:
+            self.__digests = {}
+            for info in self.__info_table:
+                member = self.__data[info.offset:info.offset + info.length]
+                self.__digests.setdefault(hashlib.sha1(member).digest(),
+                                          info.offset)
+        offset = self.__digests.get(digest)
+        if offset is not None and \
+                self.__data[offset:offset + len(data)] == data:
+            return offset
+        return None
+
+    def __store(self, data):
+        """Add data at the end of the data region. Return its offset."""
+        buf = self.__writable_data()
+        offset = len(buf)
+        self.__shift(offset, 0)
+        buf += data
+        buf += b'\0' * _padding(len(data))
+        return offset
+
+    def append_file(self, name, data, dedupe=False):
         """Append a new file to the Arc object.
 
         Parameters:
         `name`: File name
         `data`: File data
+        `dedupe`: If True and the archive already contains the same data,
+            the new file points to it instead of storing another copy.
         """
-        if len(data) & 0xFF == 0x00:
-            pad = 0
+        offset = None
+        if dedupe:
+            import hashlib
+            digest = hashlib.sha1(data).digest()
+            offset = self.__find_copy(data, digest)
+        if offset is None:
+            offset = self.__store(data)
+            if dedupe:
+                self.__digests[digest] = offset
         else:
-            pad = 0x100 - (len(data) & 0xFF)
+            self.__shift(len(self.__data), 0) # The tables change
         self.__info_table.append(self.FileInfo._make((
-            name, len(self.__info_table), len(data), len(self.__data))))
-        self.__data += data + b'\0' * pad
+            name, len(self.__info_table), len(data), offset)))
+
+    def get_shared_size(self):
+        """Get the number of bytes saved by files which share their data
+        with other files, padding included."""
+        seen = set()
+        saved = 0
+        for info in self.__info_table:
+            if (info.offset, info.length) in seen:
+                saved += info.length + _padding(info.length)
+            else:
+                seen.add((info.offset, info.length))
+        return saved
 
-    def to_arc(self):
-        """Export the Arc object to .arc file format."""
-        output = BytesIO()
-        file_count = len(self.__info_table)
+    def replace_file(self, name, data):
+        """Replace the data of a file.
 
-        # Header
-        p1_offset = 0x60 + len(self.__data) + 0x4 + len(self.__info_table) * 16
-        output.write(pack('<4I', 0, p1_offset, file_count, file_count + 3))
+        If the new data fits in the slot of the file (the space up to the
+        next file), it is written over the old data and the rest of the slot
+        is filled with zeros; otherwise the files after it are moved. If other files share the data of this file, the
+        new data is added at the end of the data region.
 
-        output.write(b'\0' * 0x70) # Padding
-        output.write(self.__data) # Data
-        output.write(pack('<I', file_count)) # File count
+        Parameters:
+        `name`: File name
+        `data`: New file data
 
+        Raise KeyError if there is no such file.
+        """
+        file_index = self.find_file(name)
+        info = self.__info_table[file_index]
+        self.__digests = None
+        if self.__is_shared(file_index):
+            offset = self.__store(data)
+            self.__info_table[file_index] = info._replace(length=len(data),
+                                                          offset=offset)
+            return
+        offset, slot = self.__slot(file_index)
+        new_slot = len(data) + _padding(len(data))
+        buf = self.__writable_data()
+        self.__info_table[file_index] = info._replace(length=len(data))
+        if new_slot <= slot:
+            buf[offset:offset + slot] = data + b'\0' * (slot - len(data))
+            self.__patched.add(file_index)
+        else:
+            buf[offset:offset + slot] = data + b'\0' * (new_slot - len(data))
+            self.__shift(offset, new_slot - slot)
+
+    def remove_file(self, name):
+        """Remove a file. The files after it are moved, unless its data is
+        shared with other files.
+
+        Parameters:
+        `name`: File name
+
+        Raise KeyError if there is no such file.
+        """
+        file_index = self.find_file(name)
+        self.__digests = None
+        if self.__is_shared(file_index):
+            self.__shift(len(self.__data), 0) # The tables change
+        else:
+            offset, slot = self.__slot(file_index)
+            del self.__writable_data()[offset:offset + slot]
+            self.__shift(offset, -slot)
+        del self.__info_table[file_index]
+        table = self.__info_table
+        for i in xrange(file_index, len(table)):
+            table[i] = table[i]._replace(index=i)
+        self.__patched = set([i if i < file_index else i - 1
+                              for i in self.__patched if i != file_index])
+
+    def _pack_tables(self):
+        """Build everything except the data region.
+
+        Return a tuple (header, tables): `header` is written before the data
+        region, `tables` (file count, file info table, pointers and labels)
+        after it.
+        """
+        file_count = len(self.__info_table)
+        data_length = len(self.__data)
+        p1_offset = 0x60 + data_length + 0x4 + file_count * 16
         label_offset = p1_offset + file_count * 4 + (file_count + 3) * 8 + 16
-        name_length = 0
-        filenames = []
-        info_offsets = []
+        filenames = [sjis.encode(info.name) for info in self.__info_table]
+        tables = [pack('<I', file_count)] # File count
 
         # File info table
+        name_length = 0
+        info_offsets = []
         for file_index in xrange(file_count):
-            name_offset = label_offset + name_length
-            info_offsets.append(output.tell() - 0x20)
+            info_offsets.append(0x60 + data_length + 0x4 + file_index * 16)
             info = self.__info_table[file_index]
-            output.write(pack('<4I', name_offset, file_index, info.length,
-                              info.offset))
-            filenames.append(info.name.encode('shift-jis'))
+            tables.append(pack('<4I', label_offset + name_length, file_index,
+                               info.length, info.offset))
             name_length += len(filenames[file_index]) + 1
 
         # Pointer region 1
-        for file_index in xrange(file_count):
-            output.write(pack('<I', info_offsets[file_index]))
+        tables.append(pack('<%dI' % file_count, *info_offsets))
 
         # Pointer region 2
-        output.write(pack('<2I', 0x60, 0x0))
-        output.write(pack('<2I', 0x60 + len(self.__data), 0x5))
-        output.write(pack('<2I', 0x60 + len(self.__data) + 0x4, 0xB))
+        tables.append(pack('<2I', 0x60, 0x0))
+        tables.append(pack('<2I', 0x60 + data_length, 0x5))
+        tables.append(pack('<2I', 0x60 + data_length + 0x4, 0xB))
         name_length = 16
         for file_index in xrange(file_count):
-            output.write(pack('<2I', info_offsets[file_index], name_length))
+            tables.append(pack('<2I', info_offsets[file_index], name_length))
             name_length += len(filenames[file_index]) + 1
 
         # Label region
-        output.write(b'Data\0Count\0Info\0')
-        for file_index in xrange(file_count):
-            output.write(filenames[file_index] + b'\0')
+        tables.append(b'Data\0Count\0Info\0')
+        tables.extend([filename + b'\0' for filename in filenames])
+        tables = b''.join(tables)
+
+        # Header
+        size = 0x80 + data_length + len(tables)
+        header = pack('<4I', size, p1_offset, file_count, file_count + 3) + \
+            b'\0' * 0x70 # Padding
+        return header, tables
+
+    @profiling.profiled('arc.pack', lambda self: len(self.__data))
+    def to_arc(self):
+        """Export the Arc object to .arc file format."""
+        header, tables = self._pack_tables()
+        data = self.__data
+        if sys.version_info[0] == 2 and isinstance(data, bytearray):
+            data = bytes(data) # str.join() does not take bytearray
+        return b''.join([header, data, tables])
+
+    @profiling.profiled('arc.pack', lambda self, file: len(self.__data))
+    def write(self, file):
+        """Write the Arc object to a file object, in .arc file format.
 
-        # File size
-        size = output.tell()
-        output.seek(0, os.SEEK_SET)
-        output.write(pack('<I', size))
+        Unlike to_arc(), the data region is written directly from memory, so
+        the content of the archive is not copied.
+
+        Return the number of written bytes.
+        """
+        header, tables = self._pack_tables()
+        file.write(header)
+        file.write(self.__data)
+        file.write(tables)
+        return len(header) + len(self.__data) + len(tables)
+
+    @profiling.profiled('arc.save_in_place')
+    def save_in_place(self, path):
+        """Write the changes made since the archive was loaded (or last
+        saved) to the file it was loaded from.
+
+        Files which were replaced by data which fits in their slots are
+        written at their offsets, and so are the file info table, pointers
+        and labels, which follow the data region. If a file was added,
+        removed or grew out of its slot, everything after the first such file
+        is written again and the file is truncated. The rest of the archive
+        is not touched, so replacing a file by data which fits in its slot
+        costs a write of that file, whatever the size of the archive.
+
+        Unlike write(), this is not atomic: if it is interrupted, the archive
+        is broken.
+
+        Parameters:
+        `path`: Path to the .arc file
+
+        Raise ValueError if the file does not have the size it had when the
+        Arc object was loaded or last saved. Return the number of written
+        bytes.
+        """
+        if self.__saved_size is None or not os.path.isfile(path) or \
+                os.path.getsize(path) != self.__saved_size:
+            raise ValueError(path + ' is not the file this archive was '
+                             'loaded from, or it was changed')
+        if self.__shift_from is None and not self.__patched:
+            return 0
+        data_length = len(self.__data)
+        data_begin = 0x20 + self.__data_begin # In the file
+        start = data_length if self.__shift_from is None \
+            else self.__shift_from
+        if self.__shift_from is not None and data_begin != HEADER_LENGTH:
+            # The tables are written in the layout of write(), which puts
+            # the data region at HEADER_LENGTH
+            start = 0
+        written = 0
+        with open(path, 'r+b') as file:
+            for file_index in sorted(self.__patched):
+                offset, slot = self.__slot(file_index)
+                if offset + slot > start:
+                    continue
+                file.seek(data_begin + offset)
+                file.write(self.__data[offset:offset + slot])
+                written += slot
+                if self.__shift_from is None:
+                    # Length in the file info entry
+                    file.seek(0x20 + self.__info_offset + file_index * 16 + 8)
+                    file.write(pack('<I',
+                                    self.__info_table[file_index].length))
+                    written += 4
+            if self.__shift_from is not None:
+                # Moved files, then the tables
+                header, tables = self._pack_tables()
+                size = len(header) + data_length + len(tables)
+                file.seek(HEADER_LENGTH + start)
+                file.write(self.__data[start:])
+                file.write(tables)
+                written += data_length - start + len(tables)
+                file.truncate(size)
+                file.seek(0)
+                if start == 0:
+                    file.write(header)
+                    written += len(header)
+                else:
+                    file.write(header[:0x10])
+                    written += 0x10
+                self.__saved_size = size
+                self.__data_begin = HEADER_LENGTH - 0x20
+                self.__info_offset = self.__data_begin + data_length + 4
+            file.flush()
+            os.fsync(file.fileno())
+        self.__mark_saved()
+        return written
+
+
+@profiling.profiled('arc.read_info')
+def read_file_info(file):
+    """Read the file info table of an archive without reading its data
+    region.
+
+    Only the header, the file info table and the region after it (pointers
+    and labels) are read.
+
+    Parameters:
+    `file`: An archive file object, opened in binary mode
 
-        return output.getvalue()
+    Return a list of Arc.FileInfo. Offsets are from the beginning of the
+    file, so that a file can be read with a seek and a read.
+    """
+    file.seek(0)
+    size, p1_offset, p1_count, p2_count = unpack('<4I', file.read(0x10))
+    file.seek(0x20 + p1_offset)
+    tail = file.read()
+    p2_offset = p1_count * 4
+    label_offset = p2_offset + p2_count * 8
+
+    def label(offset): # Offset in the tail
+        return tail[offset:tail.index(b'\0', offset)]
+
+    pointers = {}
+    for offset in xrange(p2_offset, label_offset, 8):
+        ptr, name = unpack('<II', tail[offset:offset + 8])
+        pointers[label(label_offset + name)] = ptr
+    data_begin = pointers[b'Data']
+    file.seek(0x20 + pointers[b'Count'])
+    file_count = unpack('<I', file.read(4))[0]
+    file.seek(0x20 + pointers[b'Info'])
+    table = file.read(file_count * 16)
+    result = []
+    for file_index in xrange(file_count):
+        name_offset, index, length, file_offset = \
+            unpack('<4I', table[file_index * 16:file_index * 16 + 16])
+        result.append(Arc.FileInfo._make((
+            sjis.decode(label(name_offset - p1_offset)), index, length,
+            0x20 + data_begin + file_offset)))
+    return result
 
 
 def load_file(path):
@@ -234,9 +561,11 @@ def load_file(path):
     Parameters:
     ``path``: Path to an archive file.
     """
-    with open(path, 'rb') as arc_file:
-        header = arc_file.read(0x20)
-        raw = arc_file.read()
+    with profiling.phase('io.read') as p:
+        with open(path, 'rb') as arc_file:
+            header = arc_file.read(0x20)
+            raw = arc_file.read()
+        p.nbytes = len(header) + len(raw)
     return Arc(header, raw)
 
 def load(raw):
@@ -247,6 +576,24 @@ def load(raw):
     """
     return Arc(raw[:0x20], raw[0x20:])
 
+def load_folder(path, dedupe=False):
+    """Create an Arc object from all files in a folder.
+
+    Parameters:
+    ``path``: Path to a folder.
+    ``dedupe``: Store identical files only once (see Arc.append_file()).
+    """
+    arc = Arc()
+    with profiling.phase('arc.collect') as p:
+        p.nbytes = 0
+        for dirpaths, dirnames, filenames in os.walk(path):
+            for filename in filenames:
+                with open(os.path.join(dirpaths, filename), 'rb') as infile:
+                    data = infile.read()
+                arc.append_file(filename, data, dedupe)
+                p.nbytes += len(data)
+    return arc
+
 def win32_unicode_argv():
     """Uses shell32.GetCommandLineArgvW to get sys.argv as a list of Unicode
     strings.
@@ -282,6 +629,19 @@ def win32_unicode_argv():
 
 
 if __name__ == '__main__':
+    import platform
+
+    # --profile [TRACE] can be placed anywhere
+    if '--profile' in sys.argv:
+        index = sys.argv.index('--profile')
+        del sys.argv[index]
+        trace = ''
+        if index < len(sys.argv) and sys.argv[index].endswith('.json'):
+            trace = sys.argv.pop(index)
+        profiling.setup(trace)
+    else:
+        profiling.setup()
+
     if len(sys.argv) == 1:
         print('Usage: python arc.py PATH')
         print('If PATH is an .arc file, this tool will extract it to a' + \
@@ -290,30 +650,52 @@ if __name__ == '__main__':
             'folder to an .arc file.')
 
     if platform.system() == 'Windows' and sys.version_info[0] == 2:
-        path = win32_unicode_argv()[1]
+        argv = win32_unicode_argv()
     else:
-        path = sys.argv[1]
+        argv = sys.argv
+    dedupe = '--dedupe' in argv
+    argv = [arg for arg in argv if arg != '--dedupe']
+    path = argv[1]
 
-    if os.path.isfile(path):
+    if len(argv) > 2 and os.path.isfile(path):
+        arc = load_file(path)
+        names = set(arc.get_filename(i) for i in xrange(arc.get_file_count()))
+        for member_path in argv[2:]:
+            name = os.path.basename(member_path)
+            with open(member_path, 'rb') as member_file:
+                data = member_file.read()
+            if name in names:
+                arc.replace_file(name, data)
+            else:
+                arc.append_file(name, data, dedupe)
+                names.add(name)
+        with profiling.phase('io.write') as p:
+            p.nbytes = arc.save_in_place(path)
+        print(path + ' was updated.')
+    elif os.path.isfile(path):
         arc = load_file(path)
         dir_name = os.path.join(os.path.dirname(path),
                                 os.path.splitext(os.path.basename(path))[0])
         if not os.path.isdir(os.path.splitext(path)[0]):
             os.mkdir(dir_name)
-        for file_index in xrange(arc.get_file_count()):
-            out_file_name = os.path.join(dir_name, arc.get_filename(file_index))
-            with open(out_file_name, 'wb') as outfile:
-                outfile.write(arc.get_file(file_index))
+        with profiling.phase('io.write') as p:
+            p.nbytes = 0
+            for file_index in xrange(arc.get_file_count()):
+                out_file_name = os.path.join(dir_name,
+                                             arc.get_filename(file_index))
+                data = arc.get_file(file_index)
+                # One fsync per file would make extraction very slow
+                atomic.write_file(out_file_name, data, sync=False)
+                p.nbytes += len(data)
         print(path + ' was successfully extracted.')
     elif os.path.isdir(path):
-        arc = Arc()
-        for dirpaths, dirnames, filenames in os.walk(path):
-            for filename in filenames:
-                with open(os.path.join(dirpaths, filename), 'rb') as infile:
-                    data = infile.read()
-                arc.append_file(filename, data)
-        with open(path + u'.arc', 'wb') as outfile:
-            outfile.write(arc.to_arc())
+        arc = load_folder(path, dedupe)
+        with profiling.phase('io.write') as p:
+            with atomic.atomic_open(path + u'.arc', 'wb') as outfile:
+                p.nbytes = arc.write(outfile)
         print(repr(path) + '.arc was created.')
+        if dedupe:
+            print('%d bytes were saved by storing identical files once.' %
+                  arc.get_shared_size())
     else:
         print('Invalid path.')
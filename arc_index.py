@@ -0,0 +1,310 @@
+#!/usr/bin/env python2
+#
+# The MIT License
+#
+# Copyright (c) 2017 RainThunder.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+"""Index the files of every .arc archive in a folder tree (e.g. a RomFS
+dump), to find and extract a file without extracting whole archives.
+
+Only the header, the file info table and the labels of an archive are read
+(see arc.read_file_info), in parallel. The index is a SQLite database
+(default: <folder>.arcindex, next to the folder) which stores, for every
+file, its name, archive, index, offset and length. Refreshing it only reads
+the archives which were added or changed (by modification time and size)
+since the last refresh, and drops the ones which were removed.
+
+Usage:
+    python arc_index.py ROOT refresh
+    python arc_index.py ROOT find NAME [--refresh]
+    python arc_index.py ROOT extract NAME [-o DIR] [--archive ARC]
+
+NAME can be a glob pattern (e.g. '*_face.bch.lz') for find.
+
+Example:
+    >>> import arc_index
+    >>> index = arc_index.ArcIndex('romfs')
+    >>> index.refresh()
+    >>> for member in index.find('*.bch.lz', pattern=True):
+    ...     print(member.archive, member.name)
+    >>> data = index.read(member)
+"""
+
+from __future__ import print_function, unicode_literals
+import os
+import sqlite3
+import struct
+import sys
+from collections import namedtuple
+if sys.version_info[0] > 2:
+    xrange = range
+    unicode = str
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+import arc
+import atomic
+import profiling
+
+
+INDEX_VERSION = 1
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS archives ('
+    'id INTEGER PRIMARY KEY, path TEXT UNIQUE, mtime REAL, size INTEGER)',
+    'CREATE TABLE IF NOT EXISTS members ('
+    'name TEXT, archive INTEGER, idx INTEGER, offset INTEGER, '
+    'length INTEGER)',
+    'CREATE INDEX IF NOT EXISTS members_name ON members (name)',
+    'CREATE INDEX IF NOT EXISTS members_archive ON members (archive)',
+]
+
+# `archive` is the path of the archive, relative to the root, with '/'
+# separators. `offset` is the offset of the file in the archive file.
+Member = namedtuple('Member', ['archive', 'index', 'name', 'offset',
+                               'length'])
+
+
+def get_index_path(root):
+    """Get the default index path of a folder."""
+    return os.path.normpath(os.path.abspath(root)) + '.arcindex'
+
+
+def find_archives(root):
+    """List the .arc files in a folder tree.
+
+    Return a dict of relative path ('/' separators) -> (mtime, size).
+    """
+    result = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            if not filename.lower().endswith('.arc'):
+                continue
+            path = os.path.join(dirpath, filename)
+            st = os.stat(path)
+            relpath = os.path.relpath(path, root).replace(os.sep, '/')
+            result[relpath] = (st.st_mtime, st.st_size)
+    return result
+
+
+def _read_members(path):
+    with open(path, 'rb') as file:
+        return arc.read_file_info(file)
+
+
+class ArcIndex(object):
+    """An index of the files of every .arc archive in a folder tree.
+
+    `root`: Folder
+    `path`: Index file. Default: <root>.arcindex
+    """
+
+    def __init__(self, root, path=None):
+        if isinstance(root, bytes):
+            root = root.decode(sys.getfilesystemencoding())
+        self.root = root
+        self.path = path or get_index_path(root)
+        self.connection = self.__connect()
+
+    def __connect(self):
+        connection = sqlite3.connect(self.path)
+        version = connection.execute('PRAGMA user_version').fetchone()[0]
+        if version != INDEX_VERSION:
+            connection.close()
+            if os.path.exists(self.path):
+                os.remove(self.path) # Rebuilt from the archives
+            connection = sqlite3.connect(self.path)
+            connection.execute('PRAGMA user_version = %d' % INDEX_VERSION)
+        for statement in SCHEMA:
+            connection.execute(statement)
+        connection.commit()
+        return connection
+
+    def close(self):
+        self.connection.close()
+
+    def __archive_path(self, archive):
+        return os.path.join(self.root, *archive.split('/'))
+
+    @profiling.profiled('arc_index.refresh')
+    def refresh(self, jobs=None):
+        """Read the archives which were added or changed since the last
+        refresh, and forget the ones which were removed.
+
+        `jobs`: Number of threads. Default: min(32, CPU count + 4)
+
+        Return the list of archives which were read.
+        """
+        connection = self.connection
+        on_disk = find_archives(self.root)
+        indexed = dict([(path, (archive_id, mtime, size)) for
+                        archive_id, path, mtime, size in connection.execute(
+                            'SELECT id, path, mtime, size FROM archives')])
+        removed = [indexed[path][0] for path in indexed if path not in on_disk]
+        changed = sorted([path for path, stat in on_disk.items()
+                          if indexed.get(path, (None,))[1:] != stat])
+
+        def read(path):
+            try:
+                return path, _read_members(self.__archive_path(path))
+            except (IOError, OSError, KeyError, ValueError,
+                    struct.error) as ex: # Not an archive
+                return path, ex
+
+        if jobs is None:
+            jobs = min(32, (getattr(os, 'cpu_count', lambda: None)() or 1) + 4)
+        if ThreadPoolExecutor is None or jobs <= 1 or len(changed) <= 1:
+            results = [read(path) for path in changed]
+        else:
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                results = list(executor.map(read, changed))
+
+        with connection:
+            for path in changed:
+                if path in indexed:
+                    removed.append(indexed[path][0])
+            connection.executemany('DELETE FROM members WHERE archive = ?',
+                                   [(i,) for i in removed])
+            connection.executemany('DELETE FROM archives WHERE id = ?',
+                                   [(i,) for i in removed])
+            for path, members in results:
+                # Unreadable archives are indexed without files, so that
+                # they are only read again when they change
+                if isinstance(members, Exception):
+                    print('%s: cannot read the file info table (%s)' %
+                          (path, members), file=sys.stderr)
+                    members = []
+                mtime, size = on_disk[path]
+                cursor = connection.execute(
+                    'INSERT INTO archives (path, mtime, size) VALUES '
+                    '(?, ?, ?)', (path, mtime, size))
+                archive_id = cursor.lastrowid
+                connection.executemany(
+                    'INSERT INTO members VALUES (?, ?, ?, ?, ?)',
+                    [(m.name, archive_id, m.index, m.offset, m.length)
+                     for m in members])
+        return changed
+
+    def find(self, name, pattern=False, archive=None):
+        """Find files by name.
+
+        `name`: File name, or a glob pattern if `pattern` is True
+        `archive`: Only search this archive (relative path)
+
+        Return a list of Member, sorted by archive and index.
+        """
+        sql = ('SELECT archives.path, idx, name, offset, length FROM members '
+               'JOIN archives ON archives.id = members.archive WHERE name ' +
+               ('GLOB ?' if pattern else '= ?'))
+        args = [name]
+        if archive is not None:
+            sql += ' AND archives.path = ?'
+            args.append(archive.replace(os.sep, '/'))
+        sql += ' ORDER BY archives.path, idx'
+        return [Member._make(row) for row in
+                self.connection.execute(sql, args)]
+
+    def archives(self):
+        """Get the number of indexed archives and files."""
+        return (self.connection.execute(
+                    'SELECT COUNT(*) FROM archives').fetchone()[0],
+                self.connection.execute(
+                    'SELECT COUNT(*) FROM members').fetchone()[0])
+
+    def read(self, member):
+        """Read a file from its archive with a seek and a read.
+
+        Raise ValueError if the archive changed since it was indexed.
+        """
+        path = self.__archive_path(member.archive)
+        row = self.connection.execute(
+            'SELECT mtime, size FROM archives WHERE path = ?',
+            (member.archive,)).fetchone()
+        st = os.stat(path)
+        if row is None or tuple(row) != (st.st_mtime, st.st_size):
+            raise ValueError(member.archive + ' changed since it was '
+                             'indexed; refresh the index')
+        with profiling.phase('io.read') as p:
+            with open(path, 'rb') as file:
+                file.seek(member.offset)
+                data = file.read(member.length)
+            p.nbytes = len(data)
+        return data
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('root', help='folder which contains the archives')
+    parser.add_argument('--index', default=None,
+                        help='index file (default: ROOT.arcindex)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of threads which read the archives')
+    profiling.add_argument(parser)
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('refresh', help='index the added and changed '
+                          'archives')
+    find_parser = subparsers.add_parser('find', help='list the files with '
+                                        'a name or glob pattern')
+    find_parser.add_argument('name')
+    find_parser.add_argument('--refresh', action='store_true',
+                             help='refresh the index first')
+    extract_parser = subparsers.add_parser('extract', help='extract a file')
+    extract_parser.add_argument('name')
+    extract_parser.add_argument('-o', '--output', default='.',
+                                help='output folder')
+    extract_parser.add_argument('--archive', default=None,
+                                help='archive (relative path) if several '
+                                'archives contain the file')
+    extract_parser.add_argument('--refresh', action='store_true',
+                                help='refresh the index first')
+    args = parser.parse_args()
+    profiling.setup(args.profile)
+
+    index = ArcIndex(args.root, args.index)
+    if args.command == 'refresh' or getattr(args, 'refresh', False) or \
+            index.archives()[0] == 0:
+        changed = index.refresh(args.jobs)
+        if args.command == 'refresh':
+            print('%d archives were read; %d archives, %d files are '
+                  'indexed.' % ((len(changed),) + index.archives()))
+    if args.command == 'find':
+        for member in index.find(args.name, pattern=True):
+            print('%s\t%d\t%s\t0x%X\t%d' % member)
+    elif args.command == 'extract':
+        members = index.find(args.name, archive=args.archive)
+        if not members:
+            sys.exit(args.name + ' was not found.')
+        if len(set(m.archive for m in members)) > 1:
+            sys.exit('%s is in several archives; use --archive:\n%s' % (
+                args.name, '\n'.join(sorted(set(m.archive
+                                                for m in members)))))
+        member = members[0]
+        out_path = os.path.join(args.output, member.name)
+        atomic.write_file(out_path, index.read(member), sync=False)
+        print(out_path + ' was extracted from ' + member.archive + '.')
+    elif args.command is None:
+        parser.print_help()
+    index.close()
@@ -0,0 +1,375 @@
+#!/usr/bin/env python2
+#
+# The MIT License
+#
+# Copyright (c) 2017 RainThunder.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+"""Crash-safe file writes.
+
+A file is never rewritten in place. The new content is written to a temporary
+file in the same folder, flushed to disk with fsync, and then renamed over
+the old file, so a reader (or the next run after a crash) sees either the
+whole old file or the whole new file.
+
+Writes which must succeed or fail together (e.g. GameData.bin and the
+Nightmare modules which describe it) go through a Transaction. All files are
+staged first; then a journal is written, the old files are backed up with
+hard links and the new files are moved into place. If anything fails, or the
+process is killed before the journal is removed, the old files are restored
+(immediately, or by `recover()` on the next run).
+
+Example:
+    >>> import atomic
+    >>> atomic.write_file('GameData.bin', data)
+    >>> with atomic.Transaction() as t:
+    ...     t.write('GameData.bin', data)
+    ...     t.write('Item/Item.nmm', module, encoding='latin-1')
+"""
+
+import errno
+import io
+import os
+import sys
+from contextlib import contextmanager
+# json, shutil and tempfile are imported by the functions which use them:
+# every tool imports this module, and most runs never need them.
+if sys.version_info[0] > 2:
+    unicode = str
+
+JOURNAL_NAME = '.fefates-journal.json'
+
+# Permissions of new files, as open() would create them
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+if hasattr(os, 'replace'):
+    replace = os.replace
+elif sys.platform == 'win32': # Python 2 on Windows
+    import ctypes
+
+    def replace(src, dst):
+        """Rename `src` to `dst`, overwriting `dst` if it exists."""
+        # MOVEFILE_REPLACE_EXISTING | MOVEFILE_WRITE_THROUGH
+        if not ctypes.windll.kernel32.MoveFileExW(unicode(src), unicode(dst),
+                                                  0x1 | 0x8):
+            raise ctypes.WinError()
+else:
+    replace = os.rename
+
+
+def fsync_directory(path):
+    """Flush a folder entry (e.g. a rename) to disk. Does nothing on systems
+    which cannot open a folder, like Windows.
+    """
+    try:
+        fd = os.open(path or os.curdir, os.O_RDONLY)
+    except (OSError, IOError):
+        return
+    try:
+        os.fsync(fd)
+    except (OSError, IOError):
+        pass
+    finally:
+        os.close(fd)
+
+
+def _remove(path):
+    """Remove a file if it exists."""
+    try:
+        os.remove(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def _temp_file(path):
+    """Create an empty temporary file next to `path`.
+
+    Return a tuple (file descriptor, temporary path). The file gets the
+    permissions of `path`, or the default permissions if `path` does not
+    exist.
+    """
+    import tempfile
+    folder, name = os.path.split(path)
+    fd, temp = tempfile.mkstemp(prefix='.' + name + '.', suffix='.tmp',
+                                dir=folder or os.curdir)
+    try:
+        mode = os.stat(path).st_mode & 0o7777
+    except OSError:
+        mode = 0o666 & ~_UMASK
+    try:
+        os.chmod(temp, mode)
+    except OSError:
+        pass
+    return fd, temp
+
+
+@contextmanager
+def atomic_path(path, sync=True):
+    """Context manager which yields a temporary path to write instead of
+    `path`, for libraries which open the output file themselves. The
+    temporary file replaces `path` when the block exits without an error,
+    and is removed otherwise.
+
+    `sync`: Flush the file to disk before it replaces `path`. Without it, the
+        file is still never seen half-written, but may be empty after a
+        power loss.
+    """
+    fd, temp = _temp_file(path)
+    os.close(fd)
+    try:
+        yield temp
+        if sync:
+            fd = os.open(temp, os.O_RDWR)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        replace(temp, path)
+    except BaseException:
+        _remove(temp)
+        raise
+    if sync:
+        fsync_directory(os.path.dirname(path))
+
+
+@contextmanager
+def atomic_open(path, mode='wb', encoding=None, newline=None, sync=True):
+    """Open a file for writing, like io.open, and replace `path` with it when
+    the block exits without an error.
+
+    `mode`: 'wb', or 'w' for text
+    `encoding`, `newline`: See io.open; text mode only
+    `sync`: See atomic_path
+    """
+    if 'r' in mode or 'a' in mode or '+' in mode:
+        raise ValueError('atomic_open only supports writing new content')
+    fd, temp = _temp_file(path)
+    try:
+        if 'b' in mode:
+            file = io.open(fd, mode)
+        else:
+            file = io.open(fd, mode, encoding=encoding, newline=newline)
+    except BaseException:
+        os.close(fd)
+        _remove(temp)
+        raise
+    try:
+        with file:
+            yield file
+            file.flush()
+            if sync:
+                os.fsync(file.fileno())
+        replace(temp, path)
+    except BaseException:
+        _remove(temp)
+        raise
+    if sync:
+        fsync_directory(os.path.dirname(path))
+
+
+def write_file(path, data, encoding=None, sync=True):
+    """Replace the content of a file.
+
+    `data`: Bytes, or a unicode string which is encoded with `encoding`
+    """
+    if isinstance(data, unicode):
+        data = data.encode(encoding or 'utf-8')
+    with atomic_open(path, 'wb', sync=sync) as file:
+        file.write(data)
+
+
+class Transaction(object):
+    """A group of file writes which are applied together, or not at all.
+
+    Use it as a context manager: the transaction is committed if the block
+    exits without an error, and rolled back otherwise.
+    """
+
+    def __init__(self, root='', journal=None):
+        """`root`: Folder for the journal file
+        `journal`: Path of the journal file. Default: JOURNAL_NAME in `root`
+
+        An unfinished transaction left by a crash is rolled back first.
+        """
+        if journal is None:
+            journal = os.path.join(root, JOURNAL_NAME)
+        self.journal = os.path.abspath(journal)
+        self.recovered = recover(journal=self.journal)
+        self._staged = {}   # Absolute path -> temporary path
+        self._order = []    # Absolute paths, in the order they were staged
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+    def write(self, path, data, encoding=None):
+        """Stage the new content of a file. The content is written to a
+        temporary file immediately, so it is not kept in memory.
+
+        `data`: Bytes, or a unicode string which is encoded with `encoding`
+        """
+        if isinstance(data, unicode):
+            data = data.encode(encoding or 'utf-8')
+        path = os.path.abspath(path)
+        fd, temp = _temp_file(path)
+        try:
+            with io.open(fd, 'wb') as file:
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+        except BaseException:
+            _remove(temp)
+            raise
+        if path in self._staged:
+            _remove(self._staged[path])
+        else:
+            self._order.append(path)
+        self._staged[path] = temp
+
+    def read(self, path, encoding=None):
+        """Read a file, including the changes staged in this transaction.
+
+        Return bytes, or a unicode string if `encoding` is given.
+        """
+        path = os.path.abspath(path)
+        with open(self._staged.get(path, path), 'rb') as file:
+            data = file.read()
+        if encoding is not None:
+            data = data.decode(encoding)
+        return data
+
+    def __contains__(self, path):
+        return os.path.abspath(path) in self._staged
+
+    def commit(self):
+        """Move all staged files into place."""
+        entries = []
+        for path in self._order:
+            backup = None
+            if os.path.exists(path):
+                backup = self._staged[path][:-len('.tmp')] + '.bak'
+            entries.append({'path': path, 'temp': self._staged[path],
+                            'backup': backup})
+        if not entries:
+            return
+        import json
+        write_file(self.journal, json.dumps(entries, indent=1), 'utf-8')
+
+        try:
+            for entry in entries:
+                if entry['backup'] is not None:
+                    _backup(entry['path'], entry['backup'])
+                replace(entry['temp'], entry['path'])
+            for folder in set([os.path.dirname(e['path']) for e in entries]):
+                fsync_directory(folder)
+        except BaseException:
+            recover(journal=self.journal)
+            self._staged = {}
+            self._order = []
+            raise
+
+        # The transaction is committed once the journal is removed
+        _remove(self.journal)
+        fsync_directory(os.path.dirname(self.journal))
+        for entry in entries:
+            if entry['backup'] is not None:
+                _remove(entry['backup'])
+        self._staged = {}
+        self._order = []
+
+    def rollback(self):
+        """Discard all staged files."""
+        for path in self._order:
+            _remove(self._staged[path])
+        self._staged = {}
+        self._order = []
+
+
+def _backup(path, backup):
+    """Keep the current content of `path` at `backup`."""
+    try:
+        os.link(path, backup)
+    except (AttributeError, OSError):
+        # No hard links on this system or file system
+        import shutil
+        shutil.copy2(path, backup)
+        with open(backup, 'rb+') as file:
+            os.fsync(file.fileno())
+
+
+def _same_file(path1, path2):
+    """Check if two paths are hard links to the same file."""
+    if hasattr(os.path, 'samefile'):
+        try:
+            return os.path.samefile(path1, path2)
+        except OSError:
+            return False
+    return False # Python 2 on Windows: backups are copies
+
+
+def recover(root='', journal=None):
+    """Roll back a transaction which was interrupted while it was being
+    committed.
+
+    `root`, `journal`: See Transaction
+
+    Return True if a transaction was rolled back.
+    """
+    if journal is None:
+        journal = os.path.join(root, JOURNAL_NAME)
+    import json
+    try:
+        with io.open(journal, 'r', encoding='utf-8') as file:
+            entries = json.load(file)
+    except (IOError, OSError) as e:
+        if e.errno == errno.ENOENT:
+            return False
+        raise
+
+    for entry in entries:
+        if entry['backup'] is not None and os.path.exists(entry['backup']):
+            if os.path.exists(entry['path']) and \
+                    _same_file(entry['backup'], entry['path']):
+                # Not replaced yet. Renaming a hard link to the same file
+                # does nothing, so the backup must be removed instead.
+                _remove(entry['backup'])
+            else:
+                replace(entry['backup'], entry['path'])
+        elif entry['backup'] is None and not os.path.exists(entry['temp']):
+            # A new file which was already moved into place
+            _remove(entry['path'])
+        _remove(entry['temp'])
+    for folder in set([os.path.dirname(e['path']) for e in entries]):
+        fsync_directory(folder)
+    _remove(journal)
+    return True
+
+
+if __name__ == '__main__':
+    print('This script is a library and does not mean to be used directly.')
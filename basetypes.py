@@ -37,8 +37,9 @@ doesn't have type and range checking).
 respectively. Similar to Row, it doesn't allow putting a wrong-type object.
 """
 
+import json
 import sys
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
 from struct import unpack, pack, error as struct_error
 if sys.version_info[0] > 2:
     xrange = range
@@ -528,6 +529,30 @@ class Row(object):
                 output.append(self.__dict__[attr].tostring())
         return u'\t'.join(output)
 
+    @classmethod
+    def flatten_columns(cls):
+        """Get the names and types of all flattened cells in the row.
+
+        Return a list of (name, type) tuples, in the same order as the
+        output of flatten(). Flag cells have bool type.
+        """
+        columns = []
+        for attr in cls.structure:
+            t = cls.structure[attr].type
+            if issubclass(t, Row):
+                columns.extend([(attr + u'.' + name, subtype)
+                                for name, subtype in t.flatten_columns()])
+            elif issubclass(t, Array):
+                columns.extend([(attr + u'.' + unicode(i), t.type)
+                                for i in xrange(t.length)])
+            elif issubclass(t, RestrictedDict):
+                columns.extend([(attr + u'.' + key, t.type) for key in t.keys])
+            elif issubclass(t, Flags):
+                columns.extend([(attr + u'.' + name, bool) for name in t.names])
+            else:
+                columns.append((attr, t))
+        return columns
+
     @classmethod
     def flatten_structure(cls, recursive=False):
         """Get the list of types used in the row."""
@@ -584,6 +609,114 @@ class Structure(object):
         return type.__name__ + ' ' + str(format)
 
 
+##############################################################################
+# JSON Lines support
+##############################################################################
+class _JSONSchema(object):
+    """Precomputed JSON Lines writer and reader of a Row class.
+
+    The writer is a format string which takes the output of Row.flatten(), so
+    a row can be serialized with a single formatting operation instead of
+    calling tojsonobject() on every cell. The reader is a list of converters
+    which turn a decoded JSON object back into Row constructor data.
+    """
+    __cache = {}
+
+    def __init__(self, rowclass):
+        self.labels = [] # Indices of label cells in the flattened row
+        self.bools = []  # Indices of flag cells in the flattened row
+        self.__index = 0
+        self.template = self.__compile_row(rowclass)
+        self.reader = self.__compile_reader(rowclass)
+        self.rowclass = rowclass
+
+    @classmethod
+    def get(cls, rowclass):
+        """Get the cached schema of a Row class."""
+        if rowclass not in cls.__cache:
+            cls.__cache[rowclass] = cls(rowclass)
+        return cls.__cache[rowclass]
+
+    @staticmethod
+    def __key(name):
+        return json.dumps(name).replace(u'%', u'%%') + u': '
+
+    def __compile_row(self, rowclass):
+        st = rowclass.structure
+        return u'{' + u', '.join([self.__key(attr) +
+            self.__compile_type(st[attr].type) for attr in st]) + u'}'
+
+    def __compile_type(self, t):
+        if issubclass(t, Row):
+            return self.__compile_row(t)
+        elif issubclass(t, Array):
+            return u'[' + u', '.join([self.__compile_cell(t.type)
+                                      for i in xrange(t.length)]) + u']'
+        elif issubclass(t, RestrictedDict):
+            return u'{' + u', '.join([self.__key(k) + self.__compile_cell(t.type)
+                                      for k in t.keys]) + u'}'
+        elif issubclass(t, Flags):
+            return u'{' + u', '.join([self.__key(n) + self.__compile_cell(bool)
+                                      for n in t.names]) + u'}'
+        return self.__compile_cell(t)
+
+    def __compile_cell(self, t):
+        index = self.__index
+        self.__index += 1
+        if t is bool:
+            self.bools.append(index)
+            return u'%s'
+        elif issubclass(t, Label):
+            self.labels.append(index)
+            return u'%s'
+        return u'%d'
+
+    def __compile_reader(self, rowclass):
+        st = rowclass.structure
+        converters = [(attr, self.__compile_converter(st[attr].type))
+                      for attr in st]
+        def read(obj):
+            return [convert(obj[attr]) for attr, convert in converters]
+        return read
+
+    def __compile_converter(self, t):
+        if issubclass(t, Row):
+            return self.__compile_reader(t)
+        elif issubclass(t, RestrictedDict):
+            keys = t.keys
+            return lambda obj: [obj[k] for k in keys]
+        elif issubclass(t, Flags):
+            names = t.names
+            def read_flags(obj):
+                output = bytearray(len(names) // 8)
+                for i in xrange(len(names)):
+                    if obj[names[i]]:
+                        output[i // 8] |= 1 << (i % 8)
+                return bytes(output)
+            return read_flags
+        return lambda obj: obj
+
+    def dumps(self, row):
+        """Serialize a row to a line of JSON text."""
+        cells = row.flatten()
+        for i in self.labels:
+            cells[i] = _encode_string(cells[i])
+        for i in self.bools:
+            cells[i] = u'true' if cells[i] else u'false'
+        return self.template % tuple(cells)
+
+    def loads(self, line):
+        """Deserialize a line of JSON text to a row."""
+        return self.rowclass(self.reader(json.loads(line)))
+
+
+_encode_string = json.encoder.encode_basestring_ascii
+
+class Column(namedtuple('Column', ['name', 'type', 'values'])):
+    """A table column: name, cell type and list of values."""
+    __slots__ = ()
+
+
 class Table(list):
     """A generic data structure, contains multiple Row objects.
 
@@ -628,6 +761,14 @@ class Table(list):
         """Flatten the table."""
         return [r.flatten() for r in self]
 
+    def tocolumns(self):
+        """Convert the table to a list of Column objects."""
+        columns = self.__class__.type.flatten_columns()
+        rows = self.flatten()
+        return [Column(columns[j][0], columns[j][1],
+                       [row[j] for row in rows])
+                for j in xrange(len(columns))]
+
     def fromstring(self, text):
         """Construct a table from tab-delimited text."""
         rows = text.split(u'\n')
@@ -647,6 +788,32 @@ class Table(list):
         """Output JSON object."""
         return [r.tojsonobject() for r in self]
 
+    def iterjsonlines(self):
+        """Serialize the table row by row. Yield a line of JSON text (without
+        line break) for each row."""
+        schema = _JSONSchema.get(self.__class__.type)
+        for row in self:
+            yield schema.dumps(row)
+
+    def tojsonlines(self, file):
+        """Write the table to a text file in JSON Lines format.
+
+        `file`: A file-like object which accepts unicode strings.
+        """
+        for line in self.iterjsonlines():
+            file.write(line + u'\n')
+
+    def fromjsonlines(self, lines):
+        """Load rows from JSON Lines text.
+
+        `lines`: An iterable of lines, e.g. a file object. Blank lines are
+        skipped.
+        """
+        schema = _JSONSchema.get(self.__class__.type)
+        for line in lines:
+            if line.strip():
+                self.append(schema.loads(line))
+
     def tostring(self):
         """Output tab-delimited string."""
         return u'\n'.join([r.tostring() for r in self])
@@ -0,0 +1,629 @@
+#!/usr/bin/env python2
+#
+# The MIT License
+#
+# Copyright (c) 2017 RainThunder.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+"""Run a manifest of operations in one process.
+
+A manifest is a JSON (or, if PyYAML is installed, YAML) list of steps, or an
+object with a "steps" list. Every step is an object with an "op" and its
+arguments; paths are relative to the folder of the manifest.
+
+    arc-extract      path, [output]             Extract an .arc file
+    arc-pack         folder, [output], [dedupe] Pack a folder to an .arc file
+    gamedata-append  table, ids, names, [supports], [gamedata], [modules]
+                     Add rows to GameData.bin (Chapter, Character, Class or
+                     Item) and update its Nightmare modules
+    castle-join      input, [output]            Convert castle_join.bin to
+                                                text, or text to .bin
+    fst              folder, [cache]            Generate fst.bin of a folder
+    trim             paths                      Trim the Nightmare 2 padding
+
+A step can also have an "id", and "after": a list of ids of steps which must
+be finished before it runs. Other dependencies are found from the files the
+steps read and write: a step waits for the earlier steps which write a file
+(or folder) it reads or writes, and for the earlier steps which read a file
+it writes. Steps which do not depend on each other run in parallel.
+
+Files are parsed at most once: GameData.bin, the Nightmare modules,
+castle_join files and archives are kept in memory after a step has loaded
+or written them, and later steps use them unless the file was changed by
+something else in the meantime.
+
+Example manifest:
+    [
+        {"op": "gamedata-append", "table": "Item", "ids": [1024],
+         "names": ["IID_NEW"]},
+        {"op": "castle-join", "input": "castle_join.txt"},
+        {"op": "arc-pack", "folder": "dlc/a", "dedupe": true},
+        {"op": "fst", "folder": "dlc"}
+    ]
+
+Usage:
+    python batch.py MANIFEST [-j JOBS] [--dry-run]
+    python fefates.py batch MANIFEST [-j JOBS] [--dry-run]
+"""
+
+from __future__ import print_function
+import io
+import json
+import os
+import sys
+import threading
+from struct import unpack
+if sys.version_info[0] > 2:
+    xrange = range
+    unicode = str
+
+try:
+    from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+except ImportError:
+    ThreadPoolExecutor = None
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+import atomic
+import profiling
+
+
+##############################################################################
+# Shared files
+##############################################################################
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime, st.st_size
+
+
+class Context(object):
+    """Files shared by the steps of a batch.
+
+    Parsed files are kept with the modification time and size of the file
+    when it was read or written, and are parsed again if the file changed.
+    Steps which use the same file never run at the same time, so the objects
+    do not need to be copied.
+    """
+
+    def __init__(self, jobs=None):
+        self.jobs = jobs
+        self._files = {}    # Path -> (stat, object)
+        self._lock = threading.Lock()
+
+    def load(self, path, loader):
+        """Get the parsed content of a file.
+
+        `loader`: Function which parses the file, called with its path
+        """
+        with self._lock:
+            entry = self._files.get(path)
+        if entry is not None and entry[0] == _stat(path):
+            return entry[1]
+        obj = loader(path)
+        self.keep(path, obj)
+        return obj
+
+    def keep(self, path, obj):
+        """Remember the parsed content of a file which was just read or
+        written."""
+        with self._lock:
+            self._files[path] = (_stat(path), obj)
+
+    def forget(self, path):
+        """Forget a file which was changed."""
+        with self._lock:
+            self._files.pop(path, None)
+
+
+##############################################################################
+# Steps
+##############################################################################
+class Step(object):
+    """A step of a batch.
+
+    `reads`, `writes`: Absolute paths of the files and folders which the
+        step reads and writes
+    """
+    op = None
+    required = []
+
+    def __init__(self, spec, base):
+        for key in self.required:
+            if key not in spec:
+                raise ValueError('%s: missing "%s"' % (self.op, key))
+        self.spec = spec
+        self.base = base
+        self.id = spec.get('id')
+        self.after = list(spec.get('after', []))
+        self.reads = []
+        self.writes = []
+
+    def path(self, path):
+        return os.path.normpath(os.path.join(self.base, path))
+
+    def describe(self):
+        return self.op
+
+    def run(self, context):
+        """Run the step. Return a message."""
+        raise NotImplementedError
+
+
+class ArcExtract(Step):
+    op = 'arc-extract'
+    required = ['path']
+
+    def __init__(self, spec, base):
+        Step.__init__(self, spec, base)
+        self.source = self.path(spec['path'])
+        self.output = self.path(spec.get('output') or
+                                os.path.splitext(spec['path'])[0])
+        self.reads = [self.source]
+        self.writes = [self.output]
+
+    def describe(self):
+        return '%s %s -> %s' % (self.op, self.source, self.output)
+
+    def run(self, context):
+        import arc
+        archive = context.load(self.source, arc.load_file)
+        if not os.path.isdir(self.output):
+            os.makedirs(self.output)
+        for i in xrange(archive.get_file_count()):
+            atomic.write_file(os.path.join(self.output,
+                                           archive.get_filename(i)),
+                              archive.get_file(i), sync=False)
+        return '%d files were extracted.' % archive.get_file_count()
+
+
+class ArcPack(Step):
+    op = 'arc-pack'
+    required = ['folder']
+
+    def __init__(self, spec, base):
+        Step.__init__(self, spec, base)
+        self.folder = self.path(spec['folder'])
+        self.output = self.path(spec.get('output') or
+                                spec['folder'].rstrip('/\\') + '.arc')
+        self.dedupe = bool(spec.get('dedupe', False))
+        self.reads = [self.folder]
+        self.writes = [self.output]
+
+    def describe(self):
+        return '%s %s -> %s' % (self.op, self.folder, self.output)
+
+    def run(self, context):
+        import arc
+        archive = arc.load_folder(self.folder, self.dedupe)
+        with atomic.atomic_open(self.output, 'wb') as file:
+            archive.write(file)
+        context.keep(self.output, archive)
+        message = '%d files were packed.' % archive.get_file_count()
+        if self.dedupe:
+            message += ' %d bytes were saved.' % archive.get_shared_size()
+        return message
+
+
+class GameDataAppend(Step):
+    op = 'gamedata-append'
+    required = ['table', 'ids', 'names']
+    TABLES = ['Chapter', 'Character', 'Class', 'Item']
+
+    def __init__(self, spec, base):
+        Step.__init__(self, spec, base)
+        self.table = spec['table']
+        if self.table not in self.TABLES:
+            raise ValueError('%s: unknown table "%s"' % (self.op, self.table))
+        self.ids = [int(i, 0) if isinstance(i, (str, unicode)) else i
+                    for i in spec['ids']]
+        self.names = list(spec['names'])
+        if len(self.ids) != len(self.names):
+            raise ValueError('%s: ids and names differ in length' % self.op)
+        self.supports = spec.get('supports')
+        self.gamedata = self.path(spec.get('gamedata', 'GameData.bin'))
+        self.modules = self.path(spec.get('modules', '.'))
+        self.reads = [self.gamedata]
+        self.writes = [self.gamedata] + self.__module_paths()
+        self.reads.extend(self.writes[1:])
+
+    def __module_paths(self):
+        """Get the module files which the step changes."""
+        import gamedata_module
+        if self.table == 'Character' and self.supports and \
+                any(support > 0 for support in self.supports):
+            # The folders of new support modules are only known once the
+            # support IDs are assigned
+            return [self.modules]
+        tables = [t for t, path in gamedata_module.MODULE_ORDER]
+        paths = [os.path.join(self.table, self.table + '.nmm'),
+                 os.path.join(self.table, self.table + '.txt')]
+        paths.extend(gamedata_module.MODULE_FILES[self.table])
+        paths.extend([path for t, path in gamedata_module.MODULE_ORDER[
+            tables.index(self.table) + 1:]])
+        paths.append(atomic.JOURNAL_NAME)
+        return [os.path.normpath(os.path.join(self.modules, path))
+                for path in paths]
+
+    def describe(self):
+        return '%s %s +%d' % (self.op, self.table, len(self.ids))
+
+    def __new_supports(self, game_data):
+        """Get the indices of the new characters which have supports."""
+        if self.table != 'Character' or not self.supports:
+            return []
+        info = game_data.get_table_info('Character')
+        count = unpack('<H', game_data.data[
+            info.count_offset:info.count_offset + 2])[0]
+        first = count - len(self.ids)
+        return [first + i for i, support in enumerate(self.supports)
+                if support > 0]
+
+    def run(self, context):
+        import gamedata
+        import gamedata_module
+        game_data = context.load(self.gamedata, gamedata.load_file)
+        # The GameData object is changed in place; forget it if the step
+        # fails, so that later steps parse the file again
+        context.forget(self.gamedata)
+        data_length = len(game_data.data)
+        if self.table != 'Character':
+            game_data.append(self.table, self.ids, self.names)
+        else:
+            game_data.append_character(self.ids, self.names,
+                                       self.supports or [0] * len(self.ids))
+        game_data.format()
+        output = game_data.tobin()
+        with profiling.phase('io.write', len(output)):
+            with atomic.Transaction(self.modules) as transaction:
+                project = gamedata_module.ModuleProject(self.modules,
+                                                        transaction)
+                project.add(self.table, self.ids, self.names,
+                            len(game_data.data) - data_length)
+                transaction.write(self.gamedata, output)
+                project.save()
+                for index in self.__new_supports(game_data):
+                    spdir, files = gamedata_module.support_module_files(
+                        game_data, index)
+                    spdir = os.path.join(self.modules, spdir)
+                    if not os.path.isdir(spdir):
+                        os.mkdir(spdir)
+                    for path, text in files:
+                        transaction.write(
+                            os.path.join(self.modules, path),
+                            text.replace('\n', os.linesep).encode(
+                                gamedata_module.LIST_ENCODING))
+        context.keep(self.gamedata, game_data)
+        return 'Added %d %s(s) to GameData.bin.' % (len(self.ids), self.table)
+
+
+class CastleJoinConvert(Step):
+    op = 'castle-join'
+    required = ['input']
+
+    def __init__(self, spec, base):
+        Step.__init__(self, spec, base)
+        self.input = self.path(spec['input'])
+        self.to_text = os.path.splitext(self.input)[1].lower() == '.bin'
+        default = 'castle_join.txt' if self.to_text else 'castle_join.bin'
+        self.output = self.path(spec.get('output') or os.path.join(
+            os.path.dirname(spec['input']), default))
+        self.reads = [self.input]
+        self.writes = [self.output]
+
+    def describe(self):
+        return '%s %s -> %s' % (self.op, self.input, self.output)
+
+    def run(self, context):
+        import castle_join
+        if self.to_text:
+            cj = context.load(self.input, castle_join.load_bin)
+            atomic.write_file(self.output, cj.totext(), 'utf-8')
+        else:
+            cj = context.load(self.input, castle_join.load_text)
+            atomic.write_file(self.output, cj.tobin())
+        return 'Data was written to %s.' % self.output
+
+
+class Fst(Step):
+    op = 'fst'
+    required = ['folder']
+
+    def __init__(self, spec, base):
+        Step.__init__(self, spec, base)
+        self.folder = self.path(spec['folder'])
+        self.cache = spec.get('cache', True)
+        self.reads = [self.folder]
+        self.writes = [os.path.join(self.folder, 'fst.bin')]
+
+    def describe(self):
+        return '%s %s' % (self.op, self.folder)
+
+    def run(self, context):
+        import fst_generator
+        manifest_path = None
+        if self.cache:
+            manifest_path = fst_generator.get_manifest_path(self.folder)
+        added, removed = fst_generator.generate(self.folder, manifest_path,
+                                                context.jobs)
+        return 'fst.bin generated (%d added, %d removed).' % (len(added),
+                                                              len(removed))
+
+
+class Trim(Step):
+    op = 'trim'
+    required = ['paths']
+
+    def __init__(self, spec, base):
+        Step.__init__(self, spec, base)
+        self.paths = [self.path(p) for p in spec['paths']]
+        self.reads = list(self.paths)
+        self.writes = list(self.paths)
+
+    def describe(self):
+        return '%s %d file(s)' % (self.op, len(self.paths))
+
+    def run(self, context):
+        import trim
+        count = 0
+        for path in self.paths:
+            if trim.trim(path):
+                context.forget(path)
+                count += 1
+        return '%d file(s) were trimmed.' % count
+
+
+OPERATIONS = dict([(cls.op, cls) for cls in [
+    ArcExtract, ArcPack, GameDataAppend, CastleJoinConvert, Fst, Trim]])
+
+
+##############################################################################
+# Manifest
+##############################################################################
+def load_manifest(path):
+    """Load a manifest file. Return a list of Step objects.
+
+    Raise ValueError if the manifest is invalid.
+    """
+    with io.open(path, 'r', encoding='utf-8') as file:
+        text = file.read()
+    if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+        if yaml is None:
+            raise ImportError('PyYAML is required to read YAML manifests')
+        manifest = yaml.safe_load(text)
+    else:
+        manifest = json.loads(text)
+    if isinstance(manifest, dict):
+        manifest = manifest.get('steps')
+    if not isinstance(manifest, list):
+        raise ValueError('a manifest is a list of steps')
+    return parse_steps(manifest, os.path.dirname(os.path.abspath(path)))
+
+
+def parse_steps(specs, base=''):
+    """Create Step objects from their descriptions (dicts).
+
+    `base`: Folder which the paths are relative to
+
+    Raise ValueError if a step is invalid.
+    """
+    steps = []
+    for number, spec in enumerate(specs, 1):
+        if not isinstance(spec, dict) or spec.get('op') not in OPERATIONS:
+            raise ValueError('step %d: unknown operation %r' % (
+                number, spec.get('op') if isinstance(spec, dict) else spec))
+        try:
+            steps.append(OPERATIONS[spec['op']](spec, os.path.abspath(base)))
+        except (KeyError, TypeError, ValueError) as ex:
+            raise ValueError('step %d: %s' % (number, ex))
+    ids = set([step.id for step in steps if step.id is not None])
+    for number, step in enumerate(steps, 1):
+        for other in step.after:
+            if other not in ids:
+                raise ValueError('step %d: unknown step id %r' % (number,
+                                                                  other))
+    dependencies(steps)
+    return steps
+
+
+##############################################################################
+# Scheduler
+##############################################################################
+def _overlaps(a, b):
+    """Check whether two paths are the same or one contains the other."""
+    return a == b or a.startswith(b.rstrip(os.sep) + os.sep) or \
+        b.startswith(a.rstrip(os.sep) + os.sep)
+
+
+def _conflict(first, second):
+    """Check whether `second` must wait for `first`."""
+    for w in first.writes:
+        if any(_overlaps(w, p) for p in second.reads + second.writes):
+            return True
+    for r in first.reads:
+        if any(_overlaps(r, p) for p in second.writes):
+            return True
+    return False
+
+
+def dependencies(steps):
+    """Find the dependencies of the steps.
+
+    Return a list of sets: the indexes of the steps which every step waits
+    for. Raise ValueError if the "after" fields make a cycle.
+    """
+    ids = dict([(step.id, i) for i, step in enumerate(steps)
+                if step.id is not None])
+    result = []
+    for i, step in enumerate(steps):
+        deps = set([ids[other] for other in step.after])
+        deps.update([j for j in xrange(i) if _conflict(steps[j], step)])
+        result.append(deps)
+
+    # Only "after" can point to a later step, so cycles are rare: remove the
+    # steps whose dependencies are all removed until none is left
+    remaining = set(xrange(len(steps)))
+    while remaining:
+        free = [i for i in remaining if not result[i] & remaining]
+        if not free:
+            raise ValueError('the "after" fields make a cycle (steps %s)' %
+                             ', '.join([str(i + 1)
+                                        for i in sorted(remaining)]))
+        remaining.difference_update(free)
+    return result
+
+
+class Result(object):
+    """Result of a step.
+
+    `status`: 'done', 'failed' or 'skipped' (a step it depends on failed)
+    `message`: Message of the step, or the error
+    `time`: Run time in seconds
+    """
+
+    def __init__(self, status, message, time=0.0):
+        self.status = status
+        self.message = message
+        self.time = time
+
+
+@profiling.profiled('batch.run')
+def run(steps, jobs=None, callback=None):
+    """Run the steps, in parallel when they do not depend on each other.
+
+    `jobs`: Number of threads. Default: min(32, CPU count + 4)
+    `callback`: Function called with (index, step, Result) when a step ends
+
+    When a step fails, the steps which depend on it are skipped; the others
+    still run. Return a list of Result objects. Raise ValueError if the steps
+    wait for each other (see dependencies()).
+    """
+    if jobs is None:
+        jobs = min(32, (getattr(os, 'cpu_count', lambda: None)() or 1) + 4)
+    context = Context(jobs)
+    deps = dependencies(steps)
+    waiting = [set(d) for d in deps]
+    results = [None] * len(steps)
+    timer = profiling.timer
+
+    def execute(index):
+        step = steps[index]
+        start = timer()
+        with profiling.phase('batch.' + step.op):
+            message = step.run(context)
+        return Result('done', message, timer() - start)
+
+    def finish(index, result):
+        results[index] = result
+        if callback is not None:
+            callback(index, steps[index], result)
+        for i in xrange(len(steps)):
+            if results[i] is None and index in waiting[i]:
+                if result.status != 'done':
+                    finish(i, Result('skipped', 'step %d did not finish' %
+                                     (index + 1)))
+                else:
+                    waiting[i].discard(index)
+
+    def ready():
+        return [i for i in xrange(len(steps))
+                if results[i] is None and not waiting[i] and i not in running]
+
+    running = {}
+    if ThreadPoolExecutor is None or jobs <= 1:
+        while True:
+            queue = ready()
+            if not queue:
+                break
+            index = queue[0]
+            running[index] = None
+            try:
+                result = execute(index)
+            except Exception as ex:
+                result = Result('failed', '%s: %s' % (type(ex).__name__, ex))
+            del running[index]
+            finish(index, result)
+    else:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            while True:
+                for index in ready():
+                    running[index] = executor.submit(execute, index)
+                if not running:
+                    break
+                done, _ = wait(list(running.values()),
+                               return_when=FIRST_COMPLETED)
+                for index, future in list(running.items()):
+                    if future not in done:
+                        continue
+                    del running[index]
+                    try:
+                        result = future.result()
+                    except Exception as ex:
+                        result = Result('failed', '%s: %s' % (
+                            type(ex).__name__, ex))
+                    finish(index, result)
+
+    # Steps which never became ready (their dependencies wait for each other)
+    for index in xrange(len(steps)):
+        if results[index] is None:
+            finish(index, Result('skipped', 'its dependencies never '
+                                 'finished'))
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('manifest', help='JSON or YAML list of steps')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of steps which run at the same time')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='print the steps and their dependencies only')
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    profiling.setup(args.profile)
+
+    try:
+        steps = load_manifest(args.manifest)
+    except (IOError, OSError, ValueError, ImportError) as ex:
+        sys.exit('%s: %s' % (args.manifest, ex))
+
+    if args.dry_run:
+        for i, deps in enumerate(dependencies(steps)):
+            after = ', '.join([str(d + 1) for d in sorted(deps)])
+            print('%3d  %s%s' % (i + 1, steps[i].describe(),
+                                 '  (after ' + after + ')' if after else ''))
+        sys.exit(0)
+
+    def report(index, step, result):
+        print('[%d/%d] %s: %s %s (%.0f ms)' % (
+            index + 1, len(steps), step.describe(), result.status,
+            result.message, result.time * 1000))
+
+    results = run(steps, args.jobs, report)
+    failed = len([r for r in results if r.status != 'done'])
+    if failed:
+        sys.exit('%d of %d steps did not finish.' % (failed, len(steps)))
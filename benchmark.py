@@ -0,0 +1,514 @@
+#!/usr/bin/env python2
+#
+# The MIT License
+#
+# Copyright (c) 2017 RainThunder.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+"""Benchmarks for the hot paths of the bin, basetypes, gamedata and arc
+modules.
+
+The benchmarks use the files shipped with this repository (GameData.bin,
+*_HANDOVER.bin and the Dispos maps) and synthetic files generated at a larger
+scale (see synthetic.py): GameData.bin with `scale` times the Item / Class
+rows, a generic .bin file and castle_join.bin with 1000 * `scale` rows, and
+.arc / fst.bin files with many entries. Run it with several `--scale` values
+to get a scaling curve.
+
+Usage:
+    python benchmark.py [-o results.json] [--compare old.json] [-n repeat]
+        [--scale N] [--arc-entries N] [-k pattern]
+
+Every benchmark reports the best and mean wall time, throughput and peak
+memory (measured with tracemalloc in a separate, untimed run). Results can be
+saved as JSON with `-o` and compared with a previous run with `--compare`.
+
+If pyperf is installed, `--pyperf` runs the same benchmarks with pyperf's
+runner instead. All remaining arguments are passed to pyperf, e.g.:
+    python benchmark.py --pyperf -o results.json
+"""
+
+from __future__ import print_function, unicode_literals
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import namedtuple
+if sys.version_info[0] > 2:
+    xrange = range
+    unicode = str
+
+try:
+    import tracemalloc
+except ImportError: # Python 2
+    tracemalloc = None
+
+import arc
+import atomic
+import bin
+import castle_join
+import forecast
+import fst_generator
+import gamedata
+import growth
+import nightmare
+import synthetic
+
+timer = getattr(time, 'perf_counter', time.time)
+
+Benchmark = namedtuple('Benchmark', ['name', 'setup', 'run', 'nbytes'])
+
+
+##############################################################################
+# Inputs
+##############################################################################
+def read_file(path):
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+def make_castle_join(count):
+    """Generate a castle_join.bin file with `count` characters."""
+    cj = castle_join.CastleJoin()
+    for i in xrange(count):
+        cj.characters.append(castle_join.Character([
+            i, 'PID_BENCH%d' % (i % 500),
+            'C%03d' % (i % 30), 'NULL', 'B%03d' % (i % 27),
+            i, -1, i % 7
+        ]))
+    return cj.tobin()
+
+
+class Inputs(object):
+    """Lazily loaded benchmark inputs."""
+
+    def __init__(self, root, scale, arc_entries):
+        self.root = root
+        self.scale = scale
+        self.arc_entries = arc_entries
+        self.__cache = {}
+
+    def __get(self, key, factory):
+        if key not in self.__cache:
+            self.__cache[key] = factory()
+        return self.__cache[key]
+
+    @property
+    def gamedata(self):
+        return self.__get('gamedata', lambda: read_file(
+            os.path.join(self.root, 'GameData.bin')))
+
+    @property
+    def gamedata_scaled(self):
+        return self.__get('gamedata_scaled', lambda: synthetic.scale_gamedata(
+            self.gamedata, self.scale))
+
+    @property
+    def handover(self):
+        return self.__get('handover', lambda: [read_file(p) for p in sorted(
+            glob.glob(os.path.join(self.root, 'Character_*_HANDOVER',
+                                   '*_HANDOVER.bin')))])
+
+    @property
+    def dispos(self):
+        return self.__get('dispos', lambda: [read_file(p) for p in sorted(
+            glob.glob(os.path.join(self.root, 'Dispos', '*', '*.bin')))])
+
+    @property
+    def character_module(self):
+        return self.__get('character_module', lambda: nightmare.load_module(
+            os.path.join(self.root, 'Character', 'Character.nmm')))
+
+    @property
+    def castle_join(self):
+        return self.__get('castle_join', lambda: make_castle_join(
+            1000 * self.scale))
+
+    @property
+    def synthetic_bin(self):
+        return self.__get('synthetic_bin', lambda: synthetic.generate_bin(
+            1000 * self.scale).tobin())
+
+    @property
+    def fst_list(self):
+        return self.__get('fst_list', lambda: synthetic.generate_file_list(
+            self.arc_entries))
+
+    @property
+    def arc(self):
+        return self.__get('arc', lambda: synthetic.generate_arc(
+            self.arc_entries))
+
+    @property
+    def arc_raw(self):
+        return self.__get('arc_raw', lambda: self.arc.to_arc())
+
+
+##############################################################################
+# Benchmarks
+##############################################################################
+def _total(raws):
+    return sum([len(raw) for raw in raws])
+
+
+def get_benchmarks(inputs):
+    """Create the list of benchmarks.
+
+    `setup` is called before every timed run and its return value is passed
+    to `run`; `nbytes` is the number of bytes processed by a single run.
+    """
+    x = 'x%d' % inputs.scale
+    cj_raw = lambda: inputs.castle_join
+    benchmarks = [
+        # Load
+        Benchmark('load.gamedata', lambda: inputs.gamedata, bin.load,
+                  lambda: len(inputs.gamedata)),
+        Benchmark('load.gamedata_' + x, lambda: inputs.gamedata_scaled,
+                  bin.load, lambda: len(inputs.gamedata_scaled)),
+        Benchmark('load.handover', lambda: inputs.handover,
+                  lambda raws: [bin.load(raw) for raw in raws],
+                  lambda: _total(inputs.handover)),
+        Benchmark('load.synthetic_' + x, lambda: inputs.synthetic_bin,
+                  bin.load, lambda: len(inputs.synthetic_bin)),
+        Benchmark('load.dispos', lambda: inputs.dispos,
+                  lambda raws: [bin.load(raw) for raw in raws],
+                  lambda: _total(inputs.dispos)),
+
+        # Label resolution
+        Benchmark('labels.gamedata', lambda: bin.load(inputs.gamedata),
+                  lambda b: b.get_labels(), lambda: len(inputs.gamedata)),
+        Benchmark('labels.gamedata_' + x,
+                  lambda: bin.load(inputs.gamedata_scaled),
+                  lambda b: b.get_labels(),
+                  lambda: len(inputs.gamedata_scaled)),
+        Benchmark('labels.synthetic_' + x,
+                  lambda: bin.load(inputs.synthetic_bin),
+                  lambda b: b.get_labels(),
+                  lambda: len(inputs.synthetic_bin)),
+        Benchmark('labels.dispos',
+                  lambda: [bin.load(raw) for raw in inputs.dispos],
+                  lambda bs: [b.get_labels() for b in bs],
+                  lambda: _total(inputs.dispos)),
+
+        # Table extraction
+        Benchmark('extract.castle_join_' + x, cj_raw,
+                  lambda raw: castle_join.CastleJoin(raw[:0x20], raw[0x20:]),
+                  lambda: len(inputs.castle_join)),
+        Benchmark('extract.synthetic_' + x,
+                  lambda: synthetic.SyntheticBin(inputs.synthetic_bin[:0x20],
+                                                 inputs.synthetic_bin[0x20:]),
+                  lambda b: b.extractmultiple(synthetic.make_table_class(
+                      8, 0.25), 0x4, b.get_count()),
+                  lambda: len(inputs.synthetic_bin)),
+        Benchmark('extract.character_module',
+                  lambda: bin.load(inputs.gamedata),
+                  lambda b: inputs.character_module.read_columns(b),
+                  lambda: inputs.character_module.count *
+                          inputs.character_module.size),
+
+        # Append
+        Benchmark('append.item_100', lambda: gamedata.load(inputs.gamedata),
+                  lambda g: g.append('Item', list(xrange(0x4000, 0x4064)),
+                                     ['BENCH%d' % i for i in xrange(100)]),
+                  lambda: len(inputs.gamedata)),
+
+        # Supports
+        Benchmark('supports.decode', lambda: gamedata.load(inputs.gamedata),
+                  gamedata.SupportGraph, lambda: len(inputs.gamedata)),
+        Benchmark('supports.link_100',
+                  lambda: _support_graph(inputs.gamedata),
+                  lambda args: _link_supports(*args),
+                  lambda: len(inputs.gamedata)),
+
+        # Format
+        Benchmark('format.gamedata', lambda: bin.load(inputs.gamedata),
+                  lambda b: b.format(), lambda: len(inputs.gamedata)),
+        Benchmark('format.gamedata_' + x,
+                  lambda: bin.load(inputs.gamedata_scaled),
+                  lambda b: b.format(), lambda: len(inputs.gamedata_scaled)),
+        Benchmark('format.gamedata_%s_shared_tails' % x,
+                  lambda: bin.load(inputs.gamedata_scaled),
+                  lambda b: b.format(share_suffixes=True),
+                  lambda: len(inputs.gamedata_scaled)),
+        Benchmark('format.synthetic_' + x,
+                  lambda: bin.load(inputs.synthetic_bin),
+                  lambda b: b.format(), lambda: len(inputs.synthetic_bin)),
+
+        # Repack
+        Benchmark('repack.castle_join_' + x,
+                  lambda: castle_join.CastleJoin(inputs.castle_join[:0x20],
+                                                 inputs.castle_join[0x20:]),
+                  lambda cj: cj.tobin(), lambda: len(inputs.castle_join)),
+
+        # Arc
+        Benchmark('arc.append_1000', lambda: None,
+                  lambda _: synthetic.generate_arc(1000), lambda: 0),
+        Benchmark('arc.pack_%d' % inputs.arc_entries, lambda: inputs.arc,
+                  lambda a: a.to_arc(), lambda: len(inputs.arc_raw)),
+        Benchmark('arc.unpack_%d' % inputs.arc_entries,
+                  lambda: inputs.arc_raw,
+                  lambda raw: _unpack_arc(raw), lambda: len(inputs.arc_raw)),
+        Benchmark('arc.replace_in_place_%d' % inputs.arc_entries,
+                  lambda: _arc_replace(inputs.arc_raw),
+                  lambda args: args[0].save_in_place(args[1]), lambda: 0),
+
+        # Fst
+        Benchmark('fst.construct_%d' % inputs.arc_entries,
+                  lambda: inputs.fst_list,
+                  lambda paths: fst_generator.Fst().construct(paths),
+                  lambda: 0),
+    ]
+    if growth.numpy is not None:
+        benchmarks += [
+            # Stat growth
+            Benchmark('growth.expected',
+                      lambda: _growth_tables(inputs.gamedata),
+                      lambda args: growth.expected(*args), lambda: 0),
+            Benchmark('growth.simulate_10k',
+                      lambda: _growth_tables(inputs.gamedata),
+                      lambda args: growth.simulate(*args, trials=10000,
+                                                   seed=0),
+                      lambda: 0),
+            # Combat forecast
+            Benchmark('forecast.dispos',
+                      lambda: gamedata.load(inputs.gamedata),
+                      lambda g: forecast.Forecaster(g).forecast_all(
+                          os.path.join(inputs.root, 'Dispos')),
+                      lambda: _total(inputs.dispos)),
+        ]
+    return benchmarks
+
+
+def _support_graph(raw):
+    game_data = gamedata.load(raw)
+    return game_data, gamedata.SupportGraph(game_data)
+
+
+def _link_supports(game_data, graph):
+    characters = list(graph)
+    for i in xrange(100):
+        graph.link(characters[i % len(characters)],
+                   characters[(i + 1 + i % 5) % len(characters)])
+    graph.write(game_data)
+
+
+def _growth_tables(raw):
+    game_data = gamedata.load(raw)
+    return growth.load_roster(game_data), growth.load_classes(game_data)
+
+
+def _unpack_arc(raw):
+    archive = arc.load(raw)
+    return [archive.get_file(i) for i in xrange(archive.get_file_count())]
+
+
+def _arc_replace(raw):
+    # One file of the archive is replaced by data of the same size
+    path = os.path.join(tempfile.gettempdir(), 'benchmark.arc')
+    with open(path, 'wb') as file:
+        file.write(raw)
+    archive = arc.load_file(path)
+    index = archive.get_file_count() // 2
+    archive.replace_file(archive.get_filename(index),
+                         archive.get_file(index)[::-1])
+    return archive, path
+
+
+##############################################################################
+# Runner
+##############################################################################
+def measure(benchmark, repeat):
+    """Run a benchmark and return a result dict."""
+    times = []
+    for i in xrange(repeat):
+        arg = benchmark.setup()
+        start = timer()
+        benchmark.run(arg)
+        times.append(timer() - start)
+
+    peak = None
+    if tracemalloc is not None:
+        arg = benchmark.setup()
+        tracemalloc.start()
+        benchmark.run(arg)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    nbytes = benchmark.nbytes()
+    best = min(times)
+    mean = sum(times) / len(times)
+    stdev = (sum([(t - mean) ** 2 for t in times]) / len(times)) ** 0.5
+    return {
+        'min': best,
+        'mean': mean,
+        'stdev': stdev,
+        'runs': len(times),
+        'bytes': nbytes,
+        'throughput': nbytes / best if nbytes and best > 0 else None,
+        'peak_memory': peak
+    }
+
+
+def get_metadata():
+    """Collect information about the current environment and commit."""
+    metadata = {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.STDOUT)
+        metadata['commit'] = commit.decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return metadata
+
+
+def _format_size(n):
+    if n is None:
+        return '-'
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(n) < 1024:
+            return '%.1f %s' % (n, unit)
+        n /= 1024.0
+    return '%.1f GiB' % n
+
+
+def print_results(results, baseline=None):
+    """Print results as a table. If `baseline` results are given, the ratio
+    of the best times (new / old) is also printed."""
+    header = '%-32s %10s %10s %12s %11s' % ('Benchmark', 'Best (ms)',
+                                            'Mean (ms)', 'Throughput',
+                                            'Peak mem')
+    if baseline is not None:
+        header += ' %9s' % 'vs. old'
+    print(header)
+    print('-' * len(header))
+    for name in sorted(results):
+        r = results[name]
+        throughput = '-' if r['throughput'] is None else \
+            _format_size(r['throughput']) + '/s'
+        line = '%-32s %10.3f %10.3f %12s %11s' % (
+            name, r['min'] * 1000, r['mean'] * 1000, throughput,
+            _format_size(r['peak_memory']))
+        if baseline is not None:
+            if name in baseline:
+                line += ' %8.2fx' % (r['min'] / baseline[name]['min'])
+            else:
+                line += ' %9s' % 'new'
+        print(line)
+
+
+def run_pyperf(benchmarks, argv, worker_args):
+    """Run the benchmarks with pyperf.
+
+    `argv`: Arguments for pyperf
+    `worker_args`: Arguments of this script, passed to pyperf worker processes
+    """
+    import pyperf
+
+    def make_time_func(benchmark):
+        def time_func(loops):
+            total = 0.0
+            for i in xrange(loops):
+                arg = benchmark.setup()
+                start = pyperf.perf_counter()
+                benchmark.run(arg)
+                total += pyperf.perf_counter() - start
+            return total
+        return time_func
+
+    sys.argv = [sys.argv[0]] + argv
+    runner = pyperf.Runner(
+        add_cmdline_args=lambda cmd, args: cmd.extend(worker_args))
+    for benchmark in benchmarks:
+        runner.bench_time_func(benchmark.name, make_time_func(benchmark))
+
+
+if __name__ == '__main__':
+    import argparse
+    import fnmatch
+
+    use_pyperf = '--pyperf' in sys.argv
+    parser = argparse.ArgumentParser()
+    if not use_pyperf: # Conflict with pyperf options
+        parser.add_argument('-o', '--output', default=None,
+                            help='save results to a JSON file')
+        parser.add_argument('--compare', default=None, metavar='FILE',
+                            help='compare with results from a JSON file')
+        parser.add_argument('-n', '--repeat', type=int, default=5,
+                            help='number of timed runs (default: 5)')
+    parser.add_argument('--scale', type=int, default=10,
+                        help='row multiplier of synthetic files (default: 10)')
+    parser.add_argument('--arc-entries', type=int, default=10000,
+                        help='number of files in synthetic arcs '
+                        '(default: 10000)')
+    parser.add_argument('-k', '--filter', default=None, metavar='PATTERN',
+                        help='only run benchmarks matching a glob pattern')
+    parser.add_argument('--root', default=os.path.dirname(
+                        os.path.abspath(__file__)),
+                        help='folder which contains the data files')
+    parser.add_argument('--pyperf', action='store_true',
+                        help='run with pyperf; other arguments are passed '
+                        'to pyperf')
+    args, remaining = parser.parse_known_args()
+
+    inputs = Inputs(args.root, args.scale, args.arc_entries)
+    benchmarks = get_benchmarks(inputs)
+    if args.filter:
+        benchmarks = [b for b in benchmarks
+                      if fnmatch.fnmatch(b.name, args.filter)]
+
+    if use_pyperf:
+        worker_args = ['--pyperf', '--scale', str(args.scale),
+                       '--arc-entries', str(args.arc_entries),
+                       '--root', args.root]
+        if args.filter:
+            worker_args.extend(['--filter', args.filter])
+        run_pyperf(benchmarks, remaining, worker_args)
+        exit()
+    elif remaining:
+        parser.error('unrecognized arguments: ' + ' '.join(remaining))
+
+    results = {}
+    for benchmark in benchmarks:
+        benchmark.setup() # Build the inputs before any measurement
+        results[benchmark.name] = measure(benchmark, args.repeat)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)['benchmarks']
+    print_results(results, baseline)
+
+    if args.output:
+        with atomic.atomic_path(args.output) as temp:
+            with open(temp, 'w') as file:
+                json.dump({'metadata': get_metadata(), 'benchmarks': results},
+                          file, indent=2, sort_keys=True)
+        print('Results were saved to ' + args.output + '.')
@@ -24,20 +24,123 @@
 #
 """A lightweight library for .bin file format in Fire Emblem Fates."""
 
+import copy
 import sys
-from struct import unpack, pack, pack_into
+from collections import OrderedDict, namedtuple
+from struct import unpack, unpack_from, pack, pack_into
 if sys.version_info[0] > 2:
     xrange = range
     unicode = str
 
 import basetypes
+import profiling
+import sjis
 
 
 class InvalidFileError(Exception):
     pass
 
 
+class LabelReport(namedtuple('LabelReport', ['references', 'labels',
+                                             'shared', 'old_size',
+                                             'new_size'])):
+    """Result of building a label region.
+
+    `references`: Number of pointers to labels
+    `labels`: Number of distinct labels
+    `shared`: Number of labels stored as the tail of a longer label
+    `old_size`, `new_size`: Size of the label region, in bytes
+    """
+    __slots__ = ()
+
+    @property
+    def saved(self):
+        """Number of bytes removed from the label region."""
+        return self.old_size - self.new_size
+
+    def __str__(self):
+        return ('%d reference(s) to %d distinct label(s), %d stored as a '
+                'shared tail; label region: 0x%X -> 0x%X bytes (%d saved)' %
+                (self.references, self.labels, self.shared, self.old_size,
+                 self.new_size, self.saved))
+
+
+class LabelPool(object):
+    """Builder for the label region, which stores each distinct label once.
+
+    Labels are stored in the order they were first added. If `build` is
+    called with `share_suffixes`, a label which is the tail of another label
+    (e.g. PID_A and MPID_A) is not stored at all: pointers to it point into
+    the longer label instead, like the files made by the original toolchain.
+    """
+
+    def __init__(self):
+        self._labels = []       # Distinct labels, in Shift-JIS encoding
+        self._seen = set()
+        self.references = 0     # Number of calls to add()
+        self.shared = 0         # Number of shared tails in the last build()
+
+    def __len__(self):
+        return len(self._labels)
+
+    def add(self, label, references=1):
+        """Add references to a label.
+
+        `label`: A unicode string or a Shift-JIS byte string
+        `references`: Number of pointers to the label
+
+        Return the label in Shift-JIS encoding, which is the key of the
+        offset dictionary returned by build().
+        """
+        if isinstance(label, unicode):
+            label = sjis.encode(label)
+        self.references += references
+        if label not in self._seen:
+            self._seen.add(label)
+            self._labels.append(label)
+        return label
+
+    def build(self, share_suffixes=False):
+        """Construct the label region.
+
+        Return a tuple (region, offsets), where `offsets` is a dictionary of
+        Shift-JIS label -> offset of the label in `region`.
+        """
+        owners = {}     # Shared tail -> label which contains it
+        if share_suffixes:
+            # After sorting the labels by their reversed bytes, a label is a
+            # tail of some other label only if it is a tail of the label
+            # right before it in descending order.
+            previous = None
+            for label in sorted(self._labels, key=lambda l: l[::-1],
+                                reverse=True):
+                if previous is not None and previous.endswith(label):
+                    owners[label] = owners.get(previous, previous)
+                previous = label
+        self.shared = len(owners)
+
+        stored = []
+        offsets = {}
+        total_length = 0
+        for label in self._labels:
+            if label in owners:
+                continue
+            stored.append(label)
+            offsets[label] = total_length
+            total_length += len(label) + 1
+        for label, owner in owners.items():
+            offsets[label] = offsets[owner] + len(owner) - len(label)
+        return b'\0'.join(stored) + b'\0', offsets
+
+    def report(self, old_size, region):
+        """Return a LabelReport for a region built by this pool."""
+        return LabelReport(self.references, len(self._labels), self.shared,
+                           old_size, len(region))
+
+
 class BinFile(object):
+    @profiling.profiled('bin.parse', lambda self, header=None, raw=None:
+                        len(raw) if raw else 0)
     def __init__(self, header=None, raw=None):
         """Initialize the bin objects.
 
@@ -88,6 +191,7 @@ class BinFile(object):
         pointer2 = b''.join([pack('<II', *_) for _ in self._p2_list])
         return self._data + pointer1 + pointer2 + self._labels
 
+    @profiling.profiled('bin.tobin', lambda self: len(self))
     def tobin(self):
         """Export to .bin file."""
         header = pack('<4I', len(self), len(self._data), len(self._p1_list),
@@ -99,6 +203,170 @@ class BinFile(object):
         """Get raw bytes of the data region."""
         return self._data
 
+    def copy(self):
+        """Return a copy of this object which can be modified independently."""
+        other = copy.copy(self)
+        other._p1_list = list(self._p1_list)
+        other._p2_list = list(self._p2_list)
+        return other
+
+    def pack_values(self, values):
+        """Overwrite values in the data region.
+
+        `values`: An iterable of (offset, format string, value) tuples, e.g.
+            (0x10, '<H', 500)
+        """
+        data = bytearray(self._data)
+        for offset, fstring, value in values:
+            pack_into(fstring, data, offset, value)
+        self._data = bytes(data)
+
+    def set_label(self, offset, label):
+        """Point the pointer at `offset` in the data region to a label.
+
+        The label is appended to the label region if it does not exist yet;
+        use format() to remove labels which are no longer used. The pointer is
+        added to pointer region 1, or removed from it if `label` is u'NULL'.
+        """
+        old_label0_offset = self.label0_offset
+        p1_set = set(self._p1_list)
+        if label == u'NULL':
+            if offset in p1_set:
+                self._p1_list.remove(offset)
+            p1_set.discard(offset)
+        elif offset not in p1_set:
+            self._p1_list.append(offset)
+            p1_set.add(offset)
+        label0_offset = self.label0_offset
+
+        # Find the label, or append it
+        ptr = 0
+        if label != u'NULL':
+            raw = sjis.encode(label) + b'\0'
+            if self._labels.startswith(raw):
+                label_start = 0
+            else:
+                label_start = self._labels.find(b'\0' + raw)
+                if label_start >= 0:
+                    label_start += 1
+                else:
+                    label_start = len(self._labels)
+                    self._labels += raw
+            ptr = label0_offset + label_start
+
+        # Pointer region 1 size may be changed; fix other label pointers
+        data = bytearray(self._data)
+        if label0_offset != old_label0_offset:
+            for p1_ptr in p1_set:
+                value = unpack('<I', self._data[p1_ptr:p1_ptr + 4])[0]
+                if value >= old_label0_offset:
+                    pack_into('<I', data, p1_ptr,
+                              value + label0_offset - old_label0_offset)
+        pack_into('<I', data, offset, ptr)
+        self._data = bytes(data)
+
+    @profiling.profiled('bin.set_labels', lambda self, pointers: len(self))
+    def set_labels(self, pointers):
+        """Point several pointers in the data region to labels, like
+        set_label(), with a single relocation of the other label pointers.
+
+        `pointers`: An iterable of (offset, label) tuples. If an offset is
+            given several times, its last label is used.
+        """
+        # One entry per offset, so that pointer region 1 gets no duplicates
+        pointers = list(OrderedDict(pointers).items())
+        if not pointers:
+            return
+        old_label0_offset = self.label0_offset
+        p1_set = set(self._p1_list)
+        removed = set()
+        for offset, label in pointers:
+            if label == u'NULL':
+                if offset in p1_set:
+                    removed.add(offset)
+                    p1_set.discard(offset)
+            elif offset not in p1_set:
+                self._p1_list.append(offset)
+                p1_set.add(offset)
+                removed.discard(offset)
+        if removed:
+            self._p1_list = [p for p in self._p1_list if p not in removed]
+        label0_offset = self.label0_offset
+
+        data = bytearray(self._data)
+        if label0_offset != old_label0_offset:
+            for p1_ptr in p1_set:
+                value = unpack_from('<I', self._data, p1_ptr)[0]
+                if value >= old_label0_offset:
+                    pack_into('<I', data, p1_ptr,
+                              value + label0_offset - old_label0_offset)
+        label_index = self.label_index()
+        new_labels = []
+        for offset, label in pointers:
+            ptr = 0
+            if label != u'NULL':
+                ptr = label0_offset + self._intern_label(
+                    sjis.encode(label), label_index, new_labels)
+            pack_into('<I', data, offset, ptr)
+        self._labels += b''.join([label + b'\0' for label in new_labels])
+        self._data = bytes(data)
+
+    @profiling.profiled('bin.splice', lambda self, start, end, data,
+                        pointers=(): len(self))
+    def splice(self, start, end, data, pointers=()):
+        """Replace a part of the data region and relocate the rest of the
+        file in a single pass.
+
+        `start`, `end`: Range of the data region to replace
+        `data`: New bytes. Pointer values in it must be final.
+        `pointers`: Offsets of the pointers in `data`, relative to `start`.
+            They replace the pointer 1 entries which were in the range.
+
+        Pointers after the range are moved, and pointer values which point
+        after the range or to a label are fixed. Pointer 2 entries in the
+        range are removed. Values which point inside the range are left as
+        they are.
+        """
+        diff = len(data) - (end - start)
+        old_label0_offset = self.label0_offset
+        new_p1 = [start + offset for offset in pointers]
+        removed = sum(1 for p in self._p1_list if start <= p < end)
+        p2_removed = sum(1 for data_ptr, label_ptr in self._p2_list
+                         if start <= data_ptr < end)
+        label_diff = diff + 4 * (len(new_p1) - removed) - 8 * p2_removed
+
+        old_data = self._data
+        buf = bytearray(b''.join([old_data[:start], data, old_data[end:]]))
+        p1_list = []
+        inserted = False
+        for p1_ptr in self._p1_list:
+            if start <= p1_ptr < end:
+                if not inserted:
+                    p1_list.extend(new_p1)
+                    inserted = True
+                continue
+            if p1_ptr >= end:
+                if not inserted:
+                    p1_list.extend(new_p1)
+                    inserted = True
+                new_ptr = p1_ptr + diff
+            else:
+                new_ptr = p1_ptr
+            p1_list.append(new_ptr)
+            value = unpack_from('<I', old_data, p1_ptr)[0]
+            if value >= old_label0_offset:
+                pack_into('<I', buf, new_ptr, value + label_diff)
+            elif value >= end:
+                pack_into('<I', buf, new_ptr, value + diff)
+        if not inserted:
+            p1_list.extend(new_p1)
+
+        self._p2_list = [(data_ptr + diff if data_ptr >= end else data_ptr,
+                          label_ptr) for data_ptr, label_ptr in self._p2_list
+                         if not start <= data_ptr < end]
+        self._p1_list = p1_list
+        self._data = bytes(buf)
+
     @property
     def ptr1_list(self):
         """Return a list of all pointers in region 1."""
@@ -122,17 +390,20 @@ class BinFile(object):
             else:
                 return b'NULL'
         offset -= self.label0_offset
-        length = 0
-        while self._labels[offset + length:offset + length + 1] != b'\0':
-            length += 1
+        length = self._labels.find(b'\0', offset) - offset
+        if offset < 0 or length < 0:
+            raise ValueError('Invalid label offset: 0x%X' %
+                             (offset + self.label0_offset))
         if encoding == 'shift-jis':
             return self._labels[offset:offset + length]
         elif encoding == 'unicode':
-            return self._labels[offset:offset + length].decode('shift-jis')
+            return sjis.decode(self._labels[offset:offset + length])
         else:
-            return self._labels[offset:offset + length]\
-                .decode('shift-jis').encode(encoding)
+            return sjis.decode(self._labels[offset:offset + length])\
+                .encode(encoding)
 
+    @profiling.profiled('bin.labels', lambda self, encoding='unicode':
+                        len(self._labels))
     def get_labels(self, encoding='unicode'):
         """Construct a label dictionary for the current .bin file. All labels
         are referenced in pointer region 1.
@@ -166,26 +437,89 @@ class BinFile(object):
             return [label.decode('shift-jis').encode(encoding)
                     for label in label_list]
 
-    def format(self):
+    def label_index(self):
+        """Return a dictionary of Shift-JIS label -> offset, relative to the
+        label region, of every label stored in the label region.
+
+        A label which is only stored as the tail of a longer label is not
+        included.
+        """
+        index = {}
+        offset = 0
+        for label in self._labels.split(b'\0')[:-1]:
+            if label not in index:
+                index[label] = offset
+            offset += len(label) + 1
+        return index
+
+    def _intern_label(self, label, label_index, new_labels):
+        """Find a Shift-JIS label in the label region, or add it to
+        `new_labels`, the list of labels which will be appended to the label
+        region. `label_index` is the result of label_index() and is updated
+        with the new labels.
+
+        Return the offset of the label, relative to the label region.
+        """
+        start = label_index.get(label)
+        if start is None:
+            if new_labels:
+                last = new_labels[-1]
+                start = label_index[last] + len(last) + 1
+            else:
+                start = len(self._labels)
+            label_index[label] = start
+            new_labels.append(label)
+        return start
+
+    def _raw_label(self, start, cache):
+        """Get a label in Shift-JIS encoding by its offset in the label
+        region. `cache` is a dictionary of offset -> label shared by the
+        calls of a single method.
+        """
+        label = cache.get(start)
+        if label is None:
+            end = self._labels.find(b'\0', start)
+            if start < 0 or end < 0:
+                raise ValueError('Invalid label offset: 0x%X' %
+                                 (start + self.label0_offset))
+            label = cache[start] = self._labels[start:end]
+        return label
+
+    @profiling.profiled('bin.format', lambda self, share_suffixes=False:
+                        len(self))
+    def format(self, share_suffixes=False):
         """Properly format this file.
 
-        Important note: All unused labels will be removed immediately.
+        Important note: All unused labels will be removed immediately. Labels
+        with the same content are stored only once.
+
+        `share_suffixes`: Also store a label which is the tail of a longer
+            label inside the longer label. See LabelPool.
+
+        Return a LabelReport.
         """
-        # Group all pointers that are pointed to the same thing.
+        # Group all pointers that are pointed to the same label.
         # Pointers that doesn't point to a label are belong to the first group.
         label0_offset = self.label0_offset
+        old_size = len(self._labels)
+        cache = {}
         ptr_groups = {-1:[]}            # First Pointer 1 -> List of Pointer 1
-        ptr_p1_dict = {}                # Data pointers -> Pointer 1
+        label_p1_dict = {}              # Labels -> First Pointer 1
+        p1_labels = {}                  # Pointer 1 -> Labels
         for p1_ptr in self._p1_list:
-            ptr = unpack('<I', self._data[p1_ptr:p1_ptr + 4])[0]
+            ptr = unpack_from('<I', self._data, p1_ptr)[0]
             if ptr < label0_offset:           # Non-label pointers
                 ptr_groups[-1].append(p1_ptr) # to the first group
             else:
-                if ptr not in ptr_p1_dict:
-                    ptr_p1_dict[ptr] = p1_ptr
+                label = cache.get(ptr - label0_offset)
+                if label is None:
+                    label = self._raw_label(ptr - label0_offset, cache)
+                p1_labels[p1_ptr] = label
+                if label not in label_p1_dict:
+                    label_p1_dict[label] = p1_ptr
                     ptr_groups[p1_ptr] = []
                 else:
-                    ptr_groups[ptr_p1_dict[ptr]].append(p1_ptr)
+                    ptr_groups[label_p1_dict[label]].append(p1_ptr)
 
         # Sort and combine
         p1_sorted = sorted(ptr_groups.keys())
@@ -200,43 +534,23 @@ class BinFile(object):
         # Sort pointer 2
         self._p2_list.sort(key=lambda x:x[0])
 
-        # Sort labels
-        labels = []        # Labels -> New label offsets
-        label_offsets = {} # Old label offsets -> New label offsets
-                           # Used for fixing pointer in data region.
-        total_length = 0   # Total length of all labels in "labels" list.
-
-        # Add pointer 2 labels and fix pointer 2
-        for p2_index in xrange(len(self._p2_list)):
-            p2_ptr = self._p2_list[p2_index]
-
-            # Get label by offset
-            label = self.get_label(label0_offset + p2_ptr[1],
-                encoding='shift-jis')
-            labels.append(label)
-
-            label_offsets[label0_offset + p2_ptr[1]] = total_length # Reserve
-            self._p2_list[p2_index] = (p2_ptr[0], total_length)     # Fix offset
-            total_length += len(label) + 1                          # Update
+        # Collect labels: pointer 2 labels first, then pointer 1 labels
+        pool = LabelPool()
+        p2_labels = [pool.add(self._raw_label(p2_ptr[1], cache))
+                     for p2_ptr in self._p2_list]
+        for p1_ptr in p1_sorted:
+            if p1_ptr != -1:
+                pool.add(p1_labels[p1_ptr], len(ptr_groups[p1_ptr]) + 1)
+        self._labels, label_offsets = pool.build(share_suffixes)
 
-        # Add pointer 1 labels and fix all data pointers
+        # Fix pointer 2 and all data pointers
+        self._p2_list = [(p2_ptr[0], label_offsets[label]) for p2_ptr, label
+                         in zip(self._p2_list, p2_labels)]
         data = bytearray(self._data)
-        for p1_ptr in self._p1_list:
-            ptr = unpack('<I', self._data[p1_ptr:p1_ptr + 4])[0]
-            label_start = ptr - label0_offset
-            if ptr < label0_offset:
-                continue
-            if label_start not in label_offsets:
-                label = self.get_label(ptr, encoding='shift-jis')
-                labels.append(label)
-                label_offsets[label_start] = total_length
-                total_length += len(label) + 1
-            # Fix data pointer
-            pack_into('<I', data, p1_ptr, label0_offset +
-                      label_offsets[label_start])
-
+        for p1_ptr, label in p1_labels.items():
+            pack_into('<I', data, p1_ptr, label0_offset + label_offsets[label])
         self._data = bytes(data)
-        self._labels = b'\0'.join(labels) + b'\0'
+        return pool.report(old_size, self._labels)
 
     ##########################################################################
     # Table methods
@@ -273,6 +587,8 @@ class BinFile(object):
 
         return temp_data
 
+    @profiling.profiled('bin.extract', lambda self, tableclass, offset, count:
+                        tableclass.type.true_size() * count)
     def extractmultiple(self, tableclass, offset, count):
         """Extract multiple rows.
 
@@ -303,7 +619,8 @@ class BinFile(object):
             offset += size
         return table
 
-    def repack(self, table, offset):
+    @profiling.profiled('bin.repack')
+    def repack(self, table, offset, share_suffixes=False):
         """Repack the table back to binary.
 
         This method does not support table with sub-row or file with multiple
@@ -311,15 +628,18 @@ class BinFile(object):
 
         `table`: A table object
         `offset`: Offset
+        `share_suffixes`: See LabelPool.
+
+        Return a LabelReport.
         """
         if not isinstance(table, basetypes.Table):
             raise TypeError('input table must be a Table type.')
 
         # Process all labels and construct the label region.
         # Also create pointer 1 groups for a properly formatted .bin file
-        label_offsets = {}  # Store label offsets
-        raw_labels = []     # Store labels in Shift-JIS encoding
-        total_length = 0    # Keep track of total label length
+        pool = LabelPool()
+        old_size = len(self._labels)
+        raw_labels = {}     # Labels -> labels in Shift-JIS encoding
         p1_groups = {}      # Store pointer 1 groups: all pointer 1 that point
                             # to the same label belong to a group
         p1_count = 0        # Number of pointer 1
@@ -333,16 +653,17 @@ class BinFile(object):
                 if isinstance(cell, basetypes.Label) and cell != u'NULL':
                     label = cell
                     p1_count += 1
-                    if label in label_offsets:
+                    if label in raw_labels:
+                        pool.add(raw_labels[label])
                         p1_groups[label].append(offset + i * size + sub_offset)
                     else:
-                        label_offsets[label] = total_length
-                        raw_labels.append(label.encode('shift-jis'))
-                        total_length += len(raw_labels[len(raw_labels) - 1]) +1
+                        raw_labels[label] = pool.add(label)
                         p1_groups[label] = [offset + i * size + sub_offset]
                 sub_offset += cell.__class__.size
-        self._labels = b'\0'.join(raw_labels) + b'\0'
-        del raw_labels
+        self._labels, raw_offsets = pool.build(share_suffixes)
+        label_offsets = dict([(label, raw_offsets[raw])
+                              for label, raw in raw_labels.items()])
+        del raw_labels, raw_offsets
 
         # Data and pointer region 1
         # Reminder: Doesn't support file with multiple table
@@ -364,6 +685,7 @@ class BinFile(object):
             raw_data.append(pack(fstring, *temp_data))
 
         self._data = self._data[:offset] + b''.join(raw_data)
+        return pool.report(old_size, self._labels)
 
 
 def load_file(path):
@@ -372,9 +694,11 @@ def load_file(path):
     Parameters:
     ``path``: Path to a bin file.
     """
-    with open(path, 'rb') as file:
-        header = file.read(0x20)
-        raw = file.read()
+    with profiling.phase('io.read') as p:
+        with open(path, 'rb') as file:
+            header = file.read(0x20)
+            raw = file.read()
+        p.nbytes = len(header) + len(raw)
     return BinFile(header, raw)
 
 def load(raw):
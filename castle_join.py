@@ -55,8 +55,10 @@ import codecs
 from collections import OrderedDict
 from struct import unpack, pack, pack_into
 
+import atomic
 import bin
 import basetypes
+import profiling
 
 class CastleJoin(bin.BinFile):
     """A class that represent data structure in castle_join.bin.
@@ -83,6 +85,8 @@ class CastleJoin(bin.BinFile):
     def get_pointer_2(self):
         raise NotImplementedError
 
+    @profiling.profiled('castle_join.frombin',
+                        lambda self, header, raw: len(raw))
     def frombin(self, header, raw):
         """Load data from bin file."""
         unit_count = unpack('<I', self._data[0x0:0x4])[0]
@@ -91,16 +95,19 @@ class CastleJoin(bin.BinFile):
 
         self.characters = self.extractmultiple(CharacterList, 0x4, unit_count)
 
+    @profiling.profiled('castle_join.totext')
     def totext(self):
         """Export to text file. Index number will be removed."""
         return u'Index\tPID\tCID_A\tCID_B\tCID_C\tBuilding 1\tBuilding 2\t' + \
             u'Building 3\n' + u'\n'.join([c.tostring() for c in self.characters])
 
+    @profiling.profiled('castle_join.fromtext', lambda self, text: len(text))
     def fromtext(self, text):
         """Load data from text."""
         text = u'\n'.join(text.split(u'\n')[1:])
         self.characters = CharacterList(text)
 
+    @profiling.profiled('castle_join.tobin')
     def tobin(self):
         """Build a functional castle_join.bin."""
         super(CastleJoin, self).repack(self.characters, 0x4)
@@ -200,9 +207,11 @@ def load_bin(path):
     Parameters:
     ``path``: Path to a bin file.
     """
-    with open(path, 'rb') as file:
-        header = file.read(0x20)
-        raw = file.read()
+    with profiling.phase('io.read') as p:
+        with open(path, 'rb') as file:
+            header = file.read(0x20)
+            raw = file.read()
+        p.nbytes = len(header) + len(raw)
     return CastleJoin(header, raw)
 
 def load_text(path):
@@ -211,8 +220,10 @@ def load_text(path):
     Parameters:
     ``path``: Path to a bin file.
     """
-    with codecs.open(path, 'r', 'utf-8') as file:
-        text = file.read()
+    with profiling.phase('io.read') as p:
+        with codecs.open(path, 'r', 'utf-8') as file:
+            text = file.read()
+        p.nbytes = len(text)
     cj = CastleJoin()
     cj.fromtext(text)
     return cj
@@ -226,15 +237,20 @@ if __name__ == '__main__':
     parser.add_argument('input', help='input file name')
     parser.add_argument('output', nargs='?', default=None,
                         help='output file name (optional)')
+    profiling.add_argument(parser)
     args = parser.parse_args()
+    profiling.setup(args.profile)
 
     if os.path.splitext(args.input)[1] == '.bin':
         castle_join = load_bin(args.input)
         outname = args.output
         if args.output is None:
             outname = 'castle_join.txt'
-        with codecs.open(outname, 'w', 'utf-8') as file:
-            file.write(castle_join.totext())
+        text = castle_join.totext()
+        with profiling.phase('io.write', len(text)):
+            with atomic.atomic_path(outname) as temp:
+                with codecs.open(temp, 'w', 'utf-8') as file:
+                    file.write(text)
         print('Data was extracted to ' + outname + '.')
 
     elif os.path.splitext(args.input)[1] == '.txt':
@@ -242,6 +258,7 @@ if __name__ == '__main__':
         outname = args.output
         if args.output is None:
             outname = 'castle_join.bin'
-        with open(outname, 'wb') as file:
-            file.write(castle_join.tobin())
+        output = castle_join.tobin()
+        with profiling.phase('io.write', len(output)):
+            atomic.write_file(outname, output)
         print('Data was packed to ' + outname + '.')
@@ -0,0 +1,79 @@
+#!/usr/bin/env python2
+#
+# The MIT License
+#
+# Copyright (c) 2017 RainThunder.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+"""Compact the label region of .bin files.
+
+Every distinct label is stored once, and unused labels are removed (see
+`bin.BinFile.format`). With `--share-suffixes`, a label which is the tail of
+a longer label (for example, PID_A inside MPID_A) is not stored separately;
+the original toolchain stores labels in the same way.
+
+Usage:
+    python compact.py files [files ...] [--share-suffixes] [--dry-run]
+
+A report is printed for every file, for example:
+    GameData.bin: 5400 reference(s) to 3506 distinct label(s), 822 stored as
+    a shared tail; label region: 0xCEF7 -> 0xA14A bytes (11693 saved)
+"""
+
+from __future__ import print_function
+import argparse
+
+import atomic
+import bin
+
+
+def compact(path, share_suffixes=False, dry_run=False):
+    """Compact the label region of a .bin file.
+
+    `path`: Path to a .bin file
+    `share_suffixes`: Store labels which are tails of other labels inside them
+    `dry_run`: Only compute the report; do not write the file
+
+    Return a bin.LabelReport.
+    """
+    binfile = bin.load_file(path)
+    report = binfile.format(share_suffixes)
+    if not dry_run and report.saved != 0:
+        atomic.write_file(path, binfile.tobin())
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='+', help='input files.')
+    parser.add_argument('--share-suffixes', action='store_true',
+                        help='store labels which are tails of longer labels '
+                        'inside them')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only print the report')
+    args = parser.parse_args()
+
+    total = 0
+    for path in args.files:
+        report = compact(path, args.share_suffixes, args.dry_run)
+        total += report.saved
+        print('%s: %s' % (path, report))
+    if len(args.files) > 1:
+        print('Total: %d bytes saved.' % total)
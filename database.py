@@ -0,0 +1,659 @@
+#!/usr/bin/env python2
+#
+# The MIT License
+#
+# Copyright (c) 2017 RainThunder.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+"""Mirror GameData.bin tables, Dispos maps and castle_join.bin in a SQLite
+database, and write edited rows back.
+
+Tables:
+- One table per GameData.bin module (e.g. "Character", "Weapon Rank"), with
+  a `_row` column (row index).
+- "Dispos": units of every Dispos map, with `_map` (map name) and `_row`
+  columns.
+- "castle_join": rows of castle_join.bin, with a `_row` column.
+
+Column names are the names used by the Nightmare modules, so most of them
+must be quoted in SQL. Labels are stored as text (NULL labels are SQL NULL)
+and every label column is indexed. Label columns which hold PIDs, JIDs, IIDs,
+SEIDs or CIDs reference the matching GameData.bin table. Foreign keys are not
+enforced; `python database.py check` lists the references which cannot be
+resolved.
+
+Refreshing is incremental: every source file is hashed together with its
+modules, and only the sources whose hash has changed are loaded again.
+
+Usage:
+    python database.py export [--db fefates.db]   Create / refresh the mirror
+    python database.py import [--db fefates.db]   Write edited rows back
+    python database.py query "SQL" [--db fefates.db]
+    python database.py check [--db fefates.db]
+
+Example:
+    How many times is each character of GameData.bin placed on a map?
+        SELECT "Unit pointer", COUNT(*) FROM Dispos
+        JOIN Character ON "Unit pointer" = "Character Pointer"
+        GROUP BY "Unit pointer" ORDER BY COUNT(*) DESC
+
+When importing, changed cells are written in place. New rows at the end of
+a GameData.bin table are added with GameData.append (the modules are updated
+as well); castle_join.bin is rebuilt with BinFile.repack, so rows can be
+added to or removed from it freely. Rows cannot be added to Dispos maps.
+"""
+
+from __future__ import print_function, unicode_literals
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+from collections import OrderedDict
+if sys.version_info[0] > 2:
+    xrange = range
+    unicode = str
+
+import atomic
+import basetypes
+import bin
+import castle_join
+import gamedata
+import gamedata_module
+import nightmare
+import profiling
+
+DEFAULT_PATH = 'fefates.db'
+
+# Label prefix -> GameData.bin table. A label column references a table when
+# all of its labels have that prefix. The first label column of the table is
+# its key.
+KEY_PREFIXES = OrderedDict([
+    ('CID_', 'Chapter'),
+    ('PID_', 'Character'),
+    ('JID_', 'Class'),
+    ('SEID_', 'Skill'),
+    ('IID_', 'Item')
+])
+
+_META = [
+    'CREATE TABLE IF NOT EXISTS _sources ('
+    'name TEXT PRIMARY KEY, hash TEXT NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS _tables ('
+    'name TEXT PRIMARY KEY, columns TEXT NOT NULL, refs TEXT NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS _keys ('
+    'prefix TEXT PRIMARY KEY, tbl TEXT NOT NULL, col TEXT NOT NULL)'
+]
+
+
+def quote(name):
+    """Quote an SQL identifier."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _sql_type(datatype):
+    if datatype is basetypes.Label:
+        return 'TEXT'
+    elif datatype is bytes:
+        return 'BLOB'
+    return 'INTEGER'
+
+
+def _to_sql(datatype, values):
+    if datatype is basetypes.Label:
+        return [None if v == u'NULL' else unicode(v) for v in values]
+    elif datatype is bytes:
+        return [sqlite3.Binary(v) for v in values]
+    return [int(v) for v in values]
+
+
+def _from_sql(datatype, value):
+    if datatype is basetypes.Label:
+        return u'NULL' if value is None else value
+    elif datatype is bytes:
+        return bytes(value)
+    return value
+
+
+def hash_files(paths):
+    """Get a hash of the content of some files."""
+    h = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as file:
+            h.update(file.read())
+    return h.hexdigest()
+
+
+class Source(object):
+    """A .bin file and the modules which describe it.
+
+    `name`: Source name, e.g. 'GameData.bin' or 'Dispos/A005'
+    `paths`: The .bin file, followed by its modules
+    `tables`: Names of the database tables which are filled by this source
+    `keys`: Fixed key columns of the rows of this source, e.g. {'_map': 'A005'}
+    """
+
+    def __init__(self, name, paths, tables, keys=None):
+        self.name = name
+        self.paths = paths
+        self.tables = tables
+        self.keys = OrderedDict() if keys is None else keys
+
+    @property
+    def path(self):
+        return self.paths[0]
+
+    def hash(self):
+        return hash_files(self.paths)
+
+    def read(self):
+        """Read the tables of this source.
+
+        Return a list of (table name, list of basetypes.Column).
+        """
+        raise NotImplementedError
+
+
+class GameDataSource(Source):
+    """GameData.bin, read with the modules of this repository."""
+
+    def __init__(self, path, module_root):
+        self.module_root = module_root
+        self.module_paths = OrderedDict()
+        for table_name, module_path in gamedata_module.MODULE_ORDER:
+            module_path = os.path.join(module_root, module_path)
+            if os.path.isfile(module_path):
+                self.module_paths[table_name] = module_path
+        super(GameDataSource, self).__init__(
+            'GameData.bin', [path] + list(self.module_paths.values()),
+            list(self.module_paths.keys()))
+
+    def modules(self):
+        return OrderedDict([(t, nightmare.load_module(p))
+                            for t, p in self.module_paths.items()])
+
+    def read(self):
+        game_data = bin.load_file(self.path)
+        return [(t, m.read_columns(game_data))
+                for t, m in self.modules().items()]
+
+
+class DisposSource(Source):
+    """A Dispos map."""
+
+    def __init__(self, name, bin_path, module_path):
+        super(DisposSource, self).__init__(
+            'Dispos/' + name, [bin_path, module_path], ['Dispos'],
+            OrderedDict([('_map', name)]))
+
+    def read(self):
+        module = nightmare.load_module(self.paths[1])
+        return [('Dispos', module.read_columns(bin.load_file(self.path)))]
+
+
+class CastleJoinSource(Source):
+    """castle_join.bin."""
+
+    def __init__(self, path):
+        super(CastleJoinSource, self).__init__('castle_join.bin', [path],
+                                               ['castle_join'])
+
+    def read(self):
+        characters = castle_join.load_bin(self.path).characters
+        return [('castle_join', characters.tocolumns())]
+
+
+def find_sources(root):
+    """Find all supported files in a folder. Return a list of Source."""
+    sources = []
+    path = os.path.join(root, 'GameData.bin')
+    if os.path.isfile(path):
+        sources.append(GameDataSource(path, root))
+    dispos_dir = os.path.join(root, 'Dispos')
+    if os.path.isdir(dispos_dir):
+        for name in sorted(os.listdir(dispos_dir)):
+            bin_path = os.path.join(dispos_dir, name, name + '.bin')
+            module_path = os.path.join(dispos_dir, name, name + '.nmm')
+            if os.path.isfile(bin_path) and os.path.isfile(module_path):
+                sources.append(DisposSource(name, bin_path, module_path))
+    path = os.path.join(root, 'castle_join.bin')
+    if os.path.isfile(path):
+        sources.append(CastleJoinSource(path))
+    return sources
+
+
+def connect(path=DEFAULT_PATH):
+    """Open a database and create the bookkeeping tables."""
+    connection = sqlite3.connect(path)
+    with connection:
+        for statement in _META:
+            connection.execute(statement)
+    return connection
+
+
+def _find_references(columns, keys):
+    """Find the label columns which reference a GameData.bin table.
+
+    `keys`: Label prefix -> (table, key column)
+
+    Return a dict of column name -> prefix.
+    """
+    refs = {}
+    for column in columns:
+        if column.type is not basetypes.Label:
+            continue
+        labels = [v for v in column.values if v != u'NULL']
+        if len(labels) == 0:
+            continue
+        for prefix in keys:
+            if all(label.startswith(prefix) for label in labels):
+                refs[column.name] = prefix
+                break
+    return refs
+
+
+def _create_table(connection, name, source, columns, refs, keys):
+    key_names = list(source.keys.keys()) + ['_row']
+    lines = ['%s %s NOT NULL' % (quote(k), 'INTEGER' if k == '_row' else
+                                 'TEXT') for k in key_names]
+    for column in columns:
+        line = '%s %s' % (quote(column.name), _sql_type(column.type))
+        if column.name in refs:
+            table, key = keys[refs[column.name]]
+            if (table, key) != (name, column.name):
+                line += ' REFERENCES %s(%s)' % (quote(table), quote(key))
+        lines.append(line)
+    lines.append('PRIMARY KEY (%s)' % ', '.join([quote(k) for k in key_names]))
+    connection.execute('CREATE TABLE %s (\n    %s\n)' %
+                       (quote(name), ',\n    '.join(lines)))
+    for column in columns:
+        if column.type is not basetypes.Label:
+            continue
+        key = keys.get(refs.get(column.name))
+        unique = key == (name, column.name) and len(source.keys) == 0
+        connection.execute('CREATE %sINDEX %s ON %s (%s)' % (
+            'UNIQUE ' if unique else '', quote(name + '.' + column.name),
+            quote(name), quote(column.name)))
+
+
+def _prepare_table(connection, name, source, columns, keys):
+    """Create a table, or check that the existing table can hold the new
+    columns.
+
+    Return False if the table had to be dropped, which makes the rows of other
+    sources disappear.
+    """
+    signature = json.dumps([[c.name, _sql_type(c.type)] for c in columns])
+    refs = _find_references(columns, keys)
+    row = connection.execute('SELECT columns, refs FROM _tables '
+                             'WHERE name = ?', (name,)).fetchone()
+    if row is not None and row[0] == signature:
+        old_refs = json.loads(row[1])
+        if all(old_refs.get(k) == v for k, v in refs.items()):
+            return True
+        # New references are found. Rebuild the table and keep its rows.
+        refs.update(old_refs)
+        temp = quote(name + '.old')
+        connection.execute('ALTER TABLE %s RENAME TO %s' % (quote(name),
+                                                             temp))
+        indexes = connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND "
+            "tbl_name = ? AND sql IS NOT NULL", (name + '.old',)).fetchall()
+        for (index,) in indexes:
+            connection.execute('DROP INDEX %s' % quote(index))
+        _create_table(connection, name, source, columns, refs, keys)
+        connection.execute('INSERT INTO %s SELECT * FROM %s' % (quote(name),
+                                                                  temp))
+        connection.execute('DROP TABLE %s' % temp)
+        connection.execute('UPDATE _tables SET refs = ? WHERE name = ?',
+                           (json.dumps(refs), name))
+        return True
+
+    kept = row is None
+    if row is not None:
+        connection.execute('DROP TABLE IF EXISTS %s' % quote(name))
+        connection.execute('DELETE FROM _tables WHERE name = ?', (name,))
+    _create_table(connection, name, source, columns, refs, keys)
+    connection.execute('INSERT INTO _tables VALUES (?, ?, ?)',
+                       (name, signature, json.dumps(refs)))
+    return kept
+
+
+def _load_keys(connection):
+    return OrderedDict([(prefix, (table, column)) for prefix, table, column in
+                        connection.execute('SELECT * FROM _keys')])
+
+
+def _update_keys(connection, tables):
+    """Find the key column of GameData.bin tables."""
+    for prefix, table_name in KEY_PREFIXES.items():
+        if table_name not in tables:
+            continue
+        for column in tables[table_name]:
+            if column.type is basetypes.Label:
+                connection.execute('INSERT OR REPLACE INTO _keys '
+                                   'VALUES (?, ?, ?)',
+                                   (prefix, table_name, column.name))
+                break
+
+
+@profiling.profiled('db.refresh')
+def refresh(connection, sources, force=False):
+    """Load the sources which have changed since the last refresh.
+
+    `connection`: Database connection
+    `sources`: List of Source
+    `force`: Load every source
+
+    Return the names of the loaded sources.
+    """
+    loaded = []
+    with connection:
+        hashes = dict(connection.execute('SELECT name, hash FROM _sources'))
+        names = frozenset([source.name for source in sources])
+        # Forget deleted sources
+        for name in hashes:
+            if name not in names:
+                _delete_source(connection, name)
+
+        pending = list(sources)
+        while len(pending) > 0:
+            source = pending.pop(0)
+            digest = source.hash()
+            if not force and hashes.get(source.name) == digest:
+                continue
+            with profiling.phase('db.read') as p:
+                tables = OrderedDict(source.read())
+                p.nbytes = os.path.getsize(source.path)
+            if isinstance(source, GameDataSource):
+                _update_keys(connection, tables)
+            keys = _load_keys(connection)
+
+            for table_name, columns in tables.items():
+                if not _prepare_table(connection, table_name, source, columns,
+                                      keys):
+                    # Reload every source of this table
+                    for other in sources:
+                        if other is not source and \
+                                table_name in other.tables and \
+                                other not in pending:
+                            pending.append(other)
+                            hashes.pop(other.name, None)
+                _insert(connection, table_name, source, columns)
+            connection.execute('INSERT OR REPLACE INTO _sources VALUES (?, ?)',
+                               (source.name, digest))
+            hashes[source.name] = digest
+            loaded.append(source.name)
+    return loaded
+
+
+def _where(source):
+    if len(source.keys) == 0:
+        return '', ()
+    return (' WHERE ' + ' AND '.join([quote(k) + ' = ?' for k in source.keys]),
+            tuple(source.keys.values()))
+
+
+def _insert(connection, table_name, source, columns):
+    where, params = _where(source)
+    connection.execute('DELETE FROM %s%s' % (quote(table_name), where), params)
+    count = len(columns[0].values) if len(columns) > 0 else 0
+    data = [[value] * count for value in source.keys.values()]
+    data.append(list(xrange(count)))
+    data.extend([_to_sql(c.type, c.values) for c in columns])
+    with profiling.phase('db.insert', count):
+        connection.executemany('INSERT INTO %s VALUES (%s)' % (
+            quote(table_name), ', '.join(['?'] * len(data))), zip(*data))
+
+
+def _delete_source(connection, name):
+    """Delete the rows of a source which no longer exists."""
+    connection.execute('DELETE FROM _sources WHERE name = ?', (name,))
+    if name.startswith('Dispos/'):
+        connection.execute('DELETE FROM Dispos WHERE _map = ?',
+                           (name[len('Dispos/'):],))
+    elif name == 'castle_join.bin':
+        connection.execute('DELETE FROM castle_join')
+
+
+def check(connection):
+    """Find label references which cannot be resolved.
+
+    Return a list of (table, column, label, number of rows).
+    """
+    result = []
+    keys = _load_keys(connection)
+    for name, refs in connection.execute('SELECT name, refs FROM _tables')\
+            .fetchall():
+        for column, prefix in sorted(json.loads(refs).items()):
+            if prefix not in keys or keys[prefix] == (name, column):
+                continue
+            table, key = keys[prefix]
+            result.extend([(name, column, label, count) for label, count in
+                           connection.execute(
+                'SELECT %s, COUNT(*) FROM %s WHERE %s IS NOT NULL AND %s NOT '
+                'IN (SELECT %s FROM %s WHERE %s IS NOT NULL) GROUP BY %s' % (
+                    quote(column), quote(name), quote(column), quote(column),
+                    quote(key), quote(table), quote(key), quote(column)))])
+    return result
+
+
+def _read_rows(connection, table_name, source, columns):
+    """Read the rows of a source from the database, as lists of cells in
+    `columns` order."""
+    where, params = _where(source)
+    rows = connection.execute('SELECT %s FROM %s%s ORDER BY _row' % (
+        ', '.join([quote(c.name) for c in columns]), quote(table_name), where),
+        params).fetchall()
+    return [[_from_sql(c.type, v) for c, v in zip(columns, row)]
+            for row in rows]
+
+
+def _changed_cells(columns, rows, start=0):
+    """Compare database rows with the columns of a file.
+
+    `start`: Index of the first row to compare
+
+    Return a list of (row index, {column name: new value}).
+    """
+    changes = []
+    for i in xrange(start, min(len(rows), len(columns[0].values))):
+        values = {}
+        for j in xrange(len(columns)):
+            if rows[i][j] != columns[j].values[i]:
+                values[columns[j].name] = rows[i][j]
+        if len(values) > 0:
+            changes.append((i, values))
+    return changes
+
+
+def _import_gamedata(connection, source, transaction):
+    game_data = gamedata.load_file(source.path)
+    modules = source.modules()
+    names = list(modules.keys())
+
+    # Compare with the file before appending anything: appending moves
+    # data, so non-label pointers change even if nobody has edited them.
+    tables = OrderedDict()
+    for table_name, module in modules.items():
+        columns = module.read_columns(game_data)
+        rows = _read_rows(connection, table_name, source, columns)
+        if len(rows) < module.count:
+            raise ValueError('%s: rows cannot be removed.' % table_name)
+        if len(rows) > module.count and \
+                table_name not in gamedata_module.MODULE_FILES:
+            raise ValueError('%s: rows cannot be added.' % table_name)
+        tables[table_name] = (columns, rows, _changed_cells(columns, rows))
+
+    appended = [] # (table name, IDs, names, data size difference)
+    for index in xrange(len(names)):
+        table_name = names[index]
+        module = modules[table_name]
+        columns, rows, changes = tables[table_name]
+        new_rows = rows[module.count:]
+        if len(new_rows) == 0:
+            continue
+        info = game_data.get_table_info(table_name)
+        id_column = [e.offset for e in module.entries].index(info.id_offset)
+        label_column = [c.type for c in columns].index(basetypes.Label)
+        ids = [row[id_column] for row in new_rows]
+        labels = [row[label_column].split('_', 1) for row in new_rows]
+        if any(len(label) != 2 for label in labels):
+            raise ValueError('%s: invalid label of a new row.' % table_name)
+        new_names = [label[1] for label in labels]
+        game_data.append(table_name, ids, new_names)
+        # Same as ModuleProject.shift_offsets
+        diff = info.size * len(ids)
+        appended.append((table_name, ids, new_names, diff))
+        for later in names[index + 1:]:
+            modules[later].offset += diff
+        old_count = module.count
+        module.count += len(ids)
+        changes.extend(_changed_cells(module.read_columns(game_data), rows,
+                                      old_count))
+
+    changed = len(appended) > 0
+    for table_name, (columns, rows, changes) in tables.items():
+        types = dict([(c.name, c.type) for c in columns])
+        for row, values in changes:
+            modules[table_name].write_row(game_data, row, values, types)
+            changed = True
+    if changed:
+        game_data.format()
+        transaction.write(source.path, game_data.tobin())
+    project = gamedata_module.ModuleProject(source.module_root, transaction)
+    for table_name, ids, new_names, diff in appended:
+        project.add(table_name, ids, new_names, diff)
+    project.save()
+    return changed
+
+
+def _import_dispos(connection, source, transaction):
+    module = nightmare.load_module(source.paths[1])
+    binfile = bin.load_file(source.path)
+    columns = module.read_columns(binfile)
+    rows = _read_rows(connection, 'Dispos', source, columns)
+    if len(rows) != module.count:
+        raise ValueError('%s: rows cannot be added or removed.' % source.name)
+    types = dict([(c.name, c.type) for c in columns])
+    changes = _changed_cells(columns, rows)
+    for row, values in changes:
+        module.write_row(binfile, row, values, types)
+    if len(changes) > 0:
+        binfile.format()
+        transaction.write(source.path, binfile.tobin())
+    return len(changes) > 0
+
+
+def _import_castle_join(connection, source, transaction):
+    cj = castle_join.load_bin(source.path)
+    columns = cj.characters.tocolumns()
+    rows = _read_rows(connection, 'castle_join', source, columns)
+    if len(rows) == len(columns[0].values) and \
+            len(_changed_cells(columns, rows)) == 0:
+        return False
+    types = [c.type for c in columns]
+    cj.characters = castle_join.CharacterList(
+        [[t(v) for t, v in zip(types, row)] for row in rows])
+    transaction.write(source.path, cj.tobin())
+    return True
+
+
+@profiling.profiled('db.import')
+def import_database(connection, sources, root=''):
+    """Write edited rows back to the source files.
+
+    Only sources whose files have not changed since the last refresh are
+    written; run refresh() first to pick up the other ones. All files are
+    replaced in a single atomic.Transaction, whose journal is kept in `root`:
+    if any source cannot be written, no file is changed.
+
+    Return the names of the changed sources.
+    """
+    hashes = dict(connection.execute('SELECT name, hash FROM _sources'))
+    changed = []
+    with atomic.Transaction(root) as transaction:
+        for source in sources:
+            if source.name not in hashes:
+                continue
+            if source.hash() != hashes[source.name]:
+                raise ValueError('%s was changed after the last refresh.' %
+                                 source.name)
+            if isinstance(source, GameDataSource):
+                result = _import_gamedata(connection, source, transaction)
+            elif isinstance(source, DisposSource):
+                result = _import_dispos(connection, source, transaction)
+            else:
+                result = _import_castle_join(connection, source, transaction)
+            if result:
+                changed.append(source.name)
+    return changed
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['export', 'import', 'query',
+                                            'check'])
+    parser.add_argument('sql', nargs='?', help='(query) SQL statement')
+    parser.add_argument('--db', default=DEFAULT_PATH,
+                        help='database file (default: %s)' % DEFAULT_PATH)
+    parser.add_argument('--root', default='.',
+                        help='folder which contains GameData.bin, the modules '
+                        'and the Dispos folder (default: current folder)')
+    parser.add_argument('--force', action='store_true',
+                        help='(export) reload every file')
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    profiling.setup(args.profile)
+
+    connection = connect(args.db)
+    sources = find_sources(args.root)
+    if args.command == 'export':
+        loaded = refresh(connection, sources, args.force)
+        print('%d of %d file(s) were loaded into %s.' % (
+            len(loaded), len(sources), args.db))
+    elif args.command == 'import':
+        try:
+            changed = import_database(connection, sources, args.root)
+        except (ValueError, TypeError, KeyError) as e:
+            print('Error: %s' % e)
+            exit(1)
+        # Read the written files again, so the database matches them
+        refresh(connection, sources)
+        for name in changed:
+            print('%s was updated.' % name)
+        print('%d file(s) were updated.' % len(changed))
+    elif args.command == 'query':
+        if args.sql is None:
+            parser.error('query requires an SQL statement')
+        cursor = connection.execute(args.sql)
+        if cursor.description is not None:
+            print('\t'.join([d[0] for d in cursor.description]))
+            for row in cursor:
+                print('\t'.join(['NULL' if v is None else unicode(v)
+                                 for v in row]))
+        connection.commit()
+    else:
+        problems = check(connection)
+        for table, column, label, count in problems:
+            print('%s.%s: %s (%d row(s))' % (table, column, label, count))
+        print('%d unresolved reference(s).' % len(problems))
@@ -0,0 +1,473 @@
+#!/usr/bin/env python2
+#
+# The MIT License
+#
+# Copyright (c) 2017 RainThunder.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+"""Read and edit unit placements of Dispos maps.
+
+The data region of a Dispos file starts with a group table: one 12-byte
+entry (name pointer, data offset, unit count) per group (Player, Enemy,
+Ally, Reinforce01, ...), terminated by a null entry. The units of every group
+are 0x8C-byte rows. A DisposMap decodes the fields which describe a placement
+(team, coordinates, unit flags) of all rows into lists, keeps a per-tile
+index of the units, and writes all edits back with a single pack over the
+unit table.
+
+Row layout (see Dispos/<map>/<map>.nmm for the full layout):
+    0x0  PID pointer        0x8  Team            0x9  Level (0: default)
+    0x4  Class pointer      0xA  X / Y Coordinate 1
+                            0xC  X / Y Coordinate 2
+    0x10 Unit flag 1 - 8    0x11 Unit flag 9 - 16
+
+Usage:
+    python dispos.py check [maps ...] [--dispos Dispos]
+    python dispos.py translate MAP DX DY [--team N | --group NAME]
+    python dispos.py mirror MAP [--vertical] [--axis N] [--team N | ...]
+
+Example:
+    >>> import dispos
+    >>> dispos_map = dispos.load_file('Dispos/A005/A005.bin')
+    >>> enemies = dispos_map.find(team=dispos.ENEMY)
+    >>> dispos_map.translate(enemies, 1, 0)
+    >>> dispos_map.write(dispos_map.binfile)
+"""
+
+from __future__ import print_function, unicode_literals
+import os
+import sys
+from collections import namedtuple
+from struct import pack_into, unpack_from
+if sys.version_info[0] > 2:
+    xrange = range
+
+import atomic
+import bin
+import profiling
+
+
+ROW_SIZE = 0x8C
+GROUP_ENTRY_SIZE = 0xC
+
+PLAYER, ENEMY, ALLY = 0, 1, 2
+
+# Coordinate of units which are not on the map
+OFF_MAP = 0xFF
+
+# Unit flag 9 - 11: the unit is on Normal / Hard / Lunatic difficulty
+DIFFICULTY_MASK = 0x7
+
+# Offsets of the placement fields in a row
+PLACEMENT_OFFSET = 0x8
+PLACEMENT_FORMAT = '<6B' # Team, level, X1, Y1, X2, Y2
+FLAGS_OFFSET = 0x10
+FLAGS_FORMAT = '<H' # Unit flag 1 - 16
+
+# Item 0 - 4 pointers; every item is followed by 4 bytes of item flags
+ITEM_OFFSETS = [0x14 + i * 8 for i in xrange(5)]
+ITEM_FLAG_DROP = 0x1 # Item flag 1: droppable
+SKILL_OFFSETS = [0x3C + i * 4 for i in xrange(5)]
+# AI labels; every label is followed by a parameter pointer
+AI_OFFSETS = [('AI_AC', 0x54), ('AI_MI', 0x5C), ('AI_AT', 0x64),
+              ('AI_MV', 0x6C)]
+
+
+class Group(namedtuple('Group', ['name', 'offset', 'count', 'start'])):
+    """A group of units.
+
+    `name`: Group name, e.g. u'Enemy' or u'Reinforce01'
+    `offset`: Offset of the first row in the data region
+    `count`: Number of units
+    `start`: Index of the first unit in the map
+    """
+    __slots__ = ()
+
+
+class Unit(namedtuple('Unit', ['index', 'group', 'pid', 'job', 'team',
+                               'level', 'x1', 'y1', 'x2', 'y2', 'flags'])):
+    """A snapshot of a unit. `job` is the class label (JID_...), u'NULL' if
+    the unit keeps the class of its character."""
+    __slots__ = ()
+
+
+class DisposMap(object):
+    """Unit placements of a Dispos file.
+
+    `binfile`: A bin.BinFile object of the Dispos file
+
+    Units are numbered in file order. The placement of unit `i` is
+    `teams[i]`, `positions[i]` ([X1, Y1, X2, Y2]) and `flags[i]`.
+    """
+
+    def __init__(self, binfile):
+        self.binfile = binfile
+        data = binfile.data
+        self.groups = []
+        offset = 0
+        start = 0
+        end = len(data)
+        while offset + GROUP_ENTRY_SIZE <= end:
+            name_ptr, row_offset, count = unpack_from('<3I', data, offset)
+            if name_ptr == 0 and row_offset == 0:
+                break
+            self.groups.append(Group(binfile.get_label(name_ptr), row_offset,
+                                     count, start))
+            start += count
+            end = min(end, row_offset)
+            offset += GROUP_ENTRY_SIZE
+
+        self.offsets = []
+        self.teams = []
+        self.levels = []
+        self.positions = []
+        self.flags = []
+        for group in self.groups:
+            for i in xrange(group.count):
+                row = group.offset + i * ROW_SIZE
+                placement = unpack_from(PLACEMENT_FORMAT, data,
+                                        row + PLACEMENT_OFFSET)
+                self.offsets.append(row)
+                self.teams.append(placement[0])
+                self.levels.append(placement[1])
+                self.positions.append(list(placement[2:]))
+                self.flags.append(unpack_from(FLAGS_FORMAT, data,
+                                              row + FLAGS_OFFSET)[0])
+        self.__grids = {}
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __iter__(self):
+        return (self.unit(i) for i in xrange(len(self)))
+
+    def group_of(self, index):
+        """Get the Group of a unit."""
+        for group in self.groups:
+            if group.start <= index < group.start + group.count:
+                return group
+        raise IndexError(index)
+
+    def _label(self, index, field):
+        offset = self.offsets[index] + field
+        return self.binfile.get_label(unpack_from('<I', self.binfile.data,
+                                                  offset)[0])
+
+    def pid(self, index):
+        """Get the PID label of a unit."""
+        return self._label(index, 0x0)
+
+    def job(self, index):
+        """Get the class label of a unit, u'NULL' if it has none."""
+        return self._label(index, 0x4)
+
+    def items(self, index):
+        """Get the items of a unit, as a list of (item label, droppable)."""
+        data = self.binfile.data
+        result = []
+        for field in ITEM_OFFSETS:
+            label = self._label(index, field)
+            if label != 'NULL':
+                flags = unpack_from('<B', data,
+                                    self.offsets[index] + field + 4)[0]
+                result.append((label, bool(flags & ITEM_FLAG_DROP)))
+        return result
+
+    def skills(self, index):
+        """Get the skill labels of a unit."""
+        return [label for label in [self._label(index, field)
+                                    for field in SKILL_OFFSETS]
+                if label != 'NULL']
+
+    def ai(self, index):
+        """Get the AI labels of a unit, as a dict of AI field ('AI_AC',
+        'AI_MI', 'AI_AT' or 'AI_MV') and (label, parameter label)."""
+        return dict([(name, (self._label(index, field),
+                             self._label(index, field + 4)))
+                     for name, field in AI_OFFSETS])
+
+    def unit(self, index):
+        """Get a Unit snapshot."""
+        return Unit(index, self.group_of(index).name, self.pid(index),
+                    self.job(index), self.teams[index], self.levels[index],
+                    *(self.positions[index] + [self.flags[index]]))
+
+    ##########################################################################
+    # Lookup
+    ##########################################################################
+    def grid(self, which=1):
+        """Get the per-tile occupancy as a dict of (x, y): unit indices.
+        Units off the map are left out.
+
+        `which`: 1 or 2, the coordinate pair
+        """
+        grid = self.__grids.get(which)
+        if grid is None:
+            k = (which - 1) * 2
+            grid = {}
+            for i in xrange(len(self.positions)):
+                p = self.positions[i]
+                if p[k] != OFF_MAP:
+                    grid.setdefault((p[k], p[k + 1]), []).append(i)
+            self.__grids[which] = grid
+        return grid
+
+    def at(self, x, y, which=1):
+        """Get the indices of the units on a tile."""
+        return list(self.grid(which).get((x, y), []))
+
+    def find(self, team=None, pid=None, job=None, group=None):
+        """Get the indices of the units which match all given conditions.
+
+        `team`: Team number (PLAYER, ENEMY, ALLY)
+        `pid`, `job`: PID / class label
+        `group`: Group name
+        """
+        indices = xrange(len(self))
+        if group is not None:
+            indices = [i for g in self.groups if g.name == group
+                       for i in xrange(g.start, g.start + g.count)]
+        if team is not None:
+            indices = [i for i in indices if self.teams[i] == team]
+        if pid is not None:
+            indices = [i for i in indices if self.pid(i) == pid]
+        if job is not None:
+            indices = [i for i in indices if self.job(i) == job]
+        return list(indices)
+
+    def overlaps(self, which=1):
+        """Find units which spawn on the same tile.
+
+        Units overlap if they are in the same group and can be on the map on
+        the same difficulty (units without difficulty flags are on all
+        difficulties). Units of different groups (e.g. reinforcements) spawn
+        at different times and do not overlap.
+
+        Return a list of ((x, y), [unit indices]), sorted by tile.
+        """
+        groups = []
+        for g in self.groups:
+            groups.extend([g.start] * g.count)
+        result = []
+        for tile, indices in self.grid(which).items():
+            if len(indices) < 2:
+                continue
+            clashing = set()
+            for a in xrange(len(indices)):
+                i = indices[a]
+                for j in indices[a + 1:]:
+                    if groups[i] == groups[j] and \
+                            self._difficulties(i) & self._difficulties(j):
+                        clashing.update((i, j))
+            if clashing:
+                result.append((tile, sorted(clashing)))
+        result.sort()
+        return result
+
+    def _difficulties(self, index):
+        mask = self.flags[index] >> 8 & DIFFICULTY_MASK
+        return mask or DIFFICULTY_MASK
+
+    ##########################################################################
+    # Editing
+    ##########################################################################
+    def _check(self, values):
+        for value in values:
+            if not 0 <= value < OFF_MAP:
+                raise ValueError('coordinate out of range: %d' % value)
+
+    def set_position(self, index, x, y, which=1):
+        """Move a unit to a tile."""
+        self._check((x, y))
+        k = (which - 1) * 2
+        self.positions[index][k:k + 2] = [x, y]
+        self.__grids.pop(which, None)
+
+    def translate(self, indices, dx, dy, which=(1, 2)):
+        """Move some units by (dx, dy).
+
+        `which`: Coordinate pairs to move
+        """
+        self.transform(indices, lambda x, y: (x + dx, y + dy), which)
+
+    def mirror(self, indices, vertical=False, axis=None, which=(1, 2)):
+        """Mirror some units.
+
+        `vertical`: Mirror the Y coordinates instead of the X coordinates
+        `axis`: New coordinate = axis - old coordinate. Default: the sum of
+            the smallest and largest coordinates of the units, so that they
+            stay in their bounding box
+        """
+        k = 1 if vertical else 0
+        if axis is None:
+            values = [self.positions[i][(w - 1) * 2 + k]
+                      for i in indices for w in which
+                      if self.positions[i][(w - 1) * 2] != OFF_MAP]
+            if not values:
+                return
+            axis = min(values) + max(values)
+        if vertical:
+            self.transform(indices, lambda x, y: (x, axis - y), which)
+        else:
+            self.transform(indices, lambda x, y: (axis - x, y), which)
+
+    def transform(self, indices, function, which=(1, 2)):
+        """Apply a function (x, y) -> (x, y) to the positions of some units.
+
+        Units off the map stay there. Either all units are moved, or none
+        of them if a new coordinate is out of range.
+        """
+        if isinstance(which, int):
+            which = (which,)
+        new = []
+        for i in indices:
+            position = list(self.positions[i])
+            for w in which:
+                k = (w - 1) * 2
+                if position[k] != OFF_MAP:
+                    position[k:k + 2] = function(position[k], position[k + 1])
+                    self._check(position[k:k + 2])
+            new.append((i, position))
+        for i, position in new:
+            self.positions[i] = position
+        for w in which:
+            self.__grids.pop(w, None)
+
+    def move_team(self, team, dx, dy, which=(1, 2)):
+        """Move all units of a team by (dx, dy)."""
+        self.translate(self.find(team=team), dx, dy, which)
+
+    def set_team(self, indices, team):
+        """Change the team of some units."""
+        for i in indices:
+            self.teams[i] = team
+
+    @profiling.profiled('dispos.write')
+    def write(self, binfile):
+        """Write the placements to a BinFile, with a single pack over the unit
+        table.
+
+        `binfile`: The Dispos BinFile (or an unmodified copy of it)
+        """
+        if not self.offsets:
+            return
+        start = min(self.offsets)
+        end = max(self.offsets) + ROW_SIZE
+        table = bytearray(binfile.data[start:end])
+        for i in xrange(len(self.offsets)):
+            pack_into(PLACEMENT_FORMAT, table,
+                      self.offsets[i] - start + PLACEMENT_OFFSET,
+                      self.teams[i], self.levels[i], *self.positions[i])
+            pack_into(FLAGS_FORMAT, table,
+                      self.offsets[i] - start + FLAGS_OFFSET, self.flags[i])
+        binfile.pack_values([(start, '%ds' % len(table), bytes(table))])
+
+
+def load_file(path):
+    """Load a Dispos file. Return a DisposMap object."""
+    return DisposMap(bin.load_file(path))
+
+
+def map_paths(dispos_dir='Dispos', names=None):
+    """Get the paths of the .bin files of a Dispos folder, as a list of
+    (map name, path)."""
+    if names is None:
+        names = sorted(os.listdir(dispos_dir))
+    result = []
+    for name in names:
+        path = os.path.join(dispos_dir, name, name + '.bin')
+        if os.path.isfile(path):
+            result.append((name, path))
+    return result
+
+
+@profiling.profiled('dispos.check')
+def check_all(dispos_dir='Dispos', names=None, which=1):
+    """Find the overlapping units of all maps.
+
+    Return a list of (map name, DisposMap.overlaps()) for the maps which
+    have overlapping units.
+    """
+    result = []
+    for name, path in map_paths(dispos_dir, names):
+        overlaps = load_file(path).overlaps(which)
+        if overlaps:
+            result.append((name, overlaps))
+    return result
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dispos', default='Dispos',
+                        help='path to the Dispos folder')
+    profiling.add_argument(parser)
+    subparsers = parser.add_subparsers(dest='command')
+    check_parser = subparsers.add_parser(
+        'check', help='list overlapping units')
+    check_parser.add_argument('maps', nargs='*',
+                              help='map names (default: all maps)')
+    check_parser.add_argument('--which', type=int, choices=[1, 2], default=1,
+                              help='coordinate pair (default: 1)')
+    for command in ('translate', 'mirror'):
+        subparser = subparsers.add_parser(command)
+        subparser.add_argument('map', help='map name, e.g. A005')
+        if command == 'translate':
+            subparser.add_argument('dx', type=int)
+            subparser.add_argument('dy', type=int)
+        else:
+            subparser.add_argument('--vertical', action='store_true',
+                                   help='mirror the Y coordinates')
+            subparser.add_argument('--axis', type=int, default=None,
+                                   help='new coordinate = AXIS - old '
+                                   'coordinate (default: keep the units in '
+                                   'their bounding box)')
+        subparser.add_argument('--team', type=int, default=None,
+                               help='only move the units of a team '
+                               '(0: player, 1: enemy, 2: ally)')
+        subparser.add_argument('--group', default=None,
+                               help='only move the units of a group, e.g. '
+                               'Reinforce01')
+        subparser.add_argument('--pid', default=None,
+                               help='only move the units with a PID')
+    args = parser.parse_args()
+    profiling.setup(args.profile)
+
+    if args.command == 'check':
+        for name, overlaps in check_all(args.dispos, args.maps or None,
+                                        args.which):
+            for (x, y), indices in overlaps:
+                print('%s (%d, %d): units %s' % (
+                    name, x, y, ', '.join([str(i) for i in indices])))
+    elif args.command in ('translate', 'mirror'):
+        path = os.path.join(args.dispos, args.map, args.map + '.bin')
+        dispos_map = load_file(path)
+        indices = dispos_map.find(team=args.team, group=args.group,
+                                  pid=args.pid)
+        if args.command == 'translate':
+            dispos_map.translate(indices, args.dx, args.dy)
+        else:
+            dispos_map.mirror(indices, args.vertical, args.axis)
+        dispos_map.write(dispos_map.binfile)
+        atomic.write_file(path, dispos_map.binfile.tobin())
+        print('%d units were moved.' % len(indices))
+    else:
+        parser.print_help()
@@ -0,0 +1,339 @@
+#!/usr/bin/env python2
+#
+# The MIT License
+#
+# Copyright (c) 2017 RainThunder.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+"""Compare the Dispos maps of every route.
+
+Every map is decoded with dispos.DisposMap and summarized: number of units
+per team and per difficulty, reinforcements, bosses, enemy levels, and the
+classes, items, skills and AI labels of the enemies. The summaries are then
+merged per route (Birthright, Conquest, Revelation, paralogues, invasions,
+...) or per chapter.
+
+Maps are decoded in parallel. The summary of every map is cached with the
+hash of its file (default: Dispos.statscache, next to the Dispos folder), so
+only the maps which changed are decoded again.
+
+Usage:
+    python dispos_stats.py [maps ...] [--dispos Dispos] [--by route|chapter]
+                           [--json] [--no-cache]
+
+Example:
+    >>> import dispos_stats
+    >>> stats = dispos_stats.collect('Dispos')
+    >>> routes = dispos_stats.aggregate(stats, 'route')
+    >>> routes['Conquest']['enemies']
+"""
+
+from __future__ import print_function
+import hashlib
+import json
+import os
+import re
+import sys
+from collections import Counter
+if sys.version_info[0] > 2:
+    xrange = range
+    unicode = str
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+import atomic
+import bin
+import dispos
+import profiling
+
+
+CACHE_VERSION = 1
+
+# Map name prefixes (see Dispos/README.md). Invasion maps have a Y after the
+# route letter (AY01, BY01, ...).
+ROUTES = {'A': 'Birthright', 'B': 'Conquest', 'C': 'Revelation',
+          'X': 'Paralogue', 'E': 'DLC', 'P': 'Branch chapter',
+          'Y': 'Castle invasion', 'Z': 'Debug'}
+
+DIFFICULTIES = ['normal', 'hard', 'lunatic']
+UNIT_FLAG_BOSS = 1 << 13 # Unit flag 14
+TEAMS = {dispos.PLAYER: 'players', dispos.ENEMY: 'enemies',
+         dispos.ALLY: 'allies'}
+
+# Counters of labels, merged by adding
+COUNTERS = ['classes', 'items', 'drops', 'skills', 'AI_AC', 'AI_MI', 'AI_AT',
+            'AI_MV']
+
+
+def route_of(name):
+    """Get the route of a map name, e.g. 'Conquest' for B010."""
+    if name[1:2] == 'Y':
+        return ROUTES['Y']
+    return ROUTES.get(name[:1], name[:1])
+
+
+def chapter_of(name):
+    """Get the chapter of a map name, without the Scout / Versus suffix."""
+    match = re.match(r'^([A-Z]+\d+)', name)
+    return match.group(1) if match else name
+
+
+def _class_name(pid, job):
+    # Generic enemies are named after their class: PID_<map>_<class>
+    if job != u'NULL':
+        return job.split(u'_', 1)[-1]
+    return pid.split(u'_', 2)[-1]
+
+
+def _empty_stats():
+    stats = {'maps': 0, 'players': 0, 'enemies': 0, 'allies': 0,
+             'reinforcements': 0, 'bosses': 0, 'default_levels': 0,
+             'levels': [0, 0, None, None]} # count, sum, min, max
+    for difficulty in DIFFICULTIES:
+        stats['enemies_' + difficulty] = 0
+    for key in COUNTERS:
+        stats[key] = {}
+    return stats
+
+
+def summarize(dispos_map):
+    """Summarize a map.
+
+    `dispos_map`: dispos.DisposMap object
+
+    Return a dict which can be saved as JSON.
+    """
+    stats = _empty_stats()
+    stats['maps'] = 1
+    counters = dict([(key, Counter()) for key in COUNTERS])
+    levels = []
+    for group in dispos_map.groups:
+        reinforcement = group.name.startswith(u'Reinforce')
+        for i in xrange(group.start, group.start + group.count):
+            team = dispos_map.teams[i]
+            if team in TEAMS:
+                stats[TEAMS[team]] += 1
+            if team != dispos.ENEMY:
+                continue
+            if reinforcement:
+                stats['reinforcements'] += 1
+            flags = dispos_map.flags[i]
+            if flags & UNIT_FLAG_BOSS:
+                stats['bosses'] += 1
+            mask = flags >> 8 & dispos.DIFFICULTY_MASK or \
+                dispos.DIFFICULTY_MASK
+            for bit, difficulty in enumerate(DIFFICULTIES):
+                if mask >> bit & 1:
+                    stats['enemies_' + difficulty] += 1
+            if dispos_map.levels[i]:
+                levels.append(dispos_map.levels[i])
+            else:
+                stats['default_levels'] += 1
+            counters['classes'][_class_name(dispos_map.pid(i),
+                                            dispos_map.job(i))] += 1
+            for label, droppable in dispos_map.items(i):
+                counters['items'][label] += 1
+                if droppable:
+                    counters['drops'][label] += 1
+            for label in dispos_map.skills(i):
+                counters['skills'][label] += 1
+            for field, (label, parameter) in dispos_map.ai(i).items():
+                counters[field][label] += 1
+    if levels:
+        stats['levels'] = [len(levels), sum(levels), min(levels),
+                           max(levels)]
+    for key in COUNTERS:
+        stats[key] = dict(counters[key])
+    return stats
+
+
+def merge(a, b):
+    """Merge two summaries. Return a new summary."""
+    result = {}
+    for key, value in a.items():
+        other = b[key]
+        if key in COUNTERS:
+            counter = Counter(value)
+            counter.update(other)
+            result[key] = dict(counter)
+        elif key == 'levels':
+            bounds = [v for v in (value[2], other[2]) if v is not None]
+            tops = [v for v in (value[3], other[3]) if v is not None]
+            result[key] = [value[0] + other[0], value[1] + other[1],
+                           min(bounds) if bounds else None,
+                           max(tops) if tops else None]
+        else:
+            result[key] = value + other
+    return result
+
+
+def aggregate(stats, by='route'):
+    """Merge the summaries of some maps per route or per chapter.
+
+    `stats`: Dict of map names and summaries, as returned by collect()
+    `by`: 'route' or 'chapter'
+
+    Return a dict of route / chapter names and summaries.
+    """
+    key_of = route_of if by == 'route' else chapter_of
+    result = {}
+    for name in sorted(stats):
+        key = key_of(name)
+        result[key] = merge(result[key], stats[name]) if key in result \
+            else merge(_empty_stats(), stats[name])
+    return result
+
+
+##############################################################################
+# Cache
+##############################################################################
+def get_cache_path(dispos_dir):
+    """Get the default cache path of a Dispos folder."""
+    return os.path.normpath(os.path.abspath(dispos_dir)) + '.statscache'
+
+
+def load_cache(path):
+    """Load a cache. Return an empty cache if it does not exist or is
+    invalid."""
+    try:
+        with open(path, 'r') as file:
+            cache = json.load(file)
+    except (IOError, OSError, ValueError):
+        return {}
+    if not isinstance(cache, dict) or cache.get('version') != CACHE_VERSION:
+        return {}
+    return cache.get('maps', {})
+
+
+def save_cache(path, maps):
+    """Save the summaries of the maps, with the hashes of their files."""
+    atomic.write_file(path, json.dumps({'version': CACHE_VERSION,
+                                        'maps': maps}, sort_keys=True),
+                      sync=False)
+
+
+@profiling.profiled('dispos_stats.collect')
+def collect(dispos_dir='Dispos', names=None, cache_path=None, jobs=None):
+    """Summarize the maps of a Dispos folder.
+
+    `names`: Map names. Default: all maps
+    `cache_path`: Cache file, or None to not use a cache
+    `jobs`: Number of threads. Default: min(32, CPU count + 4)
+
+    Return a dict of map names and summaries.
+    """
+    cache = load_cache(cache_path) if cache_path else {}
+
+    def run(item):
+        name, path = item
+        with open(path, 'rb') as file:
+            raw = file.read()
+        digest = hashlib.sha1(raw).hexdigest()
+        cached = cache.get(name)
+        if cached is not None and cached.get('hash') == digest:
+            return name, cached
+        return name, {'hash': digest,
+                      'stats': summarize(dispos.DisposMap(bin.load(raw)))}
+
+    paths = dispos.map_paths(dispos_dir, names)
+    if jobs is None:
+        jobs = min(32, (getattr(os, 'cpu_count', lambda: None)() or 1) + 4)
+    if ThreadPoolExecutor is None or jobs <= 1:
+        results = [run(item) for item in paths]
+    else:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(run, paths))
+
+    if cache_path:
+        # Drop the maps which are no longer in the folder
+        if names is not None:
+            paths = dispos.map_paths(dispos_dir)
+        current = set([name for name, path in paths])
+        entries = dict([(name, entry) for name, entry in cache.items()
+                        if name in current])
+        entries.update(results)
+        if entries != cache:
+            save_cache(cache_path, entries)
+    return dict([(name, entry['stats']) for name, entry in results])
+
+
+##############################################################################
+# Report
+##############################################################################
+def _top(counter, count=3):
+    items = sorted(counter.items(), key=lambda item: (-item[1], item[0]))
+    return ', '.join(['%s x%d' % item for item in items[:count]])
+
+
+def format_table(summaries):
+    """Format summaries (dict of names and summaries) as a text table."""
+    lines = ['%-16s %4s %7s %6s %6s %6s %5s %5s %13s  %s' % (
+        '', 'Maps', 'Enemies', 'Normal', 'Hard', 'Lunat.', 'Reinf', 'Boss',
+        'Level', 'Top classes')]
+    for name in sorted(summaries):
+        s = summaries[name]
+        count, total, low, high = s['levels']
+        level = ('%.1f (%d-%d)' % (total / float(count), low, high)
+                 if count else '-')
+        lines.append('%-16s %4d %7d %6d %6d %6d %5d %5d %13s  %s' % (
+            name[:16], s['maps'], s['enemies'], s['enemies_normal'],
+            s['enemies_hard'], s['enemies_lunatic'], s['reinforcements'],
+            s['bosses'], level, _top(s['classes'])))
+        lines.append('    AI_AT: %s; AI_MV: %s' % (_top(s['AI_AT']),
+                                                _top(s['AI_MV'])))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('maps', nargs='*',
+                        help='map names (default: all maps)')
+    parser.add_argument('--dispos', default='Dispos',
+                        help='path to the Dispos folder')
+    parser.add_argument('--by', choices=['route', 'chapter', 'map'],
+                        default='route', help='group the maps by route '
+                        '(default), chapter or not at all')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of threads which decode the maps')
+    parser.add_argument('--cache', default=None,
+                        help='cache file (default: DISPOS.statscache)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='do not read or write the cache')
+    parser.add_argument('--json', action='store_true',
+                        help='print the summaries as JSON')
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    profiling.setup(args.profile)
+
+    cache_path = None
+    if not args.no_cache:
+        cache_path = args.cache or get_cache_path(args.dispos)
+    stats = collect(args.dispos, args.maps or None, cache_path, args.jobs)
+    summaries = stats if args.by == 'map' else aggregate(stats, args.by)
+    if args.json:
+        print(json.dumps(summaries, indent=2, sort_keys=True,
+                         ensure_ascii=False))
+    else:
+        print(format_table(summaries))
@@ -0,0 +1,295 @@
+#!/usr/bin/env python2
+#
+# The MIT License
+#
+# Copyright (c) 2017 RainThunder.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+"""Export GameData.bin tables, Dispos units and castle_join.bin rows to
+a typed columnar format.
+
+If pyarrow is available, each table is written to an Arrow IPC file (.arrow),
+which can be memory-mapped with `pyarrow.memory_map`. Otherwise, NumPy is used
+and each table is written to an uncompressed .npz file. Labels are stored as
+dictionary-encoded columns in both formats.
+
+Tables can also be written as JSON Lines (.jsonl, one object per row), which
+does not need any third-party package.
+
+Layout of a .npz file:
+- `__schema__`: JSON list of {"name", "type", "dictionary"} objects.
+- `<column>`: Column values. Label columns store int32 dictionary indices.
+- `<column>.dictionary`: Distinct labels of a label column.
+
+Usage:
+    python export.py output_dir [--format arrow|npz|jsonl] [--gamedata FILE]
+        [--dispos DIR] [--castle-join FILE]
+
+All paths default to the layout of this repository; missing inputs are
+skipped.
+"""
+
+from __future__ import print_function, unicode_literals
+import codecs
+import json
+import os
+import sys
+if sys.version_info[0] > 2:
+    xrange = range
+    unicode = str
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+if pyarrow is not None:
+    _ARROW_TYPES = {
+        'B': pyarrow.uint8, 'b': pyarrow.int8,
+        'H': pyarrow.uint16, 'h': pyarrow.int16,
+        'I': pyarrow.uint32, 'i': pyarrow.int32
+    }
+
+import atomic
+import basetypes
+import bin
+import nightmare
+
+_encode_string = json.encoder.encode_basestring_ascii
+
+
+def default_format():
+    """Get the best available export format."""
+    if pyarrow is not None:
+        return 'arrow'
+    elif numpy is not None:
+        return 'npz'
+    raise ImportError('pyarrow or numpy is required for exporting.')
+
+
+def _dictionary_encode(values):
+    """Split a list of labels into dictionary indices and distinct labels."""
+    dictionary = []
+    index = {}
+    indices = []
+    for value in values:
+        if value not in index:
+            index[value] = len(dictionary)
+            dictionary.append(unicode(value))
+        indices.append(index[value])
+    return indices, dictionary
+
+
+def _type_name(datatype):
+    if datatype is bytes:
+        return 'bytes'
+    elif datatype is bool:
+        return 'bool'
+    return datatype.__name__
+
+
+def write_arrow(path, columns):
+    """Write a list of basetypes.Column to an Arrow IPC file."""
+    arrays = []
+    names = []
+    for column in columns:
+        if column.type is basetypes.Label:
+            array = pyarrow.array([unicode(v) for v in column.values],
+                                  pyarrow.string()).dictionary_encode()
+        elif column.type is bytes:
+            array = pyarrow.array(column.values, pyarrow.binary())
+        elif column.type is bool:
+            array = pyarrow.array(column.values, pyarrow.bool_())
+        else:
+            array = pyarrow.array(column.values,
+                                  _ARROW_TYPES[column.type.fstring]())
+        arrays.append(array)
+        names.append(column.name)
+    table = pyarrow.Table.from_arrays(arrays, names=names)
+    with atomic.atomic_path(path) as temp:
+        with pyarrow.OSFile(temp, 'wb') as sink:
+            with pyarrow.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+
+def write_npz(path, columns):
+    """Write a list of basetypes.Column to an uncompressed .npz file."""
+    arrays = {}
+    schema = []
+    for column in columns:
+        dictionary = column.type is basetypes.Label
+        if dictionary:
+            indices, labels = _dictionary_encode(column.values)
+            arrays[column.name] = numpy.array(indices, dtype='<i4')
+            arrays[column.name + '.dictionary'] = numpy.array(labels,
+                                                              dtype='U')
+        elif column.type is bytes:
+            arrays[column.name] = numpy.array(column.values, dtype='S')
+        elif column.type is bool:
+            arrays[column.name] = numpy.array(column.values, dtype='?')
+        else:
+            arrays[column.name] = numpy.array(column.values,
+                                              dtype='<' + column.type.fstring)
+        schema.append({'name': column.name, 'type': _type_name(column.type),
+                       'dictionary': dictionary})
+    arrays['__schema__'] = numpy.array(json.dumps(schema))
+    with atomic.atomic_open(path, 'wb') as file:
+        numpy.savez(file, **arrays)
+
+
+def write_jsonl(path, columns):
+    """Write a list of basetypes.Column to a JSON Lines file."""
+    template = '{' + ', '.join([json.dumps(c.name).replace('%', '%%') +
+                                ': %s' for c in columns]) + '}\n'
+    encoded = []
+    for column in columns:
+        if column.type is basetypes.Label:
+            encoded.append([_encode_string(v)
+                            for v in column.values])
+        elif column.type is bytes:
+            encoded.append(['"' + codecs.encode(v, 'hex').decode('ascii') +
+                            '"' for v in column.values])
+        elif column.type is bool:
+            encoded.append(['true' if v else 'false' for v in column.values])
+        else:
+            encoded.append(['%d' % v for v in column.values])
+    with atomic.atomic_path(path) as temp:
+        with codecs.open(temp, 'w', 'utf-8') as file:
+            for row in zip(*encoded):
+                file.write(template % row)
+
+
+def write_columns(path, columns, format):
+    """Write a table to `path` + extension of the chosen format.
+
+    Return the output path.
+    """
+    if format == 'arrow':
+        path += '.arrow'
+        write_arrow(path, columns)
+    elif format == 'npz':
+        path += '.npz'
+        write_npz(path, columns)
+    elif format == 'jsonl':
+        path += '.jsonl'
+        write_jsonl(path, columns)
+    else:
+        raise ValueError('Unsupported format: ' + format)
+    return path
+
+
+def export_gamedata(path, module_root, outdir, format):
+    """Export all GameData.bin tables which have a Nightmare module.
+
+    `path`: Path to GameData.bin
+    `module_root`: Folder which contains the module folders
+    `outdir`: Output folder
+    `format`: 'arrow', 'npz' or 'jsonl'
+    """
+    import gamedata_module # Only needed for the module list
+    game_data = bin.load_file(path)
+    outputs = []
+    for table_name, module_path in gamedata_module.MODULE_ORDER:
+        module = nightmare.load_module(os.path.join(module_root, module_path))
+        columns = module.read_columns(game_data)
+        outputs.append(write_columns(
+            os.path.join(outdir, table_name.replace(' ', '')), columns, format))
+    return outputs
+
+
+def export_dispos(dispos_dir, outdir, format):
+    """Export unit tables of all Dispos maps.
+
+    Each map folder must contain a <map>.bin file and a <map>.nmm module.
+    """
+    outputs = []
+    for name in sorted(os.listdir(dispos_dir)):
+        bin_path = os.path.join(dispos_dir, name, name + '.bin')
+        module_path = os.path.join(dispos_dir, name, name + '.nmm')
+        if not (os.path.isfile(bin_path) and os.path.isfile(module_path)):
+            continue
+        module = nightmare.load_module(module_path)
+        columns = module.read_columns(bin.load_file(bin_path))
+        outputs.append(write_columns(os.path.join(outdir, name), columns,
+                                     format))
+    return outputs
+
+
+def export_castle_join(path, outdir, format):
+    """Export castle_join.bin rows."""
+    import castle_join
+    characters = castle_join.load_bin(path).characters
+    if format == 'jsonl': # Keep nested cells
+        output = os.path.join(outdir, 'castle_join.jsonl')
+        with atomic.atomic_path(output) as temp:
+            with codecs.open(temp, 'w', 'utf-8') as file:
+                characters.tojsonlines(file)
+        return [output]
+    return [write_columns(os.path.join(outdir, 'castle_join'),
+                          characters.tocolumns(), format)]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('output', help='output folder')
+    parser.add_argument('-f', '--format', choices=['arrow', 'npz', 'jsonl'],
+                        default=None, help='output format (default: arrow if '
+                        'pyarrow is installed, npz otherwise)')
+    parser.add_argument('--gamedata', default='GameData.bin',
+                        help='path to GameData.bin')
+    parser.add_argument('--dispos', default='Dispos',
+                        help='path to the Dispos folder')
+    parser.add_argument('--castle-join', default='castle_join.bin',
+                        help='path to castle_join.bin')
+    args = parser.parse_args()
+
+    try:
+        format = args.format or default_format()
+    except ImportError as e:
+        print(e)
+        exit()
+
+    outputs = []
+    if os.path.isfile(args.gamedata):
+        outdir = os.path.join(args.output, 'GameData')
+        if not os.path.isdir(outdir):
+            os.makedirs(outdir)
+        module_root = os.path.dirname(os.path.abspath(args.gamedata))
+        outputs.extend(export_gamedata(args.gamedata, module_root, outdir,
+                                       format))
+    if os.path.isdir(args.dispos):
+        outdir = os.path.join(args.output, 'Dispos')
+        if not os.path.isdir(outdir):
+            os.makedirs(outdir)
+        outputs.extend(export_dispos(args.dispos, outdir, format))
+    if os.path.isfile(args.castle_join):
+        if not os.path.isdir(args.output):
+            os.makedirs(args.output)
+        outputs.extend(export_castle_join(args.castle_join, args.output,
+                                          format))
+    print('Exported %d table(s) to %s.' % (len(outputs), args.output))
@@ -0,0 +1,122 @@
+#!/usr/bin/env python2
+#
+# The MIT License
+#
+# Copyright (c) 2017 RainThunder.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+"""One entry point for all tools.
+
+Usage:
+    python fefates.py COMMAND [ARGS ...]
+    python fefates.py COMMAND -h
+
+Every command runs the tool of the same name (e.g. `fefates.py dispos-stats
+--by chapter` is `dispos_stats.py --by chapter`). A tool is only imported when
+its command is run, so the start-up time of a command does not depend on the
+other tools. `ls` is built in: it lists the files of .arc archives by reading
+their file info tables only.
+"""
+
+from __future__ import print_function
+import sys
+
+# (command, module, description)
+COMMANDS = [
+    ('arc', 'arc', 'extract or pack an .arc file, or replace files in it'),
+    ('arc-index', 'arc_index', 'find and extract files in many .arc files'),
+    ('batch', 'batch', 'run a manifest of operations in one process'),
+    ('benchmark', 'benchmark', 'run the benchmarks'),
+    ('castle-join', 'castle_join', 'convert castle_join.bin to text and '
+     'back'),
+    ('compact', 'compact', 'remove unused and duplicate labels'),
+    ('database', 'database', 'mirror the tables in a SQLite database'),
+    ('dispos', 'dispos', 'check and move the units of Dispos maps'),
+    ('dispos-stats', 'dispos_stats', 'compare the Dispos maps of every '
+     'route'),
+    ('export', 'export', 'export the tables to columnar files'),
+    ('forecast', 'forecast', 'combat forecasts of the Dispos maps'),
+    ('fst', 'fst_generator', 'generate fst.bin for a DLC folder'),
+    ('gamedata-module', 'gamedata_module', 'add data to GameData.bin'),
+    ('growth', 'growth', 'project the stats of the characters'),
+    ('handover', 'handover', 'compare and edit the handover files'),
+    ('nmm', 'nmm_generator', 'regenerate the Nightmare modules'),
+    ('server', 'server', 'serve the data files over HTTP'),
+    ('synthetic', 'synthetic', 'generate files for stress testing'),
+    ('trim', 'trim', 'trim the padding added by Nightmare 2'),
+    ('watch', 'watch', 'rebuild edited files as soon as they are saved'),
+]
+
+
+def usage():
+    lines = ['Usage: python fefates.py COMMAND [ARGS ...]', '',
+             'Commands:',
+             '  %-16s %s' % ('ls', 'list the files of .arc archives')]
+    lines.extend(['  %-16s %s' % (command, description)
+                  for command, module, description in COMMANDS])
+    lines.extend(['', 'Run `python fefates.py COMMAND -h` for the arguments '
+                  'of a command.'])
+    return '\n'.join(lines)
+
+
+def list_archives(paths):
+    """Print the index, offset, length and name of the files of some
+    archives."""
+    import arc
+    for path in paths:
+        with open(path, 'rb') as file:
+            members = arc.read_file_info(file)
+        if len(paths) > 1:
+            print(path + ':')
+        for info in members:
+            print('%5d  0x%08X %10d  %s' % (info.index, info.offset,
+                                            info.length, info.name))
+
+
+def run_command(command, args):
+    """Run the tool of a command, as if its file was run with `args`."""
+    import runpy
+    modules = dict([(c, m) for c, m, d in COMMANDS])
+    module = modules[command]
+    sys.argv = [module + '.py'] + list(args)
+    runpy.run_module(module, run_name='__main__', alter_sys=True)
+
+
+def main(argv):
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage())
+        return 0 if argv else 2
+    command, args = argv[0], argv[1:]
+    if command == 'ls':
+        if not args or args[0] in ('-h', '--help'):
+            print('Usage: python fefates.py ls ARC [ARC ...]')
+            return 0 if args else 2
+        list_archives(args)
+        return 0
+    if command not in [c for c, m, d in COMMANDS]:
+        print('Unknown command: %s\n\n%s' % (command, usage()),
+              file=sys.stderr)
+        return 2
+    run_command(command, args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,626 @@
+#!/usr/bin/env python2
+#
+# The MIT License
+#
+# Copyright (c) 2017 RainThunder.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+"""Batch combat forecasts for the Dispos maps.
+
+For every map, the player units and the enemy units of its unit table are
+turned into arrays of stats and equipped weapons, and the forecast of every
+player vs. enemy pairing (and every enemy vs. player pairing) is computed at
+once with NumPy broadcasting.
+
+Units:
+* A unit whose PID is in the Character table uses its bases, growths and
+  Class 1 (or the class of the Dispos row, if any).
+* Other units (generic enemies) have no personal data in GameData.bin. Their
+  class is found from the PID, which contains the class name
+  (PID_<map>_<class name>), and they have class stats only.
+* The level is byte 0x9 of the Dispos row when it is not 0, otherwise the
+  level of the character, otherwise `enemy_level` (default: the average
+  level of the player units of the map).
+* Stats are the average stats at that level, as in growth.py: bases plus
+  growth rate times the levels gained, capped by the class maximums.
+* The equipped weapon is the first weapon in the inventory. Its stat bonuses
+  are added to the stats of the unit.
+
+Formulas:
+* Damage = Strength (Magic for tomes, scrolls, staves and rods) + Mt -
+  Defense (Resistance), plus TRIANGLE_DAMAGE with weapon advantage
+* Hit = weapon Hit + (Skill * 3 + Luck) / 2 - (Speed * 3 + Luck) / 2 -
+  weapon Avoid of the target, plus TRIANGLE_HIT with weapon advantage.
+  `true_hit` is the chance of a hit with the two-number roll used above
+  50 hit.
+* Crit = weapon Crit + (Skill - 4) / 2 - Luck - weapon Dodge of the target
+* A unit attacks twice if its Speed, with the doubling modifiers of both
+  weapons, is at least DOUBLE_SPEED higher.
+
+Results are cached per (map, GameData hash), in memory and optionally in a
+folder of .npz files, so only the maps whose Dispos file or GameData.bin
+changed are computed again.
+
+NumPy is required.
+
+Usage:
+    python forecast.py [-i GameData.bin] [--dispos Dispos] [maps ...]
+                       [--difficulty normal|hard|lunatic] [--cache DIR]
+
+Example:
+    >>> import gamedata, forecast
+    >>> engine = forecast.Forecaster(gamedata.load_file('GameData.bin'))
+    >>> result = engine.forecast_map('Dispos/A005/A005.bin')
+    >>> result.player_phase.expected_damage  # (players, enemies)
+"""
+
+from __future__ import print_function, division
+import hashlib
+import os
+import sys
+from struct import unpack_from
+if sys.version_info[0] > 2:
+    xrange = range
+    unicode = str
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import atomic
+import bin
+import gamedata
+import growth
+import nightmare
+import nmm_generator
+import profiling
+
+
+TRIANGLE_HIT = 10
+TRIANGLE_DAMAGE = 1
+DOUBLE_SPEED = 5
+
+# Weapon categories (Item/WeaponCategory.txt)
+MAGIC_WEAPONS = frozenset([0xA, 0xB, 0xC, 0xD]) # Tome, Scroll, Staff, Rod
+STAVES = frozenset([0xC, 0xD])
+# Sword, Katana, Tome, Scroll > Axe, Club, Bow, Yumi > Lance, Naginata,
+# Dagger, Shuriken > Sword, ...
+TRIANGLE = {0x0: 0, 0x1: 0, 0xA: 0, 0xB: 0,
+            0x4: 1, 0x5: 1, 0x8: 1, 0x9: 1,
+            0x2: 2, 0x3: 2, 0x6: 2, 0x7: 2}
+# Item categories (Item/ItemCategory.txt) of weapons: Sword - Saw
+WEAPON_ITEMS = frozenset(xrange(0x2, 0x16))
+
+ITEM_BONUSES = [stat + ' bonus (equipment)' for stat in growth.STATS]
+
+# Level override in a Dispos row (0: level of the character)
+DISPOS_LEVEL_OFFSET = 0x9
+DIFFICULTIES = {'normal': 0, 'hard': 1, 'lunatic': 2} # Unit flag 9 - 11
+PLAYER, ENEMY = 0, 1
+
+HP, STR, MAG, SKL, SPD, LCK, DEF, RES = xrange(len(growth.STATS))
+
+
+class ItemTable(object):
+    """Weapon data of the Item table, as arrays.
+
+    Row 0 is a placeholder for "no weapon"; `index` maps item labels to rows.
+    """
+
+    def __init__(self, columns):
+        growth._require_numpy()
+        labels = columns['Item label pointer']
+        count = len(labels) + 1
+        self.index = dict([(labels[i], i + 1) for i in xrange(len(labels))])
+
+        def column(name, dtype='i4'):
+            values = numpy.zeros(count, dtype=dtype)
+            values[1:] = columns[name]
+            return values
+
+        self.might = column('Mt')
+        self.hit = column('Hit')
+        self.crit = column('Crit')
+        self.avoid = column('Avoid')
+        self.dodge = column('Dodge')
+        self.min_range = column('Minimum Range')
+        self.max_range = column('Maximum Range')
+        self.double = column('Ability to double attack')
+        self.enemy_double = column("Enemy's ability to double attack")
+        weapon_type = column('Weapon category')
+        category = column('Item category')
+        self.is_weapon = numpy.array(
+            [c in WEAPON_ITEMS and w not in STAVES
+             for c, w in zip(category, weapon_type)], dtype=bool)
+        self.is_weapon[0] = False
+        self.is_magic = numpy.array([w in MAGIC_WEAPONS for w in weapon_type],
+                                    dtype=bool)
+        self.triangle = numpy.array([TRIANGLE.get(w, -1) for w in weapon_type],
+                                    dtype='i4')
+        self.triangle[0] = -1
+        self.bonuses = numpy.zeros((count, len(growth.STATS)), dtype='i4')
+        self.bonuses[1:] = growth._matrix(columns, ITEM_BONUSES, 'i4')
+
+    def equipped(self, inventories):
+        """Get the first weapon of every inventory (a list of item labels).
+
+        Return an array of rows (0: no weapon).
+        """
+        rows = numpy.zeros(len(inventories), dtype='i4')
+        for i in xrange(len(inventories)):
+            for label in inventories[i]:
+                j = self.index.get(label, 0)
+                if self.is_weapon[j]:
+                    rows[i] = j
+                    break
+        return rows
+
+
+def load_items(game_data):
+    """Load the Item table of a GameData object. Return an ItemTable."""
+    module = nmm_generator.build_module(game_data, growth._schema('Item'))
+    return ItemTable(growth._read_columns(module, game_data))
+
+
+##############################################################################
+# Forecasts
+##############################################################################
+class Units(object):
+    """Stats and weapons of some units, as arrays.
+
+    `labels`: PIDs
+    `levels`, `classes`: Shape (n,)
+    `stats`: Average stats with the weapon bonuses, shape (n, 8)
+    `weapons`: Rows of the equipped weapons in the ItemTable, shape (n,)
+    """
+
+    def __init__(self, labels, levels, classes, stats, weapons):
+        self.labels = labels
+        self.levels = levels
+        self.classes = classes
+        self.stats = stats
+        self.weapons = weapons
+
+    def __len__(self):
+        return len(self.labels)
+
+
+def true_hit(hit):
+    """Convert displayed hit rates to the chance of a hit (both 0 - 100)."""
+    hit = numpy.asarray(hit, dtype='f8')
+    bonus = 40.0 / 3 * hit / 100 * numpy.sin((0.02 * hit - 1) * numpy.pi)
+    return numpy.where(hit < 50, hit, hit + bonus)
+
+
+class Forecast(object):
+    """Forecasts of attackers vs. defenders. Every attribute has the shape
+    (attackers, defenders).
+
+    `damage`, `hit`, `true_hit`, `crit`, `attacks`: Damage per hit, hit
+        rate, chance of a hit, critical rate and number of attacks (0 - 2)
+        of the attacker
+    `counter_damage`, `counter_hit`, `counter_true_hit`, `counter_crit`,
+        `counter_attacks`: The same for the counterattacks of the defender
+        (`counter_attacks` is 0 when the defender is out of range)
+    """
+
+    FIELDS = ['damage', 'hit', 'true_hit', 'crit', 'attacks',
+              'counter_damage', 'counter_hit', 'counter_true_hit',
+              'counter_crit', 'counter_attacks']
+
+    def __init__(self, **arrays):
+        for name in self.FIELDS:
+            setattr(self, name, arrays[name])
+
+    @property
+    def expected_damage(self):
+        """Expected damage dealt by the attacker in one combat."""
+        return _expected_damage(self.damage, self.true_hit, self.crit,
+                                self.attacks)
+
+    @property
+    def counter_expected_damage(self):
+        """Expected damage dealt by the defender in one combat."""
+        return _expected_damage(self.counter_damage, self.counter_true_hit,
+                                self.counter_crit, self.counter_attacks)
+
+
+def _expected_damage(damage, true_hit, crit, attacks):
+    return damage * (1 + 2 * crit / 100.0) * true_hit / 100.0 * attacks
+
+
+def _strike(attackers, defenders, items):
+    """Damage, hit and crit of every attacker against every defender."""
+    a = attackers.stats[:, None, :]
+    d = defenders.stats[None, :, :]
+    wa = attackers.weapons[:, None]
+    wd = defenders.weapons[None, :]
+    magic = items.is_magic[wa]
+    ta = items.triangle[wa]
+    td = items.triangle[wd]
+    advantage = numpy.where((ta < 0) | (td < 0), 0,
+                            numpy.where((ta + 1) % 3 == td, 1,
+                                        numpy.where((td + 1) % 3 == ta, -1,
+                                                    0)))
+    power = numpy.where(magic, a[..., MAG], a[..., STR])
+    guard = numpy.where(magic, d[..., RES], d[..., DEF])
+    damage = numpy.maximum(power + items.might[wa] - guard +
+                           advantage * TRIANGLE_DAMAGE, 0)
+    hit = (items.hit[wa] + (a[..., SKL] * 3 + a[..., LCK]) // 2 -
+           (d[..., SPD] * 3 + d[..., LCK]) // 2 - items.avoid[wd] +
+           advantage * TRIANGLE_HIT)
+    crit = (items.crit[wa] + (a[..., SKL] - 4) // 2 - d[..., LCK] -
+            items.dodge[wd])
+    armed = items.is_weapon[wa]
+    return (numpy.where(armed, damage, 0),
+            numpy.where(armed, numpy.clip(hit, 0, 100), 0),
+            numpy.where(armed, numpy.clip(crit, 0, 100), 0))
+
+
+def forecast(attackers, defenders, items):
+    """Compute the forecasts of every attacker against every defender.
+
+    `attackers`, `defenders`: Units objects
+    `items`: ItemTable object
+
+    Return a Forecast object.
+    """
+    damage, hit, crit = _strike(attackers, defenders, items)
+    counter_damage, counter_hit, counter_crit = [
+        x.T for x in _strike(defenders, attackers, items)]
+    wa = attackers.weapons[:, None]
+    wd = defenders.weapons[None, :]
+    speed_a = (attackers.stats[:, None, SPD] + items.double[wa] +
+               items.enemy_double[wd])
+    speed_d = (defenders.stats[None, :, SPD] + items.double[wd] +
+               items.enemy_double[wa])
+    distance = items.min_range[wa]
+    attacks = numpy.where(items.is_weapon[wa],
+                          1 + (speed_a - speed_d >= DOUBLE_SPEED), 0)
+    in_range = (items.is_weapon[wd] & (items.min_range[wd] <= distance) &
+                (distance <= items.max_range[wd]))
+    counter_attacks = numpy.where(in_range & (attacks > 0),
+                                  1 + (speed_d - speed_a >= DOUBLE_SPEED), 0)
+    return Forecast(damage=damage, hit=hit, true_hit=true_hit(hit),
+                    crit=crit, attacks=attacks,
+                    counter_damage=counter_damage, counter_hit=counter_hit,
+                    counter_true_hit=true_hit(counter_hit),
+                    counter_crit=counter_crit,
+                    counter_attacks=counter_attacks)
+
+
+class MapForecast(object):
+    """Forecasts of a Dispos map.
+
+    `name`: Map name, e.g. 'A005'
+    `players`, `enemies`: Units objects
+    `player_phase`: Forecast of players vs. enemies, shape (players, enemies)
+    `enemy_phase`: Forecast of enemies vs. players, shape (enemies, players)
+    `unresolved`: PIDs of the units whose class could not be found. They are
+        left out.
+    """
+
+    def __init__(self, name, players, enemies, player_phase, enemy_phase,
+                 unresolved):
+        self.name = name
+        self.players = players
+        self.enemies = enemies
+        self.player_phase = player_phase
+        self.enemy_phase = enemy_phase
+        self.unresolved = unresolved
+
+    def summary(self):
+        """Get averages over all pairings, as a dict."""
+        result = {'map': self.name, 'players': len(self.players),
+                  'enemies': len(self.enemies),
+                  'unresolved': len(self.unresolved)}
+        if len(self.players) and len(self.enemies):
+            for key, phase in (('player', self.player_phase),
+                               ('enemy', self.enemy_phase)):
+                result[key + '_hit'] = round(float(phase.hit.mean()), 2)
+                result[key + '_damage'] = round(float(
+                    phase.expected_damage.mean()), 2)
+                result[key + '_doubles'] = round(float(
+                    (phase.attacks == 2).mean()), 4)
+        return result
+
+    def save(self, path):
+        """Save to a .npz file."""
+        arrays = {'name': numpy.array(self.name),
+                  'unresolved': numpy.array(self.unresolved, dtype=unicode)}
+        for key, units in (('players', self.players),
+                           ('enemies', self.enemies)):
+            arrays[key + '.labels'] = numpy.array(units.labels, dtype=unicode)
+            for name in ('levels', 'classes', 'stats', 'weapons'):
+                arrays[key + '.' + name] = getattr(units, name)
+        for key, phase in (('player_phase', self.player_phase),
+                           ('enemy_phase', self.enemy_phase)):
+            for name in Forecast.FIELDS:
+                arrays[key + '.' + name] = getattr(phase, name)
+        with atomic.atomic_path(path) as temp:
+            with open(temp, 'wb') as file:
+                numpy.savez(file, **arrays)
+
+
+def load_map_forecast(path):
+    """Load a MapForecast saved by MapForecast.save()."""
+    with numpy.load(path) as arrays:
+        def units(key):
+            return Units(arrays[key + '.labels'].tolist(),
+                         *[arrays[key + '.' + name] for name in
+                           ('levels', 'classes', 'stats', 'weapons')])
+
+        def phase(key):
+            return Forecast(**dict([(name, arrays[key + '.' + name])
+                                    for name in Forecast.FIELDS]))
+
+        return MapForecast(unicode(arrays['name']), units('players'),
+                           units('enemies'), phase('player_phase'),
+                           phase('enemy_phase'),
+                           arrays['unresolved'].tolist())
+
+
+##############################################################################
+# Engine
+##############################################################################
+class Forecaster(object):
+    """Forecasts of Dispos maps against a GameData.bin file.
+
+    `game_data`: GameData object
+    `cache_dir`: Folder for cached results (.npz files), or None to cache in
+        memory only
+    `difficulty`: 'normal', 'hard' or 'lunatic' to keep only the units of
+        that difficulty, or None to keep all units
+    `enemy_level`: Level of the units which have no level, or None for the
+        average level of the player units of the map
+    """
+
+    def __init__(self, game_data, cache_dir=None, difficulty=None,
+                 enemy_level=None):
+        growth._require_numpy()
+        if difficulty is not None and difficulty not in DIFFICULTIES:
+            raise ValueError('unknown difficulty: ' + difficulty)
+        self.roster = growth.load_roster(game_data)
+        self.class_table = growth.load_classes(game_data)
+        self.items = load_items(game_data)
+        self.cache_dir = cache_dir
+        self.difficulty = difficulty
+        self.enemy_level = enemy_level
+        self.hash = hashlib.sha1(game_data.tobin()).hexdigest()
+        self.__cache = {}
+        self.__characters = dict([(self.roster.labels[i], i)
+                                  for i in xrange(len(self.roster))])
+        # Class labels without JID_ / MJID_ and the gender suffix
+        self.__class_ids = dict(
+            [(label, i) for i, label in enumerate(self.class_table.labels)])
+        names = {}
+        for i in xrange(len(self.class_table)):
+            for label in (self.class_table.names[i],
+                          self.class_table.labels[i]):
+                name = label.split(u'_', 1)[-1]
+                if name[-1:] in (u'\u7537', u'\u5973'): # Male, female
+                    names.setdefault(name[:-1], i)
+                names.setdefault(name, i)
+        names.pop(u'\u7121\u3057', None) # None
+        # Longest names first, so a PID matches the most specific class
+        self.__class_names = sorted(names.items(),
+                                    key=lambda item: -len(item[0]))
+
+    def _class_of(self, pid):
+        """Find the class of a generic unit from its PID. Return a class ID,
+        or None."""
+        name = pid.split(u'_', 2)[-1]
+        for class_name, class_id in self.__class_names:
+            if class_name in name:
+                return class_id
+        return None
+
+    def units(self, rows, enemy_level=1):
+        """Build the Units of some Dispos rows.
+
+        `rows`: List of (PID, class label, level, items)
+        `enemy_level`: Level of the units which have no level
+
+        Return (Units object, list of unresolved PIDs).
+        """
+        roster = self.roster
+        classes = self.class_table
+        nstats = len(growth.STATS)
+        labels, levels, class_ids, characters, unresolved = [], [], [], [], []
+        inventories = []
+        for pid, class_label, level, inventory in rows:
+            character = self.__characters.get(pid)
+            class_id = self.__class_ids.get(class_label)
+            if class_id is None:
+                class_id = (int(roster.classes[character])
+                            if character is not None else self._class_of(pid))
+            if class_id is None or not 0 <= class_id < len(classes):
+                unresolved.append(pid)
+                continue
+            if not level:
+                level = (int(roster.levels[character])
+                         if character is not None else enemy_level)
+            labels.append(pid)
+            levels.append(level)
+            class_ids.append(class_id)
+            characters.append(-1 if character is None else character)
+            inventories.append(inventory)
+        n = len(labels)
+        levels = numpy.array(levels, dtype='i4')
+        class_ids = numpy.array(class_ids, dtype='i4')
+        characters = numpy.array(characters, dtype='i4')
+        known = characters >= 0
+        bases = numpy.zeros((n, nstats))
+        growths = numpy.zeros((n, nstats))
+        modifiers = numpy.zeros((n, nstats))
+        start = numpy.ones(n)
+        if known.any():
+            index = characters[known]
+            bases[known] = roster.bases[index]
+            growths[known] = roster.growths[index]
+            modifiers[known] = roster.modifiers[index]
+            start[known] = roster.levels[index]
+        gained = numpy.maximum(levels - start, 0)[:, None]
+        stats = (classes.bases[class_ids] + bases + gained *
+                 (growths + classes.growths[class_ids]) / 100.0)
+        stats = numpy.clip(stats, 0, numpy.maximum(
+            classes.maximums[class_ids] + modifiers, 0))
+        weapons = self.items.equipped(inventories)
+        stats = numpy.floor(stats) + self.items.bonuses[weapons]
+        return (Units(labels, levels, class_ids, stats, weapons),
+                unresolved)
+
+    def key(self, path):
+        """Get the cache key of a Dispos map: the map name, the hash of the
+        Dispos file and the hash of GameData.bin."""
+        with open(path, 'rb') as file:
+            map_hash = hashlib.sha1(file.read()).hexdigest()
+        name = os.path.splitext(os.path.basename(path))[0]
+        return (name, map_hash[:16], self.hash[:16],
+                self.difficulty or 'all', self.enemy_level or 0)
+
+    @profiling.profiled('forecast.map')
+    def forecast_map(self, path, module=None):
+        """Compute the forecasts of a Dispos map.
+
+        `path`: Path of the Dispos .bin file
+        `module`: nightmare.Module of the map. Default: the .nmm file next to
+            the .bin file
+
+        Return a MapForecast object.
+        """
+        key = self.key(path)
+        if key in self.__cache:
+            return self.__cache[key]
+        cache_path = None
+        if self.cache_dir is not None:
+            cache_path = os.path.join(self.cache_dir,
+                                      '-'.join(map(str, key)) + '.npz')
+            if os.path.isfile(cache_path):
+                result = load_map_forecast(cache_path)
+                self.__cache[key] = result
+                return result
+        if module is None:
+            module = nightmare.load_module(os.path.splitext(path)[0] +
+                                           '.nmm')
+        result = self._compute(key[0], bin.load_file(path), module)
+        if cache_path is not None:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            result.save(cache_path)
+        self.__cache[key] = result
+        return result
+
+    def _compute(self, name, dispos, module):
+        columns = dict([(column.name, column.values)
+                        for column in module.read_columns(dispos)])
+        item_columns = [column for column in module.column_names()
+                        if column.startswith(u'Item ') and
+                        column.endswith(u' pointer')]
+        teams = {PLAYER: [], ENEMY: []}
+        for i in xrange(module.count):
+            team = columns['Team'][i]
+            if team not in teams:
+                continue
+            if self.difficulty is not None:
+                flags = columns['Unit flag 9 - 16'][i]
+                if not flags >> DIFFICULTIES[self.difficulty] & 1:
+                    continue
+            level = unpack_from('<B', dispos.data, module.data_offset +
+                                i * module.size + DISPOS_LEVEL_OFFSET)[0]
+            teams[team].append((columns['Unit pointer'][i],
+                                columns['Class pointer'][i], level,
+                                [columns[c][i] for c in item_columns]))
+        players, unresolved = self.units(teams[PLAYER])
+        enemy_level = self.enemy_level
+        if enemy_level is None:
+            enemy_level = (int(round(players.levels.mean()))
+                           if len(players) else 1)
+        enemies, more = self.units(teams[ENEMY], enemy_level)
+        return MapForecast(name, players, enemies,
+                           forecast(players, enemies, self.items),
+                           forecast(enemies, players, self.items),
+                           unresolved + more)
+
+    @profiling.profiled('forecast.all')
+    def forecast_all(self, dispos_dir='Dispos', names=None):
+        """Compute the forecasts of all maps of a Dispos folder.
+
+        `names`: Map names. Default: every folder which contains a
+            <map>.bin file and a <map>.nmm module
+
+        Return a list of MapForecast.
+        """
+        if names is None:
+            names = sorted(os.listdir(dispos_dir))
+        results = []
+        for name in names:
+            path = os.path.join(dispos_dir, name, name + '.bin')
+            if (os.path.isfile(path) and
+                    os.path.isfile(os.path.join(dispos_dir, name,
+                                                name + '.nmm'))):
+                results.append(self.forecast_map(path))
+        return results
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('maps', nargs='*',
+                        help='map names (default: all maps)')
+    parser.add_argument('-i', '--input', default='GameData.bin',
+                        help='GameData.bin file (default: GameData.bin)')
+    parser.add_argument('--dispos', default='Dispos',
+                        help='path to the Dispos folder')
+    parser.add_argument('--difficulty', choices=sorted(DIFFICULTIES),
+                        default=None, help='only keep the units of a '
+                        'difficulty')
+    parser.add_argument('--enemy-level', type=int, default=None,
+                        help='level of the units which have no level '
+                        '(default: average level of the player units)')
+    parser.add_argument('--cache', default=None, metavar='DIR',
+                        help='folder which caches the results')
+    parser.add_argument('--json', action='store_true',
+                        help='print the summaries as JSON')
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    profiling.setup(args.profile)
+
+    engine = Forecaster(gamedata.load_file(args.input), args.cache,
+                        args.difficulty, args.enemy_level)
+    results = engine.forecast_all(args.dispos, args.maps or None)
+    summaries = [result.summary() for result in results]
+    if args.json:
+        print(json.dumps(summaries, indent=2))
+    else:
+        print('%-6s %7s %7s  %10s %10s  %10s %10s' % (
+            'Map', 'Players', 'Enemies', 'Player hit', 'Enemy hit',
+            'Player dmg', 'Enemy dmg'))
+        for s in summaries:
+            if 'player_hit' not in s:
+                print('%-6s %7d %7d' % (s['map'], s['players'],
+                                        s['enemies']))
+                continue
+            print('%-6s %7d %7d  %10.1f %10.1f  %10.1f %10.1f' % (
+                s['map'], s['players'], s['enemies'], s['player_hit'],
+                s['enemy_hit'], s['player_damage'], s['enemy_damage']))
@@ -27,116 +27,431 @@
 a file list, contains the paths of all files except itself in a DLC's RomFS.
 
 Usage:
-    python fst_generator.py dir
+    python fst_generator.py dir [--jobs N] [--manifest FILE | --no-cache]
 
 with `dir` is path to the DLC's RomFS folder. Alternatively, you can drag and
 drop that folder to this script. A new fst.bin file will automatically be
 generated inside that folder.
+
+Paths in fst.bin are sorted, so the same folder always gives the same file.
+
+The folder listing is saved to a manifest file (default: `dir.fstcache`, next
+to the folder, so it is never included in the DLC). On the next run, folders
+whose modification time did not change are not listed again, and if fst.bin
+was not modified in the meantime, only the added and removed paths are
+patched into it. Folders are listed in parallel with `--jobs` threads.
 """
 
+from __future__ import print_function
+import json
 import os
 import sys
-from struct import pack, unpack, pack_into
+import time
+from contextlib import contextmanager
+from struct import pack, unpack, unpack_from
 if sys.version_info[0] > 2:
     xrange = range
     unicode = str
 
 try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir # Python 2 backport
+    except ImportError:
+        scandir = None
+
+
+def _thread_pool(jobs):
+    """Create a thread pool, or return None if concurrent.futures is not
+    available. It is imported here because it is slow to import, and a
+    folder with no subfolders never needs it."""
+    try:
+        from concurrent.futures import ThreadPoolExecutor
+    except ImportError:
+        return None
+    return ThreadPoolExecutor(jobs)
+
+try:
+    import atomic
     import bin
+    import profiling
+    import sjis
     standalone = False
 except ImportError:
     standalone = True
 
+if not standalone:
+    _atomic_path = atomic.atomic_path
+else:
+    @contextmanager
+    def _atomic_path(path):
+        """Minimal atomic.atomic_path for the standalone mode: write to a
+        temporary file, then rename it over `path`."""
+        temp = path + '.tmp'
+        try:
+            yield temp
+            if hasattr(os, 'replace'):
+                os.replace(temp, path)
+            else:
+                if os.name == 'nt' and os.path.exists(path):
+                    os.remove(path)
+                os.rename(temp, path)
+        except BaseException:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+
+MANIFEST_VERSION = 1
+
+# Folders modified less than this number of seconds before they are listed
+# may be modified again without changing their modification time, so their
+# listings are not reused.
+RACY_INTERVAL = 2.0
+
+
+if not standalone:
+    class Fst(bin.BinFile):
+        """Fst.bin file class."""
+        def __init__(self, header=None, raw=None):
+            super(Fst, self).__init__(header, raw)
+
+        def get_count(self):
+            """Get the number of paths."""
+            if len(self._data) < 4:
+                return 0
+            return unpack('<I', self._data[0x0:0x4])[0]
+
+        def get_raw_list(self):
+            """Get all paths in Shift-JIS encoding, in file order."""
+            label0_offset = self.label0_offset
+            labels = self._labels
+            raw_list = []
+            for i in xrange(self.get_count()):
+                start = unpack_from('<I', self._data, 0x4 + i * 4)[0] - \
+                    label0_offset
+                raw_list.append(labels[start:labels.index(b'\0', start)])
+            return raw_list
+
+        def get_file_list(self):
+            """Get all paths, in file order."""
+            return [sjis.decode(f) for f in self.get_raw_list()]
+
+        @profiling.profiled('fst.construct')
+        def construct(self, file_list):
+            """Construct fst.bin file."""
+            self._build([sjis.encode(f) for f in file_list])
 
-class Fst(bin.BinFile):
-    """Fst.bin file class."""
-    def __init__(self, header=None, raw=None):
-        super(Fst, self).__init__(header, raw)
-
-    def construct(self, file_list):
-        """Construct fst.bin file."""
-        # Add file names to label region.
-        offsets = []
-        total_length = 0
-        for filename in file_list:
-            offsets.append(total_length)
-            total_length += len(filename) + 1
-        self._labels = b'\0'.join([f.encode('shift-jis') for f in file_list])\
-            + b'\0'
-
-        # Data and pointer 1
-        data_length = 4 + len(file_list) * 4 # = p1_offset
-        label_offset = data_length + len(file_list) * 4
-        data = bytearray(b'\0' * data_length)
-        self._p1_list = []
-        pack_into('<I', data, 0, len(file_list))
-        for i in xrange(len(file_list)):
-            pack_into('<I', data, 0x4 + i * 4, label_offset + offsets[i])
-            self._p1_list.append(0x4 + i * 4)
-        self._data = bytes(data)
-
-
-def generate(path):
-    """Generate fst.bin file using bin module."""
-    # List all file in the directory
-    file_list = []
-    root_name = unicode(path)
-    for dirpaths, dirnames, filenames in os.walk(unicode(path)):
-        for filename in filenames:
-            if filename == u'fst.bin':
-                continue
-            if dirpaths != root_name:
-                label = dirpaths.replace(root_name + os.sep, '').replace(os.sep, u'/') + u'/' + filename
+        @profiling.profiled('fst.patch')
+        def patch(self, added=(), removed=()):
+            """Add and remove paths. The paths must be sorted, like the
+            output of generate(); the result is sorted too.
+
+            Only the added and removed paths, and the few paths compared by
+            the binary searches which find their positions, are encoded or
+            decoded. The labels of the other paths are copied in blocks, and
+            their pointers are shifted by the length of the labels inserted
+            or removed before them. Every pointer still changes, since the
+            labels begin after the pointers, but no path is sorted again.
+            """
+            count = self.get_count()
+            label0_offset = self.label0_offset
+            labels = self._labels
+            offsets = [ptr - label0_offset for ptr in
+                       unpack_from('<%dI' % count, self._data, 0x4)]
+            labels_end = labels.index(b'\0', offsets[-1]) + 1 if count \
+                else 0
+
+            def path(i):
+                start = offsets[i]
+                return sjis.decode(labels[start:labels.index(b'\0', start)])
+
+            def position(p):
+                low, high = 0, count
+                while low < high:
+                    middle = (low + high) // 2
+                    if path(middle) < p:
+                        low = middle + 1
+                    else:
+                        high = middle
+                return low
+
+            dropped = set()
+            for f in removed:
+                i = position(f)
+                if i < count and path(i) == f:
+                    dropped.add(i)
+            inserts = sorted([(position(f), f) for f in added])
+
+            # Copy the unchanged entries between two changes as one block
+            new_offsets = []
+            blocks = []
+            length = 0
+            first = 0
+            k = 0
+            for cut in sorted(set([i for i, f in inserts]) | dropped |
+                              set([count])):
+                if first < cut:
+                    end = offsets[cut] if cut < count else labels_end
+                    delta = length - offsets[first]
+                    new_offsets.extend([o + delta for o in
+                                        offsets[first:cut]])
+                    blocks.append(labels[offsets[first]:end])
+                    length += end - offsets[first]
+                while k < len(inserts) and inserts[k][0] == cut:
+                    raw = sjis.encode(inserts[k][1]) + b'\0'
+                    new_offsets.append(length)
+                    blocks.append(raw)
+                    length += len(raw)
+                    k += 1
+                first = cut + 1 if cut in dropped else cut
+            self._set_paths(new_offsets, b''.join(blocks))
+
+        def _build(self, raw_list):
+            """Build the data region, pointer region 1 and labels from a list
+            of Shift-JIS encoded paths."""
+            offsets = []
+            offset = 0
+            for f in raw_list:
+                offsets.append(offset)
+                offset += len(f) + 1
+            self._set_paths(offsets, b''.join([f + b'\0' for f in raw_list]))
+
+        def _set_paths(self, offsets, labels):
+            """Set the paths from their offsets in the labels."""
+            count = len(offsets)
+            label0_offset = 4 + count * 8
+            self._data = pack('<I', count) + pack(
+                '<%dI' % count, *[o + label0_offset for o in offsets])
+            self._p1_list = list(xrange(0x4, 0x4 + count * 4, 4))
+            self._p2_list = []
+            self._labels = labels
+
+
+def _mtime(st):
+    return getattr(st, 'st_mtime_ns', None) or int(st.st_mtime * 1e9)
+
+
+def _list_dir(path):
+    """List a folder. Return (file names, subfolder names).
+
+    Symbolic links to folders are skipped, like os.walk does by default.
+    """
+    files = []
+    dirs = []
+    if scandir is not None:
+        for entry in scandir(path):
+            if entry.is_dir():
+                if not entry.is_symlink():
+                    dirs.append(entry.name)
             else:
-                label = filename
-            file_list.append(label)
-
-    # Construct the file/
-    fst = Fst()
-    fst.construct(file_list)
-    fst_file = open(os.path.join(unicode(path), u'fst.bin'), 'wb')
-    fst_file.write(fst.tobin())
-    fst_file.close()
-
-def generate_standalone(path):
-    """Generate fst.bin file. No module import needed."""
-    labels = []
-    name_offsets = []
-    total_length = 0
-    root_name = unicode(path)
-    for dirpaths, dirnames, filenames in os.walk(unicode(path)):
-        for filename in filenames:
-            if filename == u'fst.bin':
-                continue
-            if dirpaths != root_name:
-                label = (dirpaths.replace(root_name + os.sep, '')\
-                    .replace(os.sep, u'/') + u'/' + filename)\
-                    .encode('shift-jis')
+                files.append(entry.name)
+    else:
+        for name in os.listdir(path):
+            full_path = os.path.join(path, name)
+            if os.path.isdir(full_path):
+                if not os.path.islink(full_path):
+                    dirs.append(name)
             else:
-                label = filename.encode('shift-jis')
-            name_offsets.append(total_length)
-            labels.append(label)
-            total_length += len(filepath) + 1
+                files.append(name)
+    files.sort()
+    dirs.sort()
+    return files, dirs
+
 
-    file_count = len(name_offsets)
+def walk(path, cache=None, jobs=None):
+    """List all files in a folder.
+
+    `path`: Path to the folder
+    `cache`: Folder listings of a previous walk, as returned by this function.
+        Listings of folders with the same modification time are reused.
+    `jobs`: Number of threads which list folders. Default: CPU count
+
+    Return (listings, files). `listings` is a dict of relative folder path
+    -> [modification time, file names, subfolder names]; `files` is the
+    sorted list of relative paths, with '/' as separator.
+    """
+    root = unicode(path)
+    cache = cache or {}
+    now = int(time.time() * 1e9)
+    racy = int(RACY_INTERVAL * 1e9)
+
+    def scan(relpath):
+        full_path = os.path.join(root, *relpath.split(u'/')) if relpath \
+            else root
+        mtime = _mtime(os.stat(full_path))
+        cached = cache.get(relpath)
+        if cached is not None and cached[0] == mtime:
+            return relpath, cached
+        files, dirs = _list_dir(full_path)
+        if now - mtime < racy:
+            mtime = None # Always list this folder again next time
+        return relpath, [mtime, files, dirs]
+
+    if jobs is None:
+        jobs = min(32, (getattr(os, 'cpu_count', lambda: None)() or 1) + 4)
+    pool = None
+
+    # List the folders level by level
+    listings = {}
+    level = [u'']
+    try:
+        while len(level) > 0:
+            if pool is None and jobs > 1 and len(level) > 1:
+                pool = _thread_pool(jobs)
+            if pool is not None and len(level) > 1:
+                results = list(pool.map(scan, level))
+            else:
+                results = [scan(relpath) for relpath in level]
+            level = []
+            for relpath, listing in results:
+                listings[relpath] = listing
+                prefix = relpath + u'/' if relpath else u''
+                level.extend([prefix + d for d in listing[2]])
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    files = []
+    for relpath, listing in listings.items():
+        prefix = relpath + u'/' if relpath else u''
+        files.extend([prefix + f for f in listing[1] if f != u'fst.bin'])
+    files.sort()
+    return listings, files
+
+
+def get_manifest_path(path):
+    """Get the default manifest path of a folder."""
+    return os.path.normpath(os.path.abspath(unicode(path))) + u'.fstcache'
+
+
+def load_manifest(path):
+    """Load a manifest. Return None if it does not exist or is invalid."""
+    try:
+        with open(path, 'r') as file:
+            manifest = json.load(file)
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or \
+            manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(path, listings, files, fst_path):
+    """Save folder listings, the file list and the state of fst.bin."""
+    st = os.stat(fst_path)
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'dirs': listings,
+        'files': files,
+        'fst': [st.st_size, _mtime(st)]
+    }
+    with _atomic_path(path) as temp:
+        with open(temp, 'w') as file:
+            json.dump(manifest, file)
+
+
+def _fst_unchanged(manifest, fst_path):
+    """Check if fst.bin was not modified since the manifest was saved."""
+    try:
+        st = os.stat(fst_path)
+    except OSError:
+        return False
+    return manifest.get('fst') == [st.st_size, _mtime(st)]
+
+
+def _diff(old_files, new_files):
+    old = frozenset(old_files)
+    new = frozenset(new_files)
+    return sorted(new - old), sorted(old - new)
+
+
+def generate(path, manifest_path=None, jobs=None):
+    """Generate fst.bin file using bin module.
+
+    `path`: Path to the DLC's RomFS folder
+    `manifest_path`: Path to the manifest, or None to disable it
+    `jobs`: Number of threads which list folders
+
+    Return (added paths, removed paths). If fst.bin was rebuilt from scratch,
+    all paths are in the added list.
+    """
+    fst_path = os.path.join(unicode(path), u'fst.bin')
+    manifest = None
+    if manifest_path is not None:
+        manifest = load_manifest(manifest_path)
+    with profiling.phase('fst.walk'):
+        listings, file_list = walk(path, manifest and manifest['dirs'], jobs)
+
+    if manifest is not None and _fst_unchanged(manifest, fst_path):
+        added, removed = _diff(manifest['files'], file_list)
+        if len(added) == 0 and len(removed) == 0:
+            return added, removed
+        with profiling.phase('io.read') as p:
+            with open(fst_path, 'rb') as fst_file:
+                raw = fst_file.read()
+            p.nbytes = len(raw)
+        fst = Fst(raw[:0x20], raw[0x20:])
+        fst.patch(added, removed)
+    else:
+        added, removed = file_list, []
+        fst = Fst()
+        fst.construct(file_list)
+
+    output = fst.tobin()
+    with profiling.phase('io.write', len(output)):
+        atomic.write_file(fst_path, output)
+    if manifest_path is not None:
+        save_manifest(manifest_path, listings, file_list, fst_path)
+    return added, removed
+
+
+def generate_standalone(path, manifest_path=None, jobs=None):
+    """Generate fst.bin file. No module import needed.
+
+    fst.bin is always rebuilt from scratch, but the manifest is still used to
+    avoid listing unchanged folders.
+    """
+    manifest = None
+    if manifest_path is not None:
+        manifest = load_manifest(manifest_path)
+    listings, file_list = walk(path, manifest and manifest['dirs'], jobs)
+    labels = [f.encode('shift-jis') for f in file_list]
+
+    file_count = len(labels)
     label0_offset = 4 + file_count * 8
-    with open(os.path.join(unicode(path), u'fst.bin'), 'wb') as fst_file:
+    label_length = sum([len(label) + 1 for label in labels])
+    name_offsets = []
+    offset = label0_offset
+    for label in labels:
+        name_offsets.append(offset)
+        offset += len(label) + 1
+
+    fst_path = os.path.join(unicode(path), u'fst.bin')
+    with _atomic_path(fst_path) as temp, open(temp, 'wb') as fst_file:
         fst_file.write(
             # Header
-            pack('<4I', 0x24 + file_count * 8 + len(labels),
+            pack('<4I', 0x20 + label0_offset + label_length,
                  4 + file_count * 4, file_count, 0) +
-            '\0' * 16 + # padding
+            b'\0' * 16 + # padding
 
             # Data
             pack('<I', file_count) +
-            b''.join([pack('<I', label0_offset + offset) for offset in name_offsets]) +
+            b''.join([pack('<I', offset) for offset in name_offsets]) +
 
             # Pointer 1
             b''.join([pack('<I', ptr) for ptr in xrange(4, 4 + file_count * 4, 4)]) +
 
             # Labels
-            b'\0'.join(labels) + b'\0'
+            b''.join([label + b'\0' for label in labels])
         )
+    if manifest_path is not None:
+        save_manifest(manifest_path, listings, file_list, fst_path)
+    added, removed = file_list, []
+    if manifest is not None:
+        added, removed = _diff(manifest['files'], file_list)
+    return added, removed
 
 
 if __name__ == '__main__':
@@ -144,14 +459,29 @@ if __name__ == '__main__':
 
     parser = argparse.ArgumentParser()
     parser.add_argument('path', help='input folder')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of threads which list folders')
+    parser.add_argument('--manifest', default=None,
+                        help='manifest file (default: PATH.fstcache)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='do not read or write the manifest')
+    if not standalone:
+        profiling.add_argument(parser)
     args = parser.parse_args()
+    if not standalone:
+        profiling.setup(args.profile)
 
     if not os.path.isdir(unicode(args.path)):
         print(args.path + ': No such directory.')
         exit()
 
+    manifest_path = None
+    if not args.no_cache:
+        manifest_path = args.manifest or get_manifest_path(args.path)
     if standalone:
-        generate_standalone(args.path)
+        added, removed = generate_standalone(args.path, manifest_path,
+                                             args.jobs)
     else:
-        generate(args.path)
-    print('fst.bin generated.')
+        added, removed = generate(args.path, manifest_path, args.jobs)
+    print('fst.bin generated (%d added, %d removed).' % (len(added),
+                                                        len(removed)))
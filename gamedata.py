@@ -26,13 +26,15 @@
 
 from __future__ import print_function, unicode_literals
 import sys
-from collections import namedtuple
-from struct import unpack, pack, pack_into
+from collections import OrderedDict, namedtuple
+from struct import unpack, unpack_from, pack, pack_into
 if sys.version_info[0] > 2:
     unicode = str
     xrange = range
 
 import bin
+import profiling
+import sjis
 
 
 class GameData(bin.BinFile):
@@ -59,7 +61,7 @@ class GameData(bin.BinFile):
                                              'id_offset', 'id_size'])
         if table_name == 'Chapter':
             offset = unpack('<I', self._data[:0x4])[0]
-            return TableInfo._make((offset, 0x8, 0x1C, 0x4, 1, 0))
+            return TableInfo._make((offset, 0x4, 0x1C, 0x8, 1))
         elif table_name == 'Character':
             offset = unpack('<I', self._data[0x8:0xC])[0]
             return TableInfo._make((offset + 0x10, offset + 0x4, 0x98, 0x24, 2))
@@ -88,6 +90,8 @@ class GameData(bin.BinFile):
         else:
             raise ValueError('Unsupported table name.')
 
+    @profiling.profiled('gamedata.append', lambda self, data_type, ids, names:
+                        len(self))
     def append(self, data_type, ids, names):
         """Create and append new data to this file.
 
@@ -122,22 +126,21 @@ class GameData(bin.BinFile):
         # Create new data
         new_data = bytearray(b'\0' * data_diff)
         new_labels = []         # List of new labels, in Shift-JIS encoding
-        total_length = 0
+        label_index = self.label_index()
         main_label_offsets = [] # Used for adding pointers to pointer region 2
 
         for i in xrange(count):
             # Label and pointers
-            main_label_offsets.append(len(self._labels) + total_length)
             for j in xrange(len(ptr_info)):
+                label = sjis.encode(ptr_info[j][1] + '_' + names[i])
+                label_start = self._intern_label(label, label_index,
+                                                 new_labels)
+                if j == 0:
+                    main_label_offsets.append(label_start)
+
                 # Add new label pointers to the data region
-                label_ptr = label0_offset + len(self._labels) + total_length
                 offset = info.size * i + ptr_info[j][0]
-                pack_into('<I', new_data, offset, label_ptr)
-
-                # Keep track of the new labels
-                label = (ptr_info[j][1] + '_' + names[i]).encode('shift-jis')
-                new_labels.append(label)
-                total_length += len(label) + 1
+                pack_into('<I', new_data, offset, label0_offset + label_start)
 
             # Assign a new ID
             offset = info.size * i + info.id_offset
@@ -150,12 +153,12 @@ class GameData(bin.BinFile):
         data = bytearray(self._data)
         for ptr_index in xrange(len(self._p1_list)):
             p1_ptr = self._p1_list[ptr_index]
-            if p1_ptr > end_offset:
+            if p1_ptr >= end_offset:
                 self._p1_list[ptr_index] += data_diff
             ptr = unpack('<I', self._data[p1_ptr:p1_ptr + 4])[0]
-            if ptr > end_offset and ptr < old_label0_offset:        # Sub-table
+            if ptr >= end_offset and ptr < old_label0_offset:       # Sub-table
                 pack_into('<I', data, p1_ptr, ptr + data_diff)
-            elif ptr > old_label0_offset:                           # Label
+            elif ptr >= old_label0_offset:                          # Label
                 pack_into('<I', data, p1_ptr, ptr + p2_diff)
 
         # Append data
@@ -171,7 +174,7 @@ class GameData(bin.BinFile):
         # Fix pointer region 2
         for ptr_index in xrange(len(self._p2_list)):
             data_ptr, label_ptr = self._p2_list[ptr_index]
-            if data_ptr > end_offset:
+            if data_ptr >= end_offset:
                 self._p2_list[ptr_index] = (data_ptr + data_diff, label_ptr)
             else:
                 self._p2_list[ptr_index] = (data_ptr, label_ptr)
@@ -182,12 +185,15 @@ class GameData(bin.BinFile):
             self._p2_list.append((end_offset + info.size * i, main_label_offsets[i]))
 
         # Append labels
-        self._labels += b'\0'.join([l for l in new_labels]) + b'\0'
+        if new_labels:
+            self._labels += b'\0'.join(new_labels) + b'\0'
 
         # At this point, the file is already usable, but we would like to make
         # it properly just like the original.
         # self.format()
 
+    @profiling.profiled('gamedata.append_character',
+                        lambda self, *args, **kwargs: len(self))
     def append_character(self, ids, names, supports=[], attack=True, defense=True):
         """Append a new character with support, attack stance and defensive
         stance table.
@@ -284,21 +290,20 @@ class GameData(bin.BinFile):
         # Create new characters
         new_data = bytearray(b'\0' * main_diff)
         new_labels = []         # List of new labels, in Shift-JIS encoding
-        total_length = 0
+        label_index = self.label_index()
         main_label_offsets = [] # Used for adding pointers to pointer region 2
 
         for i in xrange(count):
-            main_label_offsets.append(len(self._labels) + total_length)
             for j in xrange(len(ptr_info)):
+                label = sjis.encode(ptr_info[j][1] + '_' + names[i])
+                label_start = self._intern_label(label, label_index,
+                                                 new_labels)
+                if j == 0:
+                    main_label_offsets.append(label_start)
+
                 # Add new label pointers to the data region
-                ptr = label0_offset + len(self._labels) + total_length
                 offset = i * info.size + ptr_info[j][0]
-                pack_into('<I', new_data, offset, ptr)
-
-                # Keep track of the new labels
-                label = (ptr_info[j][1] + '_' + names[i]).encode('shift-jis')
-                new_labels.append(label)
-                total_length += len(label) + 1
+                pack_into('<I', new_data, offset, label0_offset + label_start)
 
             # Add new attack stance pointers
             if attack:
@@ -325,13 +330,13 @@ class GameData(bin.BinFile):
             p1_ptr = self._p1_list[ptr_index]
             if p1_ptr < end_offset:
                 pass
-            elif ptr < as_end_offset:
+            elif p1_ptr < as_end_offset:
                 self._p1_list[ptr_index] += main_diff
-            elif ptr < ds_end_offset:
+            elif p1_ptr < ds_end_offset:
                 self._p1_list[ptr_index] += main_diff + as_diff
-            elif ptr < sp_ptr_end_offset:
+            elif p1_ptr < sp_ptr_end_offset:
                 self._p1_list[ptr_index] += main_diff + as_diff + ds_diff
-            elif ptr < sp_data_end_offset:
+            elif p1_ptr < sp_data_end_offset:
                 self._p1_list[ptr_index] += main_diff + as_diff + ds_diff + \
                     len(supports) * 4
             else: # Label
@@ -409,7 +414,236 @@ class GameData(bin.BinFile):
             self._p2_list.append((end_offset + info.size * i, main_label_offsets[i]))
 
         # Append labels
-        self._labels += b'\0'.join([l for l in new_labels]) + b'\0'
+        if new_labels:
+            self._labels += b'\0'.join(new_labels) + b'\0'
+
+
+class Support(namedtuple('Support', ['partner', 'c', 'b', 'a', 's', 'unknown',
+                                     'global_index'])):
+    """A support of a character with a partner.
+
+    `partner`: Character ID of the partner
+    `c`, `b`, `a`, `s`: Support points needed for each rank. -1 means the
+        rank is not available.
+    `global_index`: Index of the pair, which is the same on both sides
+    """
+    __slots__ = ()
+
+
+class SupportGraph(object):
+    """All support tables of GameData.bin, decoded at once.
+
+    Every support table (the support list of a character) is kept as a list
+    of Support objects, keyed by character ID. Supports are edited on both
+    sides at the same time, and write() rebuilds the whole support region of
+    the file in a single relocation pass.
+
+    Support entries which are filled with zeros (the placeholders created by
+    GameData.append_character) are dropped.
+
+    Example:
+        >>> graph = SupportGraph(game_data)
+        >>> graph[400]                     # Supports of character 400
+        >>> graph.add_character(401, [1, 2, 3])
+        >>> graph.link(401, 4, (3, 7, 12, 18))
+        >>> graph.write(game_data)
+    """
+    SIZE = 12
+    DEFAULT_POINTS = (4, 9, 14, -1) # C, B, A, S
+
+    @profiling.profiled('supports.decode', lambda self, game_data:
+                        len(game_data))
+    def __init__(self, game_data):
+        """Decode the support tables of a GameData object."""
+        data = game_data.data
+        info = game_data.get_table_info('Character')
+        spinfo = game_data.get_table_info('Support')
+        chcount = unpack_from('<H', data, info.count_offset)[0]
+        spcount = unpack_from('<H', data, spinfo.count_offset)[0]
+
+        # Character ID <-> support ID
+        self.support_ids = OrderedDict()  # Character ID -> support ID
+        self.rows = {}                    # Character ID -> character index
+        for i in xrange(chcount):
+            offset = info.offset + i * info.size
+            id = unpack_from('<H', data, offset + info.id_offset)[0]
+            self.rows[id] = i
+            support_id = unpack_from('<H', data, offset + 0x30)[0]
+            if support_id != 0xFFFF:
+                self.support_ids[id] = support_id
+        characters = dict([(v, k) for k, v in self.support_ids.items()])
+
+        # Support tables, in file order
+        self.tables = OrderedDict()       # Character ID -> list of Support
+        self.orphans = OrderedDict()      # Support ID -> list of Support
+        end = spinfo.offset + 4 * spcount
+        for offset in unpack_from('<%dI' % spcount, data, spinfo.offset):
+            support_id, count = unpack_from('<HH', data, offset)
+            supports = []
+            for j in xrange(count):
+                cells = unpack_from('<HH4bHH', data,
+                                    offset + 0x4 + j * self.SIZE)
+                if any(cells):
+                    supports.append(Support(cells[0], *cells[2:]))
+            if support_id in characters:
+                self.tables[characters[support_id]] = supports
+            else: # Not referenced by any character; kept as it is
+                self.orphans[support_id] = supports
+            end = max(end, offset + 0x4 + count * self.SIZE)
+        self.start = spinfo.count_offset
+        self.end = end
+        # Orphaned and one-sided supports keep their global indices too
+        self._next_global = 1 + max([-1] + [
+            support.global_index
+            for supports in list(self.tables.values()) +
+            list(self.orphans.values())
+            for support in supports])
+
+    def __contains__(self, character):
+        return character in self.tables
+
+    def __getitem__(self, character):
+        return self.tables[character]
+
+    def __iter__(self):
+        return iter(self.tables)
+
+    def __len__(self):
+        return len(self.tables)
+
+    def edges(self):
+        """Iterate through all pairs once, as (character, Support)."""
+        seen = set()
+        for character, supports in self.tables.items():
+            for support in supports:
+                key = (min(character, support.partner),
+                       max(character, support.partner))
+                if key not in seen:
+                    seen.add(key)
+                    yield character, support
+
+    def find(self, character, partner):
+        """Get the support of `character` with `partner`, or None."""
+        for support in self.tables.get(character, ()):
+            if support.partner == partner:
+                return support
+        return None
+
+    def link(self, character, partner, points=None, unknown=None):
+        """Add or change the support between two characters, on both sides.
+
+        `points`: (C, B, A, S) support points. Default: the current points,
+            or DEFAULT_POINTS for a new support
+        `unknown`: Unknown field of the entries. Default: the current value,
+            or 1 for a new support
+        Characters without a support table get a new one.
+        """
+        if character == partner:
+            raise ValueError('a character cannot support itself')
+        old = self.find(character, partner) or self.find(partner, character)
+        if old is not None:
+            global_index = old.global_index
+            if points is None:
+                points = (old.c, old.b, old.a, old.s)
+            if unknown is None:
+                unknown = old.unknown
+        else:
+            global_index = self._next_global
+            self._next_global += 1
+        if points is None:
+            points = self.DEFAULT_POINTS
+        if unknown is None:
+            unknown = 1
+        for a, b in ((character, partner), (partner, character)):
+            support = Support(b, points[0], points[1], points[2], points[3],
+                              unknown, global_index)
+            supports = self.tables.setdefault(a, [])
+            for i in xrange(len(supports)):
+                if supports[i].partner == b:
+                    supports[i] = support
+                    break
+            else:
+                supports.append(support)
+
+    def unlink(self, character, partner):
+        """Remove the support between two characters, on both sides."""
+        for a, b in ((character, partner), (partner, character)):
+            if a in self.tables:
+                self.tables[a] = [support for support in self.tables[a]
+                                  if support.partner != b]
+
+    def add_character(self, character, partners, points=None):
+        """Add the supports of a character with many partners at once.
+
+        `partners`: List of partner character IDs, or a dict of partner IDs
+            and (C, B, A, S) points
+        `points`: Points of the partners which are given without points.
+            Default: DEFAULT_POINTS
+        """
+        self.tables.setdefault(character, [])
+        if isinstance(partners, dict):
+            items = partners.items()
+        else:
+            items = [(partner, None) for partner in partners]
+        for partner, partner_points in items:
+            self.link(character, partner, partner_points or points)
+
+    def remove_character(self, character):
+        """Remove all supports of a character, on both sides."""
+        for support in list(self.tables.get(character, ())):
+            self.unlink(character, support.partner)
+
+    @profiling.profiled('supports.write', lambda self, game_data:
+                        len(game_data))
+    def write(self, game_data):
+        """Write all support tables back to a GameData object.
+
+        The support region is rebuilt and the rest of the file is relocated
+        once. Characters which got a new support table get a new support ID.
+        The GameData object must be the one this graph was decoded from, or
+        an unchanged copy of it.
+        """
+        info = game_data.get_table_info('Character')
+
+        # Give support IDs to the characters which do not have one yet
+        used = set(self.support_ids.values()) | set(self.orphans)
+        next_id = 0
+        values = []
+        for character in self.tables:
+            if character in self.support_ids:
+                continue
+            if character not in self.rows:
+                raise KeyError('character 0x%X does not exist' % character)
+            while next_id in used:
+                next_id += 1
+            used.add(next_id)
+            self.support_ids[character] = next_id
+            offset = info.offset + self.rows[character] * info.size + 0x30
+            values.append((offset, '<H', next_id))
+        if values:
+            game_data.pack_values(values)
+
+        # Count, pointer table and support tables
+        tables = [(self.support_ids[character], supports)
+                  for character, supports in self.tables.items()]
+        tables.extend(self.orphans.items())
+        offset = self.start + 0x4 + 4 * len(tables)
+        pointers = []
+        blocks = []
+        for support_id, supports in tables:
+            pointers.append(offset)
+            block = [pack('<HH', support_id, len(supports))]
+            for i in xrange(len(supports)):
+                s = supports[i]
+                block.append(pack('<HH4bHH', s.partner, i, s.c, s.b, s.a,
+                                  s.s, s.unknown, s.global_index))
+            blocks.append(b''.join(block))
+            offset += 0x4 + len(supports) * self.SIZE
+        region = b''.join([pack('<I', len(tables)),
+                           pack('<%dI' % len(pointers), *pointers)] + blocks)
+        game_data.splice(self.start, self.end, region,
+                         [0x4 + 4 * i for i in xrange(len(pointers))])
+        self.end = self.start + len(region)
 
 
 def load_file(path):
@@ -418,11 +652,21 @@ def load_file(path):
     Parameters,
     `path`, Path to a bin file.
     """
-    with open(path, 'rb') as file:
-        header = file.read(0x20)
-        raw = file.read()
+    with profiling.phase('io.read') as p:
+        with open(path, 'rb') as file:
+            header = file.read(0x20)
+            raw = file.read()
+        p.nbytes = len(header) + len(raw)
     return GameData(header, raw)
 
+def load(raw):
+    """Load data from raw bytes to a GameData object.
+
+    Parameters:
+    ``raw``: Raw data.
+    """
+    return GameData(raw[:0x20], raw[0x20:])
+
 
 if __name__ == '__main__':
     print('This script is a library and does not mean to be used directly.')
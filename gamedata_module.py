@@ -47,17 +47,25 @@ Example:
 
     Add a new character with label ABC who has support with 47 characters:
         `python gamedata_module.py --character 400 ABC 47 --support`
+
+    Generate the support modules of all characters:
+        `python gamedata_module.py --support all`
 """
 
 from __future__ import print_function, unicode_literals
+import io
 import os
 import sys
-from struct import unpack
+from struct import unpack, unpack_from
 if sys.version_info[0] > 2:
     unicode = str
     xrange = range
 
+import atomic
 import gamedata
+import gamedata_schema
+import nightmare
+import profiling
 
 
 MODULE_FILES = {
@@ -97,6 +105,10 @@ MODULE_FILES = {
     ]
 }
 
+# Nightmare is a Windows program, so list files are in the ANSI code page.
+# Latin-1 keeps every existing byte as it is.
+LIST_ENCODING = 'latin-1'
+
 MODULE_ORDER = [
     ('Chapter', os.path.join('Chapter', 'Chapter.nmm')),
     ('Character', os.path.join('Character', 'Character.nmm')),
@@ -113,225 +125,356 @@ MODULE_ORDER = [
     ('Visit Bonus', os.path.join('Visit Bonus', 'VisitBonus.nmm'))
 ]
 
-def update_modules(data_type, ids, names):
-    """Update the modules."""
-    # Update data counter in the .nmm file
-    with open(os.path.join(data_type, data_type + '.nmm'), 'r+') as file:
-        lines = file.readlines()
-        lines[5] = str(int(lines[5]) + len(names)) + '\n' # Update count
-        file.seek(0)
-        file.writelines(lines)
-
-    # Append the new names to the .txt file
-    with open(os.path.join(data_type, data_type + '.txt'), 'r+') as file:
-        lines = file.readlines()
-        lines.extend(names)
-        file.seek(0)
-        file.writelines(lines)
-
-    # Update other modules
-    for path in MODULE_FILES[data_type]:
-        with open(path, 'r+') as file:
-            lines = file.readlines()
+class ModuleProject(object):
+    """The Nightmare modules and list files of GameData.bin, in memory.
+
+    Files are read when they are needed, at most once. All changes are kept
+    in memory until save() is called, which writes every changed file once,
+    so a batch of additions to several tables touches each file only once.
+
+    Example:
+        >>> project = ModuleProject()
+        >>> project.add('Item', [0x400], ['ABC'], 0x68)
+        >>> project.add('Class', [0x100], ['DEF'], 0x80)
+        >>> project.save()
+    """
+
+    def __init__(self, root='', transaction=None):
+        """`root`: Folder which contains the module folders. Default: current
+            folder
+        `transaction`: An atomic.Transaction which the files are read from
+            (so changes staged earlier are seen) and written to
+        """
+        self.root = root
+        self.transaction = transaction
+        self._lines = {}        # Path -> list of lines, with line endings
+        self._changed = []      # Changed paths, in the order of changes
+
+    def lines(self, path):
+        """Get the lines of a file, including their line endings. The list
+        can be modified; call touch() afterwards.
+
+        `path`: Path relative to `root`
+        """
+        if path not in self._lines:
+            full_path = os.path.join(self.root, path)
+            if self.transaction is None:
+                with io.open(full_path, 'rb') as file:
+                    text = file.read().decode(LIST_ENCODING)
+            else:
+                text = self.transaction.read(full_path, LIST_ENCODING)
+            self._lines[path] = io.StringIO(text, newline='').readlines()
+        return self._lines[path]
+
+    def touch(self, path):
+        """Mark a file as changed."""
+        if path not in self._changed:
+            self._changed.append(path)
+
+    @property
+    def changed(self):
+        """Paths of the changed files, relative to `root`."""
+        return list(self._changed)
+
+    def update_count(self, data_type, count):
+        """Add `count` to the entry count of the main module of a table."""
+        path = os.path.join(data_type, data_type + '.nmm')
+        lines = self.lines(path)
+        lines[5] = str(int(lines[5]) + count) + '\n'
+        self.touch(path)
+
+    def append_names(self, data_type, ids, names):
+        """Append new entries to the name list of a table and to the lists
+        of the modules which refer to the table.
+        """
+        path = os.path.join(data_type, data_type + '.txt')
+        lines = self.lines(path)
+        if len(lines) > 0 and not lines[-1].endswith('\n'):
+            lines[-1] += '\n'
+        lines.extend([name + '\n' for name in names])
+        self.touch(path)
+
+        for path in MODULE_FILES[data_type]:
+            lines = self.lines(path)
             lines[0] = str(int(lines[0]) + len(names)) + '\n'
             for index in xrange(len(ids)):
                 lines.append('0x' + format(ids[index], 'X') + ' ' +
                              names[index] + '\n')
-            file.seek(0)
-            lines = file.writelines(lines)
-
-def fix_module_offsets(game_data, data_type):
+            self.touch(path)
+
+    def shift_offsets(self, data_type, data_diff):
+        """Add `data_diff` to the base offset of every module which is after
+        the table of `data_type` in GameData.bin.
+        """
+        index = [t for t, path in MODULE_ORDER].index(data_type) + 1
+        for table, path in MODULE_ORDER[index:]:
+            lines = self.lines(path)
+            lines[4] = '0x' + format(int(lines[4][2:], 16) + data_diff,
+                                     'X') + '\n'
+            self.touch(path)
+
+    def add(self, data_type, ids, names, data_diff):
+        """Reflect new entries appended to a table of GameData.bin.
+
+        `data_type`: (Chapter, Character, Class, Item)
+        `ids`, `names`: IDs and names of the new entries
+        `data_diff`: Number of bytes inserted into the data region
+        """
+        self.update_count(data_type, len(names))
+        self.append_names(data_type, ids, names)
+        self.shift_offsets(data_type, data_diff)
+
+    @profiling.profiled('modules.save')
+    def save(self, transaction=None):
+        """Write all changed files.
+
+        `transaction`: An atomic.Transaction which the files are written to.
+            Default: the transaction given to the constructor. If there is
+            none, every file is replaced immediately.
+
+        Return the paths of the written files, relative to `root`.
+        """
+        if transaction is None:
+            transaction = self.transaction
+        written = self._changed
+        for path in written:
+            data = ''.join(self._lines[path]).encode(LIST_ENCODING,
+                                                      'replace')
+            full_path = os.path.join(self.root, path)
+            if transaction is None:
+                atomic.write_file(full_path, data)
+            else:
+                transaction.write(full_path, data)
+        self._changed = []
+        return written
+
+@profiling.profiled('modules.update')
+def update_modules(data_type, ids, names, root='', transaction=None):
+    """Update the modules.
+
+    `root`: Folder which contains the module folders. Default: current folder
+    `transaction`: An atomic.Transaction which the changes are written to.
+        If it is None, every file is replaced as soon as it is updated.
+
+    To add entries to several tables, use a ModuleProject instead.
+    """
+    project = ModuleProject(root, transaction)
+    project.update_count(data_type, len(names))
+    project.append_names(data_type, ids, names)
+    project.save()
+
+@profiling.profiled('modules.fix_offsets')
+def fix_module_offsets(game_data, data_type, count=1, root='',
+                       transaction=None):
     """Fix the base offset of some modules.
 
     `game_data`: GameData object
     `data_type`: (Chapter, Character, Class, Item)
+    `count`: Number of appended entries. Default: 1
+    `root`: Folder which contains the module folders. Default: current folder
+    `transaction`: See update_modules
     """
-    index = 0
-    while MODULE_ORDER[index][0] != data_type:
-        index += 1
-    index += 1
-    data_diff = game_data.get_table_info(data_type).size * len(ids)
-    while index < len(MODULE_ORDER):
-        with open(MODULE_ORDER[index][1], 'r+') as file:
-            lines = file.readlines()
-            lines[4] = '0x' + format(int(lines[4][2:], 16) + data_diff, 'X') + '\n'
-            file.seek(0)
-            file.writelines(lines)
-        index += 1
-
-def generate_support_module(gamedata_obj, index):
-    """Generate a support module for certain characters
+    project = ModuleProject(root, transaction)
+    project.shift_offsets(data_type,
+                          game_data.get_table_info(data_type).size * count)
+    project.save()
 
-    Arguments:
-    `gamedata_obj`: GameData object
-    `index`: Character index
+def support_tables(gamedata_obj):
+    """Get the support tables of GameData.bin.
+
+    Return a dict of support IDs and (entry offset in the data region,
+    entry count).
     """
     data = gamedata_obj.data
-    chinfo = gamedata_obj.get_table_info('Character')
     spinfo = gamedata_obj.get_table_info('Support')
-    chcount = unpack('<H', data[chinfo.count_offset:chinfo.count_offset+2])[0]
     spcount = unpack('<H', data[spinfo.count_offset:spinfo.count_offset+2])[0]
-
-    # Get all available support IDs and offset
-    support_ids = {}
+    tables = {}
     sp_offsets = unpack('<' + str(spcount) + 'I',
         data[spinfo.offset:spinfo.offset + 4 * spcount])
-    for i in xrange(spcount):
-        id = unpack('<H', data[sp_offsets[i]:sp_offsets[i] + 2])[0]
-        support_ids[id] = sp_offsets[i]
+    for offset in sp_offsets:
+        id, count = unpack('<HH', data[offset:offset + 4])
+        tables[id] = (offset + 0x4, count)
+    return tables
+
+def support_module_files(gamedata_obj, index, tables=None):
+    """Build the support module of a character.
+
+    `gamedata_obj`: GameData object
+    `index`: Character index
+    `tables`: Result of support_tables(), if it is already known
 
-    # Support ID and data offset
+    Return a tuple (folder, [(path, text), ...]). Raise KeyError if the
+    character has no support.
+    """
+    if tables is None:
+        tables = support_tables(gamedata_obj)
+    chinfo = gamedata_obj.get_table_info('Character')
     offset = chinfo.offset + index * chinfo.size + 0x30
-    id = unpack('<H', data[offset:offset + 2])[0]
-    offset = support_ids[id]
-    sp_chcount = unpack('<H', data[offset + 0x2:offset + 0x4])[0]
+    id = unpack('<H', gamedata_obj.data[offset:offset + 2])[0]
+    offset, count = tables[id]
 
-    # Create new modules
     spdir = 'Support_' + str(id)
+    title = 'Fire Emblem Fates Support Editor'
+    module = nightmare.Module()
+    module.fromrowclass(gamedata_schema.Support, offset + 0x20, count,
+                        title + ' by RainThunder', 'Support.txt',
+                        gamedata_schema.Support.lists)
+    support_list = '\n'.join([str(i) for i in xrange(count)])
+    return spdir, [(os.path.join(spdir, 'Support.nmm'),
+                    module.tostring(title)),
+                   (os.path.join(spdir, 'Support.txt'), support_list)]
+
+def support_indices(gamedata_obj, tables=None):
+    """Get the indices of the characters who have supports."""
+    if tables is None:
+        tables = support_tables(gamedata_obj)
+    data = gamedata_obj.data
+    chinfo = gamedata_obj.get_table_info('Character')
+    chcount = unpack('<H', data[chinfo.count_offset:chinfo.count_offset+2])[0]
+    return [i for i in xrange(chcount)
+            if unpack_from('<H', data, chinfo.offset + i * chinfo.size +
+                           0x30)[0] in tables]
+
+def _write_support_files(files, transaction):
+    for path, text in files:
+        # Same line endings as a file written in text mode
+        data = text.replace('\n', os.linesep).encode(LIST_ENCODING)
+        if transaction is None:
+            atomic.write_file(path, data)
+        else:
+            transaction.write(path, data)
+
+@profiling.profiled('modules.support')
+def generate_support_module(gamedata_obj, index, transaction=None):
+    """Generate a support module for certain characters
+
+    Arguments:
+    `gamedata_obj`: GameData object
+    `index`: Character index
+    `transaction`: An atomic.Transaction which the module is written to.
+        If it is None, the files are written immediately.
+    """
+    spdir, files = support_module_files(gamedata_obj, index)
     if not os.path.isdir(spdir):
         os.mkdir(spdir)
-    with open(os.path.join(spdir, 'Support.nmm'), 'w') as file:
-        file.write('\n'.join([
-            '#Fire Emblem Fates Support Editor',
-            '',
-            '1',
-            'Fire Emblem Fates Support Editor by RainThunder',
-            '0x' + format(offset + 0x4, 'X'),
-            str(sp_chcount),
-            '12',
-            'Support.txt',
-            'NULL',
-            '',
-            'Character ID',
-            '0',
-            '2',
-            'NEHU',
-            'NULL',
-            '',
-            'Support index',
-            '2',
-            '2',
-            'NEDU',
-            'NULL',
-            '',
-            'C support point',
-            '4',
-            '1',
-            'NEDS',
-            'NULL',
-            '',
-            'B support point',
-            '5',
-            '1',
-            'NEDS',
-            'NULL',
-            '',
-            'A support point',
-            '6',
-            '1',
-            'NEDS',
-            'NULL',
-            '',
-            'S support point',
-            '7',
-            '1',
-            'NEDS',
-            'NULL',
-            '',
-            'Unknown',
-            '8',
-            '2',
-            'NEHU',
-            'NULL',
-            '',
-            'Global support index',
-            '10',
-            '2',
-            'NEDU',
-            'NULL'
-        ]))
-    with open(os.path.join(spdir, 'Support.txt'), 'w') as file:
-        file.write('\n'.join([str(i) for i in xrange(sp_chcount)]))
+    _write_support_files(files, transaction)
     return spdir
 
+@profiling.profiled('modules.supports')
+def generate_support_modules(gamedata_obj, transaction=None):
+    """Generate the support modules of all characters who have supports.
+
+    `gamedata_obj`: GameData object
+    `transaction`: See generate_support_module
+
+    Return the list of generated folders.
+    """
+    tables = support_tables(gamedata_obj)
+    folders = []
+    for index in support_indices(gamedata_obj, tables):
+        spdir, files = support_module_files(gamedata_obj, index, tables)
+        if not os.path.isdir(spdir):
+            os.mkdir(spdir)
+        _write_support_files(files, transaction)
+        folders.append(spdir)
+    return folders
+
 
 if __name__ == '__main__':
     import argparse
 
     parser = argparse.ArgumentParser()
-    group = parser.add_mutually_exclusive_group()
-    group.add_argument('-i', '--item', action='append', nargs=2,
-                       help='add an item', metavar=('id', 'name'))
-    group.add_argument('-p', '--character', action='append', nargs=3,
-                       help=('add a character with id, name and sp number of '
-                       'support characters. Attack / defense stance entry '
-                       'will be added by default'),
-                       metavar=('id', 'name', 'sp'))
-    group.add_argument('-c', '--chapter', action='append', nargs=2,
+    parser.add_argument('-i', '--item', action='append', nargs=2,
+                        help='add an item', metavar=('id', 'name'))
+    parser.add_argument('-p', '--character', action='append', nargs=3,
+                        help=('add a character with id, name and sp number '
+                        'of support characters. Attack / defense stance '
+                        'entry will be added by default'),
+                        metavar=('id', 'name', 'sp'))
+    parser.add_argument('-c', '--chapter', action='append', nargs=2,
                         help='add a chapter', metavar=('id', 'name'))
-    group.add_argument('-j', '--class', action='append', dest='class_args',
+    parser.add_argument('-j', '--class', action='append', dest='class_args',
                         nargs=2, help='add a class', metavar=('id', 'name'))
-    parser.add_argument('-s', '--support', nargs='?', default=None,
+    parser.add_argument('-s', '--support', nargs='?', const='', default=None,
                         help=('generate support module for character at '
-                        'index i. If this argument is used with --character, '
-                        'generate module for the new character (i will be '
-                        'ignored)'), metavar='i')
+                        'index i, or for all characters if i is "all". If '
+                        'this argument is used with --character, generate '
+                        'module for the new character (i will be ignored)'),
+                        metavar='i')
+    profiling.add_argument(parser)
     args = parser.parse_args()
+    profiling.setup(args.profile)
 
-    arg_list = None
-    if args.chapter:
-        arg_list = args.chapter
-        data_type = 'Chapter'
-    if args.character:
-        arg_list = args.character
-        data_type = 'Character'
-    if args.class_args:
-        arg_list = args.class_args
-        data_type = 'Class'
-    if args.item:
-        arg_list = args.item
-        data_type = 'Item'
-
-    if arg_list != None: # Adding something
-        # Get data IDs and names from the arguments
-        ids = []
-        names = []
-        for data in arg_list:
-            try:
-                if data[0].startswith('0x'):
-                    ids.append(int(data[0], 16))
-                else:
-                    ids.append(int(data[0]))
-            except ValueError:
-                print('Data ID must be an integer.')
-                exit()
-            names.append(data[1])
-
-        # Add new data to GameData.bin
-        game_data = gamedata.load_file('GameData.bin')
-        if args.character is None:
-            game_data.append(data_type, ids, names)
+    # Tables are added in file order
+    additions = [(data_type, arg_list) for data_type, arg_list in [
+        ('Chapter', args.chapter),
+        ('Character', args.character),
+        ('Class', args.class_args),
+        ('Item', args.item)
+    ] if arg_list]
 
-        else: # Add character
-            supports = []
+    if len(additions) > 0: # Adding something
+        game_data = gamedata.load_file('GameData.bin')
+        project = ModuleProject()
+        messages = []
+        new_characters = []
+        for data_type, arg_list in additions:
+            # Get data IDs and names from the arguments
+            ids = []
+            names = []
             for data in arg_list:
-                supports.append(int(data[2]))
-            game_data.append_character(ids, names, supports)
-            if args.support: # Generate support module
-                info = game_data.get_table_info('Character')
-                chcount = unpack('<H', info.count_offset)[0]
-                for i in xrange(1, len(names)):
-                    generate_support_module(game_data, chcount - i)
+                try:
+                    if data[0].startswith('0x'):
+                        ids.append(int(data[0], 16))
+                    else:
+                        ids.append(int(data[0]))
+                except ValueError:
+                    print('Data ID must be an integer.')
+                    exit()
+                names.append(data[1])
+
+            # Add new data to GameData.bin
+            data_length = len(game_data.data)
+            if data_type != 'Character':
+                game_data.append(data_type, ids, names)
+            else:
+                supports = [int(data[2]) for data in arg_list]
+                game_data.append_character(ids, names, supports)
+                new_characters = [i for i in xrange(len(names))
+                                  if supports[i] > 0]
+                character_count = len(names)
+            project.add(data_type, ids, names,
+                        len(game_data.data) - data_length)
+            messages.append('Added %d %s(s) to GameData.bin.' %
+                            (len(ids), data_type))
 
         game_data.format()
-        with open('GameData.bin', 'wb') as file:
-            file.write(game_data.tobin())
-
-        update_modules(data_type, ids, names) # Update some modules
-        fix_module_offsets(game_data, data_type) # Fix some modules' offsets
-        print('Added %d %s(s) to GameData.bin.' % (len(ids), data_type))
+        output = game_data.tobin()
+        # GameData.bin and the modules are replaced together, or not at all
+        with profiling.phase('io.write', len(output)):
+            with atomic.Transaction() as transaction:
+                transaction.write('GameData.bin', output)
+                project.save(transaction)
+                if args.support is not None and len(new_characters) > 0:
+                    # Generate support modules for the new characters
+                    info = game_data.get_table_info('Character')
+                    chcount = unpack('<H', game_data.data[
+                        info.count_offset:info.count_offset + 2])[0]
+                    for i in new_characters:
+                        spdir = generate_support_module(
+                            game_data, chcount - character_count + i,
+                            transaction)
+                        messages.append('Support module "' + spdir +
+                                        '" was generated.')
+        print('\n'.join(messages))
+
+    elif args.support == 'all':
+        game_data = gamedata.load_file('GameData.bin')
+        with atomic.Transaction() as transaction:
+            folders = generate_support_modules(game_data, transaction)
+        print('%d support modules were generated.' % len(folders))
 
-    elif args.support != None:
+    elif args.support:
         game_data = gamedata.load_file('GameData.bin')
         try:
             spdir = generate_support_module(game_data, int(args.support))
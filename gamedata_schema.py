@@ -0,0 +1,792 @@
+#!/usr/bin/env python2
+#
+# The MIT License
+#
+# Copyright (c) 2017 RainThunder.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+"""Row schemas of the tables in GameData.bin.
+
+These schemas are the source of the Nightmare modules of GameData.bin. Each
+Row class describes one entry of a table: every field is named as it is in
+the module, and the fields whose names start with an underscore are bytes
+which are not documented yet. The `lists` attribute maps field names to the
+list files which are used to show them as drop-down lists. Some classes also
+have `sections`, the comments written before some fields in the module (e.g.
+#Base Stats), and `module_names`, the names shown in the module for fields
+whose names have an offset suffix only to be unique (e.g. 'Unknown (0x5C)'
+is shown as 'Unknown', like nightmare.Module.column_names() reads it).
+
+`TABLES` describes where every table is in GameData.bin and which module file
+it is written to. See nmm_generator.py.
+
+Example:
+    >>> import nightmare, gamedata_schema
+    >>> module = nightmare.Module()
+    >>> module.fromrowclass(gamedata_schema.Item, 0x14F68, 355,
+                            lists=gamedata_schema.Item.lists)
+"""
+
+import os
+from collections import OrderedDict, namedtuple
+
+import basetypes
+from basetypes import Structure, U8, S8, U16, S16, U32
+
+HEX = basetypes.Formats.HEX
+STR = basetypes.Formats.STR
+
+
+def _module_names(*fields):
+    """Map the names of fields which only have an offset suffix to be unique
+    in their Row class (e.g. 'Unknown (0x5C)') to the names shown in the
+    modules ('Unknown')."""
+    return dict([(f, f[:f.rindex(' (0x')]) for f in fields])
+
+
+##############################################################################
+# Raw bytes
+##############################################################################
+class Bytes2(basetypes.Array):
+    """2 raw bytes."""
+    type = U8
+    length = 2
+    size = 2
+    lists = {}
+
+
+class Bytes3(basetypes.Array):
+    """3 raw bytes."""
+    type = U8
+    length = 3
+    size = 3
+    lists = {}
+
+
+class Bytes4(basetypes.Array):
+    """4 raw bytes."""
+    type = U8
+    length = 4
+    size = 4
+    lists = {}
+
+
+class Bytes6(basetypes.Array):
+    """6 raw bytes."""
+    type = U8
+    length = 6
+    size = 6
+    lists = {}
+
+
+class Bytes7(basetypes.Array):
+    """7 raw bytes."""
+    type = U8
+    length = 7
+    size = 7
+    lists = {}
+
+
+class Bytes8(basetypes.Array):
+    """8 raw bytes."""
+    type = U8
+    length = 8
+    size = 8
+    lists = {}
+
+
+class Bytes16(basetypes.Array):
+    """16 raw bytes."""
+    type = U8
+    length = 16
+    size = 16
+    lists = {}
+
+
+##############################################################################
+# GameData.bin tables
+##############################################################################
+class Chapter(basetypes.Row):
+    """Chapter entry in GameData.bin."""
+    structure = OrderedDict([
+        ('Chapter pointer', Structure(U32, HEX)),
+        ('Battlefield pointer', Structure(U32, HEX)),
+        ('Chapter ID', Structure(U8, HEX)),
+        ('Chapter Type', Structure(U8, HEX)),
+        ('Birthright Index', Structure(U8, STR)),
+        ('Conquest Index', Structure(U8, STR)),
+        ('Revelation Index', Structure(U8, STR)),
+        ('Birthright condition', Structure(U8, HEX)),
+        ('Conquest condition', Structure(U8, HEX)),
+        ('Revelation condition', Structure(U8, HEX)),
+        ('Married character', Structure(U16, HEX)),
+        ('Offspring Seal Level', Structure(U8, HEX)),
+        ('Offspring Seal Level (2)', Structure(U8, HEX)),
+        ('Route', Structure(U8, HEX)),
+        ('_0x15', Structure(Bytes7, HEX))
+    ])
+    size = 28
+    lists = {
+        'Chapter Type': 'ChapterType.txt',
+        'Birthright condition': 'Chapter2.txt',
+        'Conquest condition': 'Chapter2.txt',
+        'Revelation condition': 'Chapter2.txt',
+        'Married character': 'Character.txt',
+        'Route': 'Route.txt'
+    }
+
+
+class Character(basetypes.Row):
+    """Character entry in GameData.bin."""
+    structure = OrderedDict([
+        ('Flag 1 - 8', Structure(U8, HEX)),
+        ('Flag 9 - 16', Structure(U8, HEX)),
+        ('Flag 17 - 24', Structure(U8, HEX)),
+        ('Flag 25 - 32', Structure(U8, HEX)),
+        ('Flag 33 - 40', Structure(U8, HEX)),
+        ('Flag 41 - 48', Structure(U8, HEX)),
+        ('Flag 49 - 56', Structure(U8, HEX)),
+        ('Flag 57 - 63', Structure(U8, HEX)),
+        ('Character Pointer', Structure(U32, HEX)),
+        ('Face Pointer', Structure(U32, HEX)),
+        ('Asset Pointer', Structure(U32, HEX)),
+        ('Character Name Pointer', Structure(U32, HEX)),
+        ('Character Description Pointer', Structure(U32, HEX)),
+        ('Attack Stance Pointer', Structure(U32, HEX)),
+        ('Defense Stance Pointer', Structure(U32, HEX)),
+        ('Character ID', Structure(U16, HEX)),
+        ('Support Route', Structure(U8, HEX)),
+        ('Army ID', Structure(U8, HEX)),
+        ('Replace this Character ID from GameData', Structure(U16, HEX)),
+        ('Parent', Structure(U16, HEX)),
+        ('Class 1', Structure(U16, HEX)),
+        ('Class 2', Structure(U16, HEX)),
+        ('Support ID', Structure(U16, HEX)),
+        ('Level', Structure(U8, STR)),
+        ('Internal level', Structure(S8, STR)),
+        ('Enemy/Ally Flag', Structure(S8, STR)),
+        ('_0x35', Structure(Bytes3, HEX)),
+        ('Base HP', Structure(S8, STR)),
+        ('Base Strength', Structure(S8, STR)),
+        ('Base Magic', Structure(S8, STR)),
+        ('Base Skill', Structure(S8, STR)),
+        ('Base Speed', Structure(S8, STR)),
+        ('Base Luck', Structure(S8, STR)),
+        ('Base Defense', Structure(S8, STR)),
+        ('Base Resistance', Structure(S8, STR)),
+        ('HP Growth', Structure(U8, STR)),
+        ('Strength Growth', Structure(U8, STR)),
+        ('Magic Growth', Structure(U8, STR)),
+        ('Skill Growth', Structure(U8, STR)),
+        ('Speed Growth', Structure(U8, STR)),
+        ('Luck Growth', Structure(U8, STR)),
+        ('Defense Growth', Structure(U8, STR)),
+        ('Resistance Growth', Structure(U8, STR)),
+        ('HP Modifier', Structure(S8, STR)),
+        ('Strength Modifier', Structure(S8, STR)),
+        ('Magic Modifer', Structure(S8, STR)),
+        ('Skill Modifier', Structure(S8, STR)),
+        ('Speed Modifier', Structure(S8, STR)),
+        ('Luck Modifier', Structure(S8, STR)),
+        ('Defense Modifier', Structure(S8, STR)),
+        ('Resistance Modifier', Structure(S8, STR)),
+        ('_0x50', Structure(Bytes16, HEX)),
+        ('Sword/Katana Rank', Structure(U8, STR)),
+        ('Lance/Naginata Rank', Structure(U8, STR)),
+        ('Axe/Club Rank', Structure(U8, STR)),
+        ('Shuriken/Dagger Rank', Structure(U8, STR)),
+        ('Bow/Yumi Rank', Structure(U8, STR)),
+        ('Tome/Scroll Rank', Structure(U8, STR)),
+        ('Staff/Rod Rank', Structure(U8, STR)),
+        ('Stone Rank', Structure(U8, STR)),
+        ('Skill 1', Structure(U16, HEX)),
+        ('Skill 2', Structure(U16, HEX)),
+        ('Skill 3', Structure(U16, HEX)),
+        ('Skill 4', Structure(U16, HEX)),
+        ('Skill 5', Structure(U16, HEX)),
+        ('Skill Flags 1 - 8', Structure(U8, HEX)),
+        ('Skill Flags 9 - 16', Structure(U8, HEX)),
+        ('Personal Skill (Birthright)', Structure(U16, HEX)),
+        ('Personal Skill (Conquest)', Structure(U16, HEX)),
+        ('Personal Skill (Revelation)', Structure(U16, HEX)),
+        ('Day of birth', Structure(U8, STR)),
+        ('Month of birth', Structure(U8, STR)),
+        ('Reclass option 1', Structure(U16, HEX)),
+        ('Reclass Option 2', Structure(U16, HEX)),
+        ('Parent ID', Structure(U16, HEX)),
+        ('Child ID', Structure(U16, HEX)),
+        ('Support Index (parent - child and sibling support)',
+         Structure(S16, STR)),
+        ('Level Cap / 10', Structure(U8, STR)),
+        ('Amiibo', Structure(U8, STR)),
+        ('Combat Music Pointer', Structure(U32, HEX)),
+        ('Enemy Voice Pointer', Structure(U32, HEX)),
+        ('Amiibo weapon 1', Structure(U16, HEX)),
+        ('Amiibo weapon 2', Structure(U16, HEX)),
+        ('_0x94', Structure(Bytes4, HEX))
+    ])
+    size = 152
+    lists = {
+        'Flag 1 - 8': 'Flag1-8.txt',
+        'Flag 9 - 16': 'Flag9-16.txt',
+        'Flag 17 - 24': 'Flag17-24.txt',
+        'Flag 25 - 32': 'Flag25-32.txt',
+        'Flag 33 - 40': 'Flag33-40.txt',
+        'Flag 41 - 48': 'Flag41-48.txt',
+        'Flag 49 - 56': 'Flag49-56.txt',
+        'Flag 57 - 63': 'Flag57-63.txt',
+        'Support Route': 'Route.txt',
+        'Army ID': 'Army.txt',
+        'Replace this Character ID from GameData': 'CharID.txt',
+        'Parent': 'CharID.txt',
+        'Class 1': 'Class.txt',
+        'Class 2': 'Class.txt',
+        'Sword/Katana Rank': 'WeaponRank.txt',
+        'Lance/Naginata Rank': 'WeaponRank.txt',
+        'Axe/Club Rank': 'WeaponRank.txt',
+        'Shuriken/Dagger Rank': 'WeaponRank.txt',
+        'Bow/Yumi Rank': 'WeaponRank.txt',
+        'Tome/Scroll Rank': 'WeaponRank.txt',
+        'Staff/Rod Rank': 'WeaponRank.txt',
+        'Stone Rank': 'WeaponRank.txt',
+        'Skill 1': 'Skill.txt',
+        'Skill 2': 'Skill.txt',
+        'Skill 3': 'Skill.txt',
+        'Skill 4': 'Skill.txt',
+        'Skill 5': 'Skill.txt',
+        'Skill Flags 1 - 8': 'Flag1-8.txt',
+        'Skill Flags 9 - 16': 'Flag9-16.txt',
+        'Personal Skill (Birthright)': 'Skill.txt',
+        'Personal Skill (Conquest)': 'Skill.txt',
+        'Personal Skill (Revelation)': 'Skill.txt',
+        'Reclass option 1': 'Class.txt',
+        'Reclass Option 2': 'Class.txt',
+        'Amiibo weapon 1': 'Item.txt',
+        'Amiibo weapon 2': 'Item.txt'
+    }
+    sections = {
+        'Base HP': 'Base Stats',
+        'HP Growth': 'Growth Rate',
+        'HP Modifier': 'Modifier'
+    }
+
+
+class Class(basetypes.Row):
+    """Class entry in GameData.bin."""
+    structure = OrderedDict([
+        ('Flag 1 - 8', Structure(U8, HEX)),
+        ('Flag 9 - 16', Structure(U8, HEX)),
+        ('Flag 17 - 24', Structure(U8, HEX)),
+        ('Flag 25 - 32', Structure(U8, HEX)),
+        ('Flag 33 - 40', Structure(U8, HEX)),
+        ('Flag 41 - 48', Structure(U8, HEX)),
+        ('Flag 49 - 56', Structure(U8, HEX)),
+        ('Flag 57 - 63', Structure(U8, HEX)),
+        ('Class Pointer', Structure(U32, HEX)),
+        ('Face Pointer', Structure(U32, HEX)),
+        ('Class Name Pointer', Structure(U32, HEX)),
+        ('Class Label Pointer', Structure(U32, HEX)),
+        ('Class ID', Structure(U16, HEX)),
+        ('Special flag 1 - 8', Structure(U8, HEX)),
+        ('Special flag 9 - 12', Structure(U8, HEX)),
+        ('Base HP', Structure(S8, STR)),
+        ('Base Strength', Structure(S8, STR)),
+        ('Base Magic', Structure(S8, STR)),
+        ('Base Skill', Structure(S8, STR)),
+        ('Base Speed', Structure(S8, STR)),
+        ('Base Luck', Structure(S8, STR)),
+        ('Base Defense', Structure(S8, STR)),
+        ('Base Resistance', Structure(S8, STR)),
+        ('HP Growth', Structure(U8, STR)),
+        ('Strength Growth', Structure(U8, STR)),
+        ('Magic Growth', Structure(U8, STR)),
+        ('Skill Growth', Structure(U8, STR)),
+        ('Speed Growth', Structure(U8, STR)),
+        ('Luck Growth', Structure(U8, STR)),
+        ('Defense Growth', Structure(U8, STR)),
+        ('Resistance Growth', Structure(U8, STR)),
+        ('HP ?', Structure(U8, STR)),
+        ('Strength ?', Structure(U8, STR)),
+        ('Magic ?', Structure(U8, STR)),
+        ('Skill ?', Structure(U8, STR)),
+        ('Speed ?', Structure(U8, STR)),
+        ('Luck ?', Structure(U8, STR)),
+        ('Defense ?', Structure(U8, STR)),
+        ('Resistance ?', Structure(U8, STR)),
+        ('Maximum HP', Structure(U8, STR)),
+        ('Maximum Strength', Structure(U8, STR)),
+        ('Maximum Magic', Structure(U8, STR)),
+        ('Maximum Skill', Structure(U8, STR)),
+        ('Maximum Speed', Structure(U8, STR)),
+        ('Maximum Luck', Structure(U8, STR)),
+        ('Maximum Defense', Structure(U8, STR)),
+        ('Maximum Resistance', Structure(U8, STR)),
+        ('HP Pair Up Bonus', Structure(U8, STR)),
+        ('Strength Pair Up Bonus', Structure(U8, STR)),
+        ('Magic Pair Up Bonus', Structure(U8, STR)),
+        ('Skill Pair Up Bonus', Structure(U8, STR)),
+        ('Speed Pair Up Bonus', Structure(U8, STR)),
+        ('Luck Pair Up Bonus', Structure(U8, STR)),
+        ('Defense Pair Up Bonus', Structure(U8, STR)),
+        ('Resistance Pair Up Bonus', Structure(U8, STR)),
+        ('Maximum Sword / Katana Rank', Structure(U8, STR)),
+        ('Maximum Lance / Naginata Rank', Structure(U8, STR)),
+        ('Maximum Axe / Club Rank', Structure(U8, STR)),
+        ('Maximum Dagger / Shuriken Rank', Structure(U8, STR)),
+        ('Maximum Bow / Yumi Rank', Structure(U8, STR)),
+        ('Maximum Tome / Scroll Rank', Structure(U8, STR)),
+        ('Maximum Staff / Rod Rank', Structure(U8, STR)),
+        ('Maximum Stone Rank', Structure(U8, STR)),
+        ('Hit', Structure(U16, STR)),
+        ('Crit', Structure(U16, STR)),
+        ('Avoid', Structure(U16, STR)),
+        ('Dodge', Structure(U16, STR)),
+        ('Skill 1', Structure(U16, HEX)),
+        ('Skill 2', Structure(U16, HEX)),
+        ('Skill 3', Structure(U16, HEX)),
+        ('Skill 4', Structure(U16, HEX)),
+        ('Unknown (0x5C)', Structure(U8, HEX)),
+        ('Movement', Structure(U8, STR)),
+        ('Unknown (0x5E)', Structure(U8, HEX)),
+        ('Unknown (0x5F)', Structure(U8, HEX)),
+        ('Movement pointer', Structure(U32, HEX)),
+        ('Advanced Class 1', Structure(U16, HEX)),
+        ('Advanced Class 2', Structure(U16, HEX)),
+        ('Base class 1', Structure(U16, HEX)),
+        ('Base class 2', Structure(U16, HEX)),
+        ('_0x6C', Structure(Bytes4, HEX)),
+        ('Gender equivalent class', Structure(U16, HEX)),
+        ('Parallel class', Structure(U16, HEX)),
+        ('Origin', Structure(U8, HEX)),
+        ('_0x75', Structure(Bytes6, HEX)),
+        ('DLC skill index', Structure(U8, HEX)),
+        ('_0x7C', Structure(Bytes4, HEX))
+    ])
+    size = 128
+    lists = {
+        'Flag 1 - 8': 'Flag1-8.txt',
+        'Flag 9 - 16': 'Flag9-16.txt',
+        'Flag 17 - 24': 'Flag17-24.txt',
+        'Flag 25 - 32': 'Flag25-32.txt',
+        'Flag 33 - 40': 'Flag33-40.txt',
+        'Flag 41 - 48': 'Flag41-48.txt',
+        'Flag 49 - 56': 'Flag49-56.txt',
+        'Flag 57 - 63': 'Flag57-63.txt',
+        'Special flag 1 - 8': 'SpecialFlag1-8.txt',
+        'Special flag 9 - 12': 'SpecialFlag9-12.txt',
+        'Maximum Sword / Katana Rank': 'WeaponRank.txt',
+        'Maximum Lance / Naginata Rank': 'WeaponRank.txt',
+        'Maximum Axe / Club Rank': 'WeaponRank.txt',
+        'Maximum Dagger / Shuriken Rank': 'WeaponRank.txt',
+        'Maximum Bow / Yumi Rank': 'WeaponRank.txt',
+        'Maximum Tome / Scroll Rank': 'WeaponRank.txt',
+        'Maximum Staff / Rod Rank': 'WeaponRank.txt',
+        'Maximum Stone Rank': 'WeaponRank.txt',
+        'Skill 1': 'Skill.txt',
+        'Skill 2': 'Skill.txt',
+        'Skill 3': 'Skill.txt',
+        'Skill 4': 'Skill.txt',
+        'Advanced Class 1': 'Class2.txt',
+        'Advanced Class 2': 'Class2.txt',
+        'Base class 1': 'Class2.txt',
+        'Base class 2': 'Class2.txt',
+        'Gender equivalent class': 'Class2.txt',
+        'Parallel class': 'Class2.txt',
+        'Origin': 'Origin.txt'
+    }
+    sections = {
+        'Base HP': 'Base Stats',
+        'HP Growth': 'Growth Rate',
+        'Maximum HP': 'Maximum stats',
+        'HP Pair Up Bonus': 'Pair Up bonuses'
+    }
+    module_names = _module_names('Unknown (0x5C)', 'Unknown (0x5E)',
+                                 'Unknown (0x5F)')
+
+
+class Skill(basetypes.Row):
+    """Skill entry in GameData.bin."""
+    structure = OrderedDict([
+        ('Skill label pointer', Structure(U32, HEX)),
+        ('Skill name pointer', Structure(U32, HEX)),
+        ('Skill description pointer', Structure(U32, HEX)),
+        ('Skl_ pointer', Structure(U32, HEX)),
+        ('Skill ID', Structure(U16, HEX)),
+        ('Unknown (0x12)', Structure(U16, HEX)),
+        ('Skill icon ID', Structure(U16, HEX)),
+        ('Stat', Structure(U8, HEX)),
+        ('Trigger % factor', Structure(U8, STR)),
+        ('Trigger % divisor', Structure(U8, STR)),
+        ('Unknown (0x19)', Structure(U8, HEX)),
+        ('Price', Structure(U16, STR)),
+        ('Unknown (0x1C)', Structure(U8, HEX)),
+        ('Padding', Structure(Bytes3, HEX))
+    ])
+    size = 32
+    lists = {
+        'Stat': 'Stat.txt'
+    }
+    module_names = _module_names('Unknown (0x12)', 'Unknown (0x19)',
+                                 'Unknown (0x1C)')
+
+
+class Stat(basetypes.Row):
+    """Stat entry in GameData.bin."""
+    structure = OrderedDict([
+        ('Stat ID', Structure(U32, HEX)),
+        ('Stat label pointer', Structure(U32, HEX)),
+        ('Stat description pointer', Structure(U32, HEX)),
+        ('(?) HP (0xC)', Structure(S8, STR)),
+        ('(?) Strength (0xD)', Structure(S8, STR)),
+        ('(?) Magic (0xE)', Structure(S8, STR)),
+        ('(?) Skill (0xF)', Structure(S8, STR)),
+        ('(?) Speed (0x10)', Structure(S8, STR)),
+        ('(?) Luck (0x11)', Structure(S8, STR)),
+        ('(?) Defense (0x12)', Structure(S8, STR)),
+        ('(?) Resistance (0x13)', Structure(S8, STR)),
+        ('Boon HP Growth', Structure(S8, STR)),
+        ('Boon Strength Growth', Structure(S8, STR)),
+        ('Boon Magic Growth', Structure(S8, STR)),
+        ('Boon Skill Growth', Structure(S8, STR)),
+        ('Boon Speed Growth', Structure(S8, STR)),
+        ('Boon Luck Growth', Structure(S8, STR)),
+        ('Boon Defense Growth', Structure(S8, STR)),
+        ('Boon Resistance Growth', Structure(S8, STR)),
+        ('Boon HP', Structure(S8, STR)),
+        ('Boon Strength', Structure(S8, STR)),
+        ('Boon Magic', Structure(S8, STR)),
+        ('Boon Skill', Structure(S8, STR)),
+        ('Boon Speed', Structure(S8, STR)),
+        ('Boon Luck', Structure(S8, STR)),
+        ('Boon Defense', Structure(S8, STR)),
+        ('Boon Resistance', Structure(S8, STR)),
+        ('(?) HP (0x24)', Structure(S8, STR)),
+        ('(?) Strength (0x25)', Structure(S8, STR)),
+        ('(?) Magic (0x26)', Structure(S8, STR)),
+        ('(?) Skill (0x27)', Structure(S8, STR)),
+        ('(?) Speed (0x28)', Structure(S8, STR)),
+        ('(?) Luck (0x29)', Structure(S8, STR)),
+        ('(?) Defense (0x2A)', Structure(S8, STR)),
+        ('(?) Resistance (0x2B)', Structure(S8, STR)),
+        ('Bane HP Growth', Structure(S8, STR)),
+        ('Bane Strength Growth', Structure(S8, STR)),
+        ('Bane Magic Growth', Structure(S8, STR)),
+        ('Bane Skill Growth', Structure(S8, STR)),
+        ('Bane Speed Growth', Structure(S8, STR)),
+        ('Bane Luck Growth', Structure(S8, STR)),
+        ('Bane Defense Growth', Structure(S8, STR)),
+        ('Bane Resistance Growth', Structure(S8, STR)),
+        ('Bane HP', Structure(S8, STR)),
+        ('Bane Strength', Structure(S8, STR)),
+        ('Bane Magic', Structure(S8, STR)),
+        ('Bane Skill', Structure(S8, STR)),
+        ('Bane Speed', Structure(S8, STR)),
+        ('Bane Luck', Structure(S8, STR)),
+        ('Bane Defense', Structure(S8, STR)),
+        ('Bane Resistance', Structure(S8, STR)),
+        ('Unknown 1', Structure(S8, STR)),
+        ('Unknown 2', Structure(S8, STR)),
+        ('Unknown 3', Structure(S8, STR)),
+        ('Unknown 4', Structure(S8, STR))
+    ])
+    size = 64
+    lists = {}
+    module_names = _module_names(
+        '(?) HP (0xC)', '(?) Strength (0xD)', '(?) Magic (0xE)',
+        '(?) Skill (0xF)', '(?) Speed (0x10)', '(?) Luck (0x11)',
+        '(?) Defense (0x12)', '(?) Resistance (0x13)', '(?) HP (0x24)',
+        '(?) Strength (0x25)', '(?) Magic (0x26)', '(?) Skill (0x27)',
+        '(?) Speed (0x28)', '(?) Luck (0x29)', '(?) Defense (0x2A)',
+        '(?) Resistance (0x2B)')
+
+
+class Army(basetypes.Row):
+    """Army entry in GameData.bin."""
+    structure = OrderedDict([
+        ('Army ID', Structure(U32, HEX)),
+        ('Army label pointer', Structure(U32, HEX)),
+        ('Army description pointer', Structure(U32, HEX)),
+        ('Unknown', Structure(Bytes4, HEX))
+    ])
+    size = 16
+    lists = {}
+
+
+class WeaponRank(basetypes.Row):
+    """Weapon Rank entry in GameData.bin."""
+    structure = OrderedDict([
+        ('S', Structure(U8, STR)),
+        ('A', Structure(U8, STR)),
+        ('B', Structure(U8, STR)),
+        ('C', Structure(U8, STR)),
+        ('D', Structure(U8, STR)),
+        ('E', Structure(U8, STR))
+    ])
+    size = 6
+    lists = {}
+
+
+class Item(basetypes.Row):
+    """Item entry in GameData.bin."""
+    structure = OrderedDict([
+        ('Flag 1 - 8', Structure(U8, HEX)),
+        ('Flag 9 - 16', Structure(U8, HEX)),
+        ('Flag 17 - 24', Structure(U8, HEX)),
+        ('Flag 25 - 32', Structure(U8, HEX)),
+        ('Flag 33 - 40', Structure(U8, HEX)),
+        ('Flag 41 - 48', Structure(U8, HEX)),
+        ('Flag 49 - 56', Structure(U8, HEX)),
+        ('Flag 57 - 64', Structure(U8, HEX)),
+        ('Item label pointer', Structure(U32, HEX)),
+        ('Item name pointer', Structure(U32, HEX)),
+        ('Item description pointer', Structure(U32, HEX)),
+        ('Item ID', Structure(U16, HEX)),
+        ('_0x16', Structure(Bytes2, HEX)),
+        ('Item category', Structure(U8, HEX)),
+        ('_0x19', Structure(U8, HEX)),
+        ('Weapon category', Structure(U8, HEX)),
+        ('Non-weapon category', Structure(U8, HEX)),
+        ('Weapon rank', Structure(U8, HEX)),
+        ('_0x1D', Structure(U8, HEX)),
+        ('Uses', Structure(U8, STR)),
+        ('Mt', Structure(U8, STR)),
+        ('Hit', Structure(S16, STR)),
+        ('Crit', Structure(S16, STR)),
+        ('Avoid', Structure(S16, STR)),
+        ('Dodge', Structure(S16, STR)),
+        ('Minimum Range', Structure(U8, STR)),
+        ('Maximum Range', Structure(U8, STR)),
+        ('Ability to double attack', Structure(S8, STR)),
+        ("Enemy's ability to double attack", Structure(S8, STR)),
+        ('Buy price', Structure(U32, STR)),
+        ('Sell price', Structure(U32, STR)),
+        ('Special flag 1 - 8', Structure(U8, HEX)),
+        ('Special flag 9 - 12', Structure(U8, HEX)),
+        ('Mov', Structure(U8, STR)),
+        ('Unknown (0x37)', Structure(U8, HEX)),
+        ('HP bonus (equipment)', Structure(S8, STR)),
+        ('Strength bonus (equipment)', Structure(S8, STR)),
+        ('Magic bonus (equipment)', Structure(S8, STR)),
+        ('Skill bonus (equipment)', Structure(S8, STR)),
+        ('Speed bonus (equipment)', Structure(S8, STR)),
+        ('Luck bonus (equipment)', Structure(S8, STR)),
+        ('Defense bonus (equipment)', Structure(S8, STR)),
+        ('Resistance bonus (equipment)', Structure(S8, STR)),
+        ('Extra', Structure(Bytes8, HEX)),
+        ('Unknown (0x48)', Structure(Bytes4, HEX)),
+        ('Dawn Armory level 1 stock', Structure(S8, STR)),
+        ('Dawn Armory level 2 stock', Structure(S8, STR)),
+        ('Dawn Armory level 3 stock', Structure(S8, STR)),
+        ('Dusk Armory level 1 stock', Structure(S8, STR)),
+        ('Dusk Armory level 2 stock', Structure(S8, STR)),
+        ('Dusk Armory level 3 stock', Structure(S8, STR)),
+        ('Rod Shop level 1 stock', Structure(S8, STR)),
+        ('Rod Shop level 2 stock', Structure(S8, STR)),
+        ('Rod Shop level 3 stock', Structure(S8, STR)),
+        ('Staff Store level 1 stock', Structure(S8, STR)),
+        ('Staff Store level 2 stock', Structure(S8, STR)),
+        ('Staff Store level 3 stock', Structure(S8, STR)),
+        ('Hoshido event', Structure(S8, STR)),
+        ('Nohr event', Structure(S8, STR)),
+        ('Dawn Lottery', Structure(S8, STR)),
+        ('Dusk Lottery', Structure(S8, STR)),
+        ('_0x5C', Structure(Bytes4, HEX)),
+        ('Unknown pointer', Structure(U32, HEX)),
+        ('_0x64', Structure(Bytes4, HEX))
+    ])
+    size = 104
+    lists = {
+        'Flag 1 - 8': 'Flag1-8.txt',
+        'Flag 9 - 16': 'Flag9-16.txt',
+        'Flag 17 - 24': 'Flag17-24.txt',
+        'Flag 25 - 32': 'Flag25-32.txt',
+        'Flag 33 - 40': 'Flag33-40.txt',
+        'Flag 41 - 48': 'Flag41-48.txt',
+        'Flag 49 - 56': 'Flag49-56.txt',
+        'Flag 57 - 64': 'Flag57-64.txt',
+        'Item category': 'ItemCategory.txt',
+        'Weapon category': 'WeaponCategory.txt',
+        'Non-weapon category': 'NonWeaponCategory.txt',
+        'Weapon rank': 'WeaponRank.txt',
+        'Special flag 1 - 8': 'SpecialFlag1-8.txt',
+        'Special flag 9 - 12': 'SpecialFlag9-12.txt'
+    }
+    module_names = _module_names('Unknown (0x37)', 'Unknown (0x48)')
+
+
+class Forge(basetypes.Row):
+    """Forge entry in GameData.bin."""
+    structure = OrderedDict([
+        ('Level', Structure(U8, STR)),
+        ('Might', Structure(S8, STR)),
+        ('Hit', Structure(S8, STR)),
+        ('Crit', Structure(S8, STR))
+    ])
+    size = 4
+    lists = {}
+
+
+class Tutorial(basetypes.Row):
+    """Tutorial entry in GameData.bin."""
+    structure = OrderedDict([
+        ('Tutorial label pointer', Structure(U32, HEX)),
+        ('Tutorial ID', Structure(U16, HEX)),
+        ('Unknown', Structure(U16, HEX)),
+        ('Tutorial name pointer', Structure(U32, HEX)),
+        ('Tutorial description pointer', Structure(U32, HEX)),
+        ('Unknown pointer', Structure(U32, HEX))
+    ])
+    size = 20
+    lists = {}
+
+
+class PathBonus(basetypes.Row):
+    """Path Bonus entry in GameData.bin."""
+    structure = OrderedDict([
+        ('Number of paths', Structure(U8, STR)),
+        ('_0x1', Structure(Bytes3, HEX)),
+        ('Item', Structure(U16, HEX)),
+        ('_0x6', Structure(Bytes2, HEX))
+    ])
+    size = 8
+    lists = {
+        'Item': 'Item.txt'
+    }
+
+
+class BattleBonus(basetypes.Row):
+    """Battle Bonus entry in GameData.bin."""
+    structure = OrderedDict([
+        ('Battle point', Structure(U16, STR)),
+        ('_0x2', Structure(Bytes2, HEX)),
+        ('Item', Structure(U16, HEX)),
+        ('_0x6', Structure(Bytes2, HEX))
+    ])
+    size = 8
+    lists = {
+        'Item': 'Item.txt'
+    }
+
+
+class VisitBonus(basetypes.Row):
+    """Visit Bonus entry in GameData.bin."""
+    structure = OrderedDict([
+        ('Visit point', Structure(U16, STR)),
+        ('_0x2', Structure(Bytes2, HEX)),
+        ('Item', Structure(U16, HEX)),
+        ('_0x6', Structure(Bytes2, HEX))
+    ])
+    size = 8
+    lists = {
+        'Item': 'Item.txt'
+    }
+
+
+class Support(basetypes.Row):
+    """Support entry of a character in GameData.bin."""
+    structure = OrderedDict([
+        ('Character ID', Structure(U16, HEX)),
+        ('Support index', Structure(U16, STR)),
+        ('C support point', Structure(S8, STR)),
+        ('B support point', Structure(S8, STR)),
+        ('A support point', Structure(S8, STR)),
+        ('S support point', Structure(S8, STR)),
+        ('Unknown', Structure(U16, HEX)),
+        ('Global support index', Structure(U16, STR))
+    ])
+    size = 12
+    lists = {}
+
+
+##############################################################################
+# Tables
+##############################################################################
+class TableSchema(namedtuple('TableSchema', ['name', 'path', 'rowclass',
+                                             'list', 'anchor', 'count'])):
+    """Location of a table in GameData.bin and of its module.
+
+    `name`: Table name, as used by GameData.get_table_info
+    `path`: Module path
+    `rowclass`: Row class of an entry
+    `list`: Entry name list file, or NULL
+    `anchor`: (header pointer offset, distance from its value) of the table
+    `count`: Number of entries. If it is None, the count is read from the
+        count field given by GameData.get_table_info.
+    """
+    __slots__ = ()
+
+    @property
+    def title(self):
+        """Module description."""
+        return 'Fire Emblem Fates %s Editor' % self.name
+
+
+# In file order
+TABLES = [
+    TableSchema('Chapter', os.path.join('Chapter', 'Chapter.nmm'), Chapter,
+                'Chapter.txt', (0x0, 0x0), None),
+    TableSchema('Character', os.path.join('Character', 'Character.nmm'),
+                Character, 'Character.txt', (0x8, 0x10), None),
+    TableSchema('Class', os.path.join('Class', 'Class.nmm'), Class,
+                'Class.txt', (0xC, 0x8), None),
+    TableSchema('Skill', os.path.join('Skill', 'Skill.nmm'), Skill,
+                'Skill.txt', (0x10, 0x0), None),
+    TableSchema('Stat', os.path.join('Stat', 'Stat.nmm'), Stat,
+                'Stat.txt', (0x1C, 0x0), None),
+    TableSchema('Army', os.path.join('Army', 'Army.nmm'), Army,
+                'Army.txt', (0x24, 0x0), None),
+    TableSchema('Weapon Rank', os.path.join('Weapon Rank', 'WeaponRank.nmm'),
+                WeaponRank, 'NULL', (0x3C, 0x0), 1),
+    TableSchema('Item', os.path.join('Item', 'Item.nmm'), Item,
+                'Item.txt', (0x2C, 0x8), None),
+    TableSchema('Forge', os.path.join('Forge', 'Forge.nmm'), Forge,
+                'Forge.txt', (0x38, 0x0), 20),
+    TableSchema('Tutorial', os.path.join('Tutorial', 'Tutorial.nmm'),
+                Tutorial, 'Tutorial.txt', (0x38, 0x1BC), 34),
+    TableSchema('Path Bonus', os.path.join('Path Bonus', 'PathBonus.nmm'),
+                PathBonus, 'NULL', (0x38, 0x484), 8),
+    TableSchema('Battle Bonus', os.path.join('Battle Bonus',
+                                             'BattleBonus.nmm'),
+                BattleBonus, 'NULL', (0x38, 0x4C4), 80),
+    TableSchema('Visit Bonus', os.path.join('Visit Bonus', 'VisitBonus.nmm'),
+                VisitBonus, 'NULL', (0x38, 0x744), 80)
+]
+
+
+##############################################################################
+# Flag lists
+##############################################################################
+# List file -> names of the bits of a flag byte. Every list file of these
+# names is generated from the names, so they are the same in all folders.
+FLAG_LISTS = {
+    'Route.txt': ['Birthright', 'Conquest', 'Revelation']
+}
+for first, last in [(1, 8), (9, 16), (17, 24), (25, 32), (33, 40), (41, 48),
+                    (49, 56), (57, 63), (57, 64)]:
+    FLAG_LISTS['Flag%d-%d.txt' % (first, last)] = \
+        [str(i) for i in range(first, last + 1)]
+for first, last in [(1, 8), (9, 12)]:
+    FLAG_LISTS['SpecialFlag%d-%d.txt' % (first, last)] = \
+        [str(i) for i in range(first, last + 1)]
+del first, last
+
+
+if __name__ == '__main__':
+    print('This script is a library and does not mean to be used directly.')
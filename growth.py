@@ -0,0 +1,635 @@
+#!/usr/bin/env python2
+#
+# The MIT License
+#
+# Copyright (c) 2017 RainThunder.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+"""Project the stats of characters across level-ups and reclasses.
+
+The bases, growths and stat modifiers of the Character table and the bases,
+growths and maximum stats of the Class table are turned into arrays, and the
+stats of all characters are projected along a plan, which is a list of
+(classes, levels) segments:
+
+* `classes`: None (keep the current class), 'promote' (change to Advanced
+  Class 1 and reset the level to 1), a class ID (every character) or a dict of
+  character IDs and class IDs.
+* `levels`: Number of level-ups. A character never goes past `max_level`.
+
+The game model: a stat starts at character base + class base. At every
+level-up, the growth rate is character growth + class growth; every full 100
+points is a guaranteed +1 and the rest is the chance of another +1. A stat
+never goes past class maximum + character modifier. A reclass adds the
+difference between the class bases and clamps the stats to the new maximums.
+
+expected() computes the exact distribution of every stat of every character
+after every step. simulate() draws Monte-Carlo trials in batches: every batch
+is a (trials, characters, stats) array, and a level-up of the whole batch is
+one compare of uint16 random numbers against the growth thresholds.
+
+NumPy is required.
+
+Usage:
+    python growth.py [-i GameData.bin] [--levels N] [--promote N]
+                     [--reclass CLASS N] [--handover] [--trials N]
+
+Example:
+    >>> import gamedata, growth
+    >>> game_data = gamedata.load_file('GameData.bin')
+    >>> roster = growth.load_roster(game_data)
+    >>> classes = growth.load_classes(game_data)
+    >>> projection = growth.simulate(roster, classes, [(None, 10),
+    ...                                                ('promote', 10)])
+    >>> projection.mean[:, -1]
+"""
+
+from __future__ import print_function, division
+import os
+import sys
+if sys.version_info[0] > 2:
+    xrange = range
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import bin
+import gamedata
+import gamedata_schema
+import handover
+import nmm_generator
+import profiling
+
+
+STATS = ['HP', 'Strength', 'Magic', 'Skill', 'Speed', 'Luck', 'Defense',
+         'Resistance']
+
+CHARACTER_BASES = ['Base ' + stat for stat in STATS]
+CHARACTER_GROWTHS = [stat + ' Growth' for stat in STATS]
+CHARACTER_MODIFIERS = ['HP Modifier', 'Strength Modifier',
+                       'Magic Modifer', # (sic), as in the module
+                       'Skill Modifier', 'Speed Modifier', 'Luck Modifier',
+                       'Defense Modifier', 'Resistance Modifier']
+CLASS_BASES = CHARACTER_BASES
+CLASS_GROWTHS = CHARACTER_GROWTHS
+CLASS_MAXIMUMS = ['Maximum ' + stat for stat in STATS]
+
+MAX_LEVEL = 20
+
+# Number of trials in a batch of simulate()
+BATCH_SIZE = 4096
+
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError('numpy is required for stat projection.')
+
+
+def _schema(name):
+    for schema in gamedata_schema.TABLES:
+        if schema.name == name:
+            return schema
+    raise KeyError(name)
+
+
+def _read_columns(module, binfile):
+    return dict([(column.name, column.values)
+                 for column in module.read_columns(binfile)])
+
+
+def _matrix(columns, names, dtype='i2'):
+    """Stack some columns into a (rows, len(names)) array."""
+    return numpy.array([columns[name] for name in names], dtype=dtype).T.copy()
+
+
+class Roster(object):
+    """Characters of a character table, as arrays.
+
+    `name`: Name of the source, e.g. 'GameData' or 'A_HANDOVER'
+    `ids`: Character IDs, shape (n,)
+    `labels`: Character labels (PID_...)
+    `classes`: Class 1 of the characters, shape (n,)
+    `levels`: Levels, shape (n,)
+    `bases`, `growths`, `modifiers`: Shape (n, 8), in the order of STATS
+    """
+
+    def __init__(self, name, columns):
+        _require_numpy()
+        self.name = name
+        self.ids = numpy.array(columns['Character ID'], dtype='i4')
+        self.labels = list(columns['Character Pointer'])
+        self.classes = numpy.array(columns['Class 1'], dtype='i4')
+        self.levels = numpy.array(columns['Level'], dtype='i4')
+        self.bases = _matrix(columns, CHARACTER_BASES)
+        self.growths = _matrix(columns, CHARACTER_GROWTHS)
+        self.modifiers = _matrix(columns, CHARACTER_MODIFIERS)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class ClassTable(object):
+    """Class table, as arrays. Rows are indexed by class ID.
+
+    `bases`, `growths`, `maximums`: Shape (classes, 8)
+    `advanced`: Advanced Class 1 of every class (0: none)
+    `labels`, `names`: Class labels (JID_...) and name labels (MJID_...)
+    """
+
+    def __init__(self, columns):
+        _require_numpy()
+        count = max(columns['Class ID']) + 1
+        order = numpy.array(columns['Class ID'], dtype='i4')
+        self.bases = numpy.zeros((count, len(STATS)), dtype='i2')
+        self.growths = numpy.zeros((count, len(STATS)), dtype='i2')
+        self.maximums = numpy.zeros((count, len(STATS)), dtype='i2')
+        self.advanced = numpy.zeros(count, dtype='i4')
+        self.bases[order] = _matrix(columns, CLASS_BASES)
+        self.growths[order] = _matrix(columns, CLASS_GROWTHS)
+        self.maximums[order] = _matrix(columns, CLASS_MAXIMUMS)
+        self.advanced[order] = columns['Advanced Class 1']
+        self.labels = [u'NULL'] * count
+        self.names = [u'NULL'] * count
+        for i in xrange(len(order)):
+            self.labels[order[i]] = columns['Class Pointer'][i]
+            self.names[order[i]] = columns['Class Name Pointer'][i]
+
+    def __len__(self):
+        return len(self.advanced)
+
+
+def load_roster(game_data):
+    """Load the Character table of a GameData object. Return a Roster."""
+    module = nmm_generator.build_module(game_data, _schema('Character'))
+    return Roster('GameData', _read_columns(module, game_data))
+
+
+def load_classes(game_data):
+    """Load the Class table of a GameData object. Return a ClassTable."""
+    module = nmm_generator.build_module(game_data, _schema('Class'))
+    return ClassTable(_read_columns(module, game_data))
+
+
+def load_handover(path):
+    """Load the characters of a handover file (A/B/C_HANDOVER.bin).
+
+    Return a Roster.
+    """
+    binfile = bin.load_file(path)
+    module = handover.character_module(binfile)
+    name = os.path.splitext(os.path.basename(path))[0]
+    return Roster(name, _read_columns(module, binfile))
+
+
+##############################################################################
+# Plan
+##############################################################################
+class _Segment(object):
+    """A reclass followed by level-ups, computed for every character.
+
+    `shift`: Change of the stats by the reclass, or None if no one changes
+        class
+    `caps`: Maximum stats in the new class, shape (n, 8)
+    `whole`, `chance`: Guaranteed points and the chance (0 - 99) of another
+        point per level-up, shape (n, 8)
+    `steps`: Number of level-ups of every character, shape (n,)
+    `length`: Number of level-ups of the segment
+    """
+
+    def __init__(self, shift, caps, growths, steps, length):
+        self.shift = shift
+        self.caps = caps
+        self.whole = growths // 100
+        self.chance = growths % 100
+        self.steps = steps
+        self.length = length
+
+
+def _new_classes(spec, current, roster, class_table):
+    """Resolve the classes of a plan segment.
+
+    Return (class IDs, promoted mask).
+    """
+    no_change = numpy.zeros(len(current), dtype=bool)
+    if spec is None:
+        return current, no_change
+    if spec == 'promote':
+        advanced = class_table.advanced[current]
+        promoted = advanced != 0
+        return numpy.where(promoted, advanced, current), promoted
+    if isinstance(spec, dict):
+        new = current.copy()
+        for i in xrange(len(roster)):
+            new[i] = spec.get(int(roster.ids[i]), new[i])
+    else:
+        new = numpy.full(len(current), spec, dtype=current.dtype)
+    if new.size and (new.min() < 0 or new.max() >= len(class_table)):
+        raise ValueError('class ID out of range')
+    return new, no_change
+
+
+class _Schedule(object):
+    """Plan of a roster, resolved into segments.
+
+    `initial`: Starting stats, shape (n, 8)
+    `segments`: List of _Segment
+    `levels`, `classes`: Level and class of every character at every point of
+        the timeline, shape (n, points)
+    `size`: Number of possible stat values (maximum stat + 1)
+    """
+
+    def __init__(self, roster, class_table, plan, max_level):
+        current = roster.classes.copy()
+        unknown = (current < 0) | (current >= len(class_table))
+        current[unknown] = 0
+        level = numpy.minimum(roster.levels, max_level).astype('i4')
+        caps = numpy.maximum(class_table.maximums[current] + roster.modifiers,
+                             0)
+        self.initial = numpy.maximum(
+            class_table.bases[current] + roster.bases, 0)
+        self.segments = []
+        levels = [level.copy()]
+        classes = [current.copy()]
+        size = max(self.initial.max(initial=0), caps.max(initial=0))
+        for spec, length in plan:
+            new, promoted = _new_classes(spec, current, roster, class_table)
+            shift = None
+            if (new != current).any():
+                shift = class_table.bases[new] - class_table.bases[current]
+                caps = numpy.maximum(class_table.maximums[new] +
+                                     roster.modifiers, 0)
+                size = max(size, caps.max(initial=0))
+                level[promoted] = 1
+                current = new
+                levels.append(level.copy())
+                classes.append(current.copy())
+            steps = numpy.clip(max_level - level, 0, length)
+            growths = roster.growths + class_table.growths[current]
+            self.segments.append(_Segment(shift, caps, growths, steps,
+                                          length))
+            for j in xrange(length):
+                levels.append(level + numpy.minimum(steps, j + 1))
+                classes.append(current.copy())
+            level = level + steps
+        self.levels = numpy.array(levels).T
+        self.classes = numpy.array(classes).T
+        self.size = int(size) + 1
+
+    @property
+    def points(self):
+        return self.levels.shape[1]
+
+
+class Projection(object):
+    """Projected stats of a roster.
+
+    `roster`: The Roster
+    `levels`, `classes`: Level and class of every character at every point of
+        the timeline, shape (n, points). Point 0 is the starting point, then
+        there is one point per reclass and per level-up.
+    `mean`, `std`: Mean and standard deviation of every stat, shape
+        (n, points, 8)
+    `final`: Probability of every stat value at the last point, shape
+        (n, 8, maximum stat + 1)
+    `trials`: Number of Monte-Carlo trials, or None if the projection is exact
+    """
+
+    def __init__(self, roster, schedule, mean, std, final, trials=None):
+        self.roster = roster
+        self.levels = schedule.levels
+        self.classes = schedule.classes
+        self.mean = mean
+        self.std = std
+        self.final = final
+        self.trials = trials
+
+    def quantile(self, q):
+        """Get the q-quantile of the final stats, shape (n, 8)."""
+        cdf = numpy.cumsum(self.final, axis=-1)
+        return (cdf < q - 1e-9).sum(axis=-1)
+
+    def summary(self):
+        """Get the final stats of every character as a list of dicts."""
+        rows = []
+        for i in xrange(len(self.roster)):
+            rows.append({
+                'id': int(self.roster.ids[i]),
+                'label': self.roster.labels[i],
+                'class': int(self.classes[i, -1]),
+                'level': int(self.levels[i, -1]),
+                'mean': dict(zip(STATS, self.mean[i, -1].round(3).tolist())),
+                'std': dict(zip(STATS, self.std[i, -1].round(3).tolist())),
+            })
+        return rows
+
+
+def _plan(plan, max_level):
+    if plan is None:
+        return [(None, max_level)]
+    return plan
+
+
+##############################################################################
+# Exact distribution
+##############################################################################
+def _shift(pmf, k):
+    """Add `k` (shape (n, 8)) to the stats of a distribution. Values which
+    leave the range are kept at the nearest end."""
+    size = pmf.shape[-1]
+    source = numpy.arange(size) - k[..., None]
+    inside = (source >= 0) & (source < size)
+    out = numpy.where(inside, numpy.take_along_axis(
+        pmf, numpy.clip(source, 0, size - 1), axis=-1), 0.0)
+    lost = pmf.sum(axis=-1) - out.sum(axis=-1)
+    out[..., 0] += numpy.where(k < 0, lost, 0.0)
+    out[..., -1] += numpy.where(k > 0, lost, 0.0)
+    return out
+
+
+def _clamp(pmf, caps):
+    """Move the probability of values above `caps` to `caps`."""
+    above = numpy.arange(pmf.shape[-1]) > caps[..., None]
+    excess = numpy.where(above, pmf, 0.0).sum(axis=-1)
+    pmf = numpy.where(above, 0.0, pmf)
+    index = caps[..., None].astype('i8')
+    numpy.put_along_axis(pmf, index, numpy.take_along_axis(
+        pmf, index, axis=-1) + excess[..., None], axis=-1)
+    return pmf
+
+
+def _moments(pmf):
+    values = numpy.arange(pmf.shape[-1], dtype='f8')
+    mean = (pmf * values).sum(axis=-1)
+    square = (pmf * values * values).sum(axis=-1)
+    return mean, numpy.sqrt(numpy.maximum(square - mean * mean, 0.0))
+
+
+@profiling.profiled('growth.expected')
+def expected(roster, class_table, plan=None, max_level=MAX_LEVEL):
+    """Compute the exact stat distributions of a roster.
+
+    `roster`: Roster object
+    `class_table`: ClassTable object
+    `plan`: List of (classes, levels). Default: level up to `max_level`
+    `max_level`: Level cap
+
+    Return a Projection object.
+    """
+    _require_numpy()
+    schedule = _Schedule(roster, class_table, _plan(plan, max_level),
+                         max_level)
+    n = len(roster)
+    pmf = numpy.zeros((n, len(STATS), schedule.size))
+    numpy.put_along_axis(pmf, schedule.initial[..., None].astype('i8'), 1.0,
+                         axis=-1)
+    mean = numpy.zeros((n, schedule.points, len(STATS)))
+    std = numpy.zeros_like(mean)
+    mean[:, 0], std[:, 0] = _moments(pmf)
+    t = 1
+    for segment in schedule.segments:
+        if segment.shift is not None:
+            pmf = _clamp(_shift(pmf, segment.shift), segment.caps)
+            mean[:, t], std[:, t] = _moments(pmf)
+            t += 1
+        for j in xrange(segment.length):
+            active = (segment.steps > j)[:, None]
+            whole = numpy.where(active, segment.whole, 0)
+            p = numpy.where(active, segment.chance, 0)[..., None] / 100.0
+            pmf = (_shift(pmf, whole) * (1.0 - p) +
+                   _shift(pmf, whole + 1) * p)
+            pmf = _clamp(pmf, segment.caps)
+            mean[:, t], std[:, t] = _moments(pmf)
+            t += 1
+    return Projection(roster, schedule, mean, std, pmf)
+
+
+##############################################################################
+# Monte-Carlo simulation
+##############################################################################
+def _simulate_batch(schedule, trials, rng):
+    """Simulate a batch of trials.
+
+    Return (sums, sums of squares, histogram of the final stats).
+    """
+    n = len(schedule.initial)
+    nstats = len(STATS)
+    # Stats fit in a byte, unless the tables were edited to allow more
+    if schedule.size <= 0x100:
+        dtype, square_dtype, sum_dtype = 'u1', 'u2', 'i4'
+    else:
+        dtype, square_dtype, sum_dtype = 'i2', 'i8', 'i8'
+    sums = numpy.zeros((n, schedule.points, nstats), dtype='i8')
+    squares = numpy.zeros_like(sums)
+    state = numpy.empty((trials, n, nstats), dtype=dtype)
+    state[...] = schedule.initial
+    square = numpy.empty(state.shape, dtype=square_dtype)
+
+    def record(t, rows, order, count):
+        # Only the first `count` characters (in `order`) changed
+        if count < n:
+            sums[:, t] = sums[:, t - 1]
+            squares[:, t] = squares[:, t - 1]
+        index = order[:count]
+        view = rows[:, :count]
+        sums[index, t] = view.sum(axis=0, dtype=sum_dtype)
+        numpy.multiply(view, view, out=square[:, :count], dtype=square_dtype)
+        squares[index, t] = square[:, :count].sum(axis=0, dtype=sum_dtype)
+
+    identity = numpy.arange(n)
+    record(0, state, identity, n)
+    t = 1
+    for segment in schedule.segments:
+        if segment.shift is not None:
+            shifted = state.astype('i2')
+            shifted += segment.shift
+            numpy.clip(shifted, 0, segment.caps, out=shifted)
+            state[...] = shifted
+            del shifted
+            record(t, state, identity, n)
+            t += 1
+        # Characters with more level-ups go first, so the characters which
+        # level up at every step are a slice
+        order = numpy.argsort(-segment.steps, kind='stable')
+        rows = state.take(order, axis=1)
+        steps = segment.steps[order]
+        whole = segment.whole[order].astype(dtype)
+        caps = segment.caps[order].astype(dtype)
+        # Growth chance as a threshold for uniform uint16 values
+        thresholds = numpy.round(
+            segment.chance[order] * (65536 / 100.0)).astype('u2')
+        for j in xrange(segment.length):
+            count = int((steps > j).sum())
+            if count:
+                view = rows[:, :count]
+                # Four uniform uint16 values from every raw 64-bit output
+                draws = rng.bit_generator.random_raw(view.size // 4).view(
+                    'u2').reshape(view.shape)
+                view += draws < thresholds[:count]
+                if whole[:count].any():
+                    view += whole[:count]
+                numpy.minimum(view, caps[:count], out=view)
+            record(t, rows, order, count)
+            t += 1
+        state[:, order] = rows
+    values = numpy.arange(n * nstats).reshape(n, nstats) * schedule.size
+    histogram = numpy.bincount((state + values).ravel(),
+                               minlength=n * nstats * schedule.size)
+    return sums, squares, histogram.reshape(n, nstats, schedule.size)
+
+
+@profiling.profiled('growth.simulate')
+def simulate(roster, class_table, plan=None, trials=100000, seed=None,
+             max_level=MAX_LEVEL, jobs=None):
+    """Simulate the stats of a roster with Monte-Carlo trials.
+
+    `roster`: Roster object
+    `class_table`: ClassTable object
+    `plan`: List of (classes, levels). Default: level up to `max_level`
+    `trials`: Number of trials
+    `seed`: Random seed. The same seed gives the same result, whatever the
+        number of jobs.
+    `max_level`: Level cap
+    `jobs`: Number of threads. Default: min(32, CPU count + 4)
+
+    Return a Projection object.
+    """
+    _require_numpy()
+    schedule = _Schedule(roster, class_table, _plan(plan, max_level),
+                         max_level)
+    batches = [BATCH_SIZE] * (trials // BATCH_SIZE)
+    if trials % BATCH_SIZE:
+        batches.append(trials % BATCH_SIZE)
+    seeds = numpy.random.SeedSequence(seed).spawn(len(batches))
+
+    def run(i):
+        return _simulate_batch(schedule, batches[i],
+                               numpy.random.default_rng(seeds[i]))
+
+    if jobs is None:
+        jobs = min(32, (getattr(os, 'cpu_count', lambda: None)() or 1) + 4)
+    if ThreadPoolExecutor is None or jobs <= 1 or len(batches) <= 1:
+        results = [run(i) for i in xrange(len(batches))]
+    else:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(run, xrange(len(batches))))
+
+    n = len(roster)
+    sums = numpy.zeros((n, schedule.points, len(STATS)), dtype='i8')
+    squares = numpy.zeros_like(sums)
+    histogram = numpy.zeros((n, len(STATS), schedule.size), dtype='i8')
+    for batch_sums, batch_squares, batch_histogram in results:
+        sums += batch_sums
+        squares += batch_squares
+        histogram += batch_histogram
+    count = max(trials, 1)
+    mean = sums / count
+    std = numpy.sqrt(numpy.maximum(squares / count - mean * mean, 0.0))
+    return Projection(roster, schedule, mean, std, histogram / count, trials)
+
+
+##############################################################################
+# Command line
+##############################################################################
+def _format_table(projection):
+    lines = ['%s (%s)' % (projection.roster.name, 'exact' if
+                          projection.trials is None else
+                          '%d trials' % projection.trials)]
+    lines.append('%-24s %5s %3s ' % ('Character', 'Class', 'Lv') +
+                 ' '.join(['%11s' % stat[:11] for stat in STATS]))
+    for i in xrange(len(projection.roster)):
+        cells = ['%5.1f+-%4.1f' % (projection.mean[i, -1, k],
+                                   projection.std[i, -1, k])
+                 for k in xrange(len(STATS))]
+        lines.append('%-24s %5d %3d ' % (
+            projection.roster.labels[i][:24], projection.classes[i, -1],
+            projection.levels[i, -1]) + ' '.join(cells))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+    import glob
+    import json
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--input', default='GameData.bin',
+                        help='GameData.bin file (default: GameData.bin)')
+    parser.add_argument('--levels', type=int, default=None,
+                        help='number of level-ups in the current class '
+                        '(default: up to the level cap)')
+    parser.add_argument('--promote', type=int, default=None, metavar='N',
+                        help='promote, then level up N times')
+    parser.add_argument('--reclass', nargs=2, type=int, action='append',
+                        default=[], metavar=('CLASS', 'N'),
+                        help='reclass every character to CLASS, then level '
+                        'up N times')
+    parser.add_argument('--max-level', type=int, default=MAX_LEVEL,
+                        help='level cap (default: %d)' % MAX_LEVEL)
+    parser.add_argument('--handover', action='store_true',
+                        help='also project the characters of '
+                        'Character_*_HANDOVER/*_HANDOVER.bin')
+    parser.add_argument('--trials', type=int, default=0,
+                        help='number of Monte-Carlo trials (default: 0, '
+                        'compute the exact distributions)')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of simulation threads')
+    parser.add_argument('--json', action='store_true',
+                        help='print the final stats as JSON')
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    profiling.setup(args.profile)
+
+    plan = [(None, args.max_level if args.levels is None else args.levels)]
+    if args.promote is not None:
+        plan.append(('promote', args.promote))
+    for class_id, levels in args.reclass:
+        plan.append((class_id, levels))
+
+    game_data = gamedata.load_file(args.input)
+    class_table = load_classes(game_data)
+    rosters = [load_roster(game_data)]
+    if args.handover:
+        folder = os.path.dirname(os.path.abspath(args.input))
+        for path in sorted(glob.glob(os.path.join(
+                folder, 'Character_*_HANDOVER', '*_HANDOVER.bin'))):
+            rosters.append(load_handover(path))
+
+    output = {}
+    for roster in rosters:
+        if args.trials:
+            projection = simulate(roster, class_table, plan, args.trials,
+                                  args.seed, args.max_level, args.jobs)
+        else:
+            projection = expected(roster, class_table, plan, args.max_level)
+        if args.json:
+            output[roster.name] = projection.summary()
+        else:
+            print(_format_table(projection))
+            print()
+    if args.json:
+        print(json.dumps(output, indent=2, ensure_ascii=False))
@@ -0,0 +1,356 @@
+#!/usr/bin/env python2
+#
+# The MIT License
+#
+# Copyright (c) 2017 RainThunder.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+"""Read and edit A/B/C_HANDOVER.bin together.
+
+The three handover files (Birthright, Conquest and Revelation) have the same
+layout: a U16 count at 0x4 of the data region and a table of Character rows
+(see gamedata_schema.Character) at 0x30 of the file. A HandoverFamily loads
+all of them and shows them as one table keyed by PID, so a character can be
+compared across routes, and the same changes can be applied to every file.
+The PIDs of the handover files have a route prefix (PID_A_..., PID_B_...);
+the family drops it, so PID_X and PID_A_X name the same character.
+
+Changes are staged, then written with write(): every file gets a single
+label relocation and a single pack, the files are built concurrently and
+all of them are replaced in one atomic.Transaction.
+
+Usage:
+    python handover.py show PID [--root DIR]
+    python handover.py diff [PID ...]
+    python handover.py set PID COLUMN=VALUE [COLUMN=VALUE ...] [--routes A B]
+
+Example:
+    >>> import handover
+    >>> family = handover.HandoverFamily()
+    >>> family.diff(pid)
+    >>> family.set(pid, {'Level': 10})
+    >>> family.write()
+"""
+
+from __future__ import print_function, unicode_literals
+import os
+import re
+import sys
+from collections import OrderedDict
+from struct import unpack_from
+if sys.version_info[0] > 2:
+    xrange = range
+    unicode = str
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+import atomic
+import basetypes
+import bin
+import gamedata_schema
+import nightmare
+import profiling
+
+
+ROUTES = OrderedDict([('A', 'Birthright'), ('B', 'Conquest'),
+                      ('C', 'Revelation')])
+
+COUNT_OFFSET = 0x4
+TABLE_OFFSET = 0x30 # In the file, including the .bin header
+PID_COLUMN = 'Character Pointer'
+
+_ROUTE_PREFIX = re.compile(r'^PID_[%s]_' % ''.join(ROUTES))
+
+
+def handover_path(root, route):
+    """Get the path of the handover file of a route."""
+    return os.path.join(root, 'Character_%s_HANDOVER' % route,
+                        '%s_HANDOVER.bin' % route)
+
+
+def base_pid(pid):
+    """Remove the route prefix of a PID, e.g. PID_A_X -> PID_X."""
+    return _ROUTE_PREFIX.sub('PID_', pid)
+
+
+def character_module(binfile):
+    """Build the module of the Character table of a handover file. Return a
+    nightmare.Module object."""
+    count = unpack_from('<H', binfile.data, COUNT_OFFSET)[0]
+    module = nightmare.Module()
+    module.fromrowclass(gamedata_schema.Character, TABLE_OFFSET, count)
+    return module
+
+
+class HandoverFile(object):
+    """A handover file.
+
+    `route`: 'A', 'B' or 'C'
+    `path`: File path
+    `binfile`: bin.BinFile object
+    `module`: nightmare.Module of the Character table
+    `columns`: OrderedDict of column name -> values
+    `types`: Dict of column name -> data type
+    `rows`: Dict of PID (without route prefix) -> row index
+    """
+
+    def __init__(self, route, path, binfile=None):
+        self.route = route
+        self.path = path
+        self.binfile = bin.load_file(path) if binfile is None else binfile
+        self.module = character_module(self.binfile)
+        self.refresh()
+
+    def refresh(self):
+        """Read the table again, after the BinFile was changed."""
+        columns = self.module.read_columns(self.binfile)
+        self.columns = OrderedDict([(c.name, c.values) for c in columns])
+        self.types = dict([(c.name, c.type) for c in columns])
+        self.rows = dict([(base_pid(pid), i) for i, pid in
+                          enumerate(self.columns[PID_COLUMN])])
+
+    def row(self, index):
+        """Get a row as an OrderedDict of column name -> value."""
+        return OrderedDict([(name, values[index])
+                            for name, values in self.columns.items()])
+
+
+class HandoverFamily(object):
+    """The handover files of all routes.
+
+    `root`: Folder which contains the Character_<route>_HANDOVER folders
+    `routes`: Routes to load. Default: every route whose file exists
+
+    Views (`[pid]`, get(), diff()) show the files as they were last
+    written; changes made with set() are applied by write().
+    """
+
+    def __init__(self, root='', routes=None):
+        self.root = root
+        self.files = OrderedDict()
+        for route in routes or ROUTES:
+            path = handover_path(root, route)
+            if routes is not None or os.path.isfile(path):
+                self.files[route] = HandoverFile(route, path)
+        self.pending = dict([(route, OrderedDict()) for route in self.files])
+
+    def pids(self):
+        """Get the PIDs of all routes, in file order."""
+        seen = OrderedDict()
+        for f in self.files.values():
+            for pid in f.columns[PID_COLUMN]:
+                seen[base_pid(pid)] = True
+        return list(seen)
+
+    def __contains__(self, pid):
+        pid = base_pid(pid)
+        return any(pid in f.rows for f in self.files.values())
+
+    def __iter__(self):
+        return iter(self.pids())
+
+    def __getitem__(self, pid):
+        """Get the rows of a PID, as an OrderedDict of route -> row."""
+        pid = base_pid(pid)
+        result = OrderedDict([(route, f.row(f.rows[pid]))
+                              for route, f in self.files.items()
+                              if pid in f.rows])
+        if not result:
+            raise KeyError(pid)
+        return result
+
+    def routes_of(self, pid):
+        """Get the routes which have a PID."""
+        pid = base_pid(pid)
+        return [route for route, f in self.files.items() if pid in f.rows]
+
+    def get(self, pid, column):
+        """Get a cell of a PID in every route, as an OrderedDict of route ->
+        value."""
+        return OrderedDict([(route, row[column])
+                            for route, row in self[pid].items()])
+
+    def diff(self, pid, columns=None):
+        """Get the cells of a PID which are not the same in all routes.
+
+        `columns`: Columns to compare. Default: all columns but the PID
+
+        Return an OrderedDict of column -> OrderedDict of route -> value.
+        Routes which do not have the PID are left out.
+        """
+        rows = self[pid]
+        result = OrderedDict()
+        if columns is None:
+            columns = [c for c in next(iter(self.files.values())).columns
+                       if c != PID_COLUMN]
+        for column in columns:
+            values = OrderedDict([(route, row[column])
+                                  for route, row in rows.items()])
+            if len(set(values.values())) > 1:
+                result[column] = values
+        return result
+
+    def set(self, pid, values, routes=None):
+        """Stage changes of a PID.
+
+        `values`: Dict of column name -> new value
+        `routes`: Routes to change. Default: every route which has the PID
+
+        Raise KeyError if no selected route has the PID.
+        """
+        pid = base_pid(pid)
+        routes = [route for route in (routes or self.files)
+                  if pid in self.files[route].rows]
+        if not routes:
+            raise KeyError(pid)
+        for route in routes:
+            row = self.files[route].rows[pid]
+            self.pending[route].setdefault(row, {}).update(values)
+
+    def patch(self, changes, routes=None):
+        """Stage changes of several PIDs.
+
+        `changes`: Dict of PID -> dict of column name -> new value
+        """
+        for pid, values in changes.items():
+            self.set(pid, values, routes)
+
+    @profiling.profiled('handover.write')
+    def write(self, transaction=None, jobs=None):
+        """Apply the staged changes and write the changed files.
+
+        `transaction`: An atomic.Transaction which the files are written to.
+            If it is None, the files are written in a new transaction.
+        `jobs`: Number of threads. Default: one per changed file
+
+        Either every file is changed or none of them: nothing is written if a
+        value is invalid (see nightmare.Module.write_rows()).
+
+        Return the list of written paths.
+        """
+        routes = [route for route in self.files if self.pending[route]]
+        if not routes:
+            return []
+
+        def build(route):
+            f = self.files[route]
+            binfile = f.binfile.copy()
+            f.module.write_rows(binfile, self.pending[route].items(),
+                                f.types)
+            return binfile
+
+        def stage(item):
+            route, binfile = item
+            transaction.write(self.files[route].path, binfile.tobin())
+
+        pool = None
+        if ThreadPoolExecutor is not None and len(routes) > 1 and \
+                (jobs is None or jobs > 1):
+            pool = ThreadPoolExecutor(jobs or len(routes))
+        run = pool.map if pool is not None else map
+        try:
+            binfiles = list(run(build, routes))
+            items = list(zip(routes, binfiles))
+            if transaction is None:
+                with atomic.Transaction(self.root) as transaction:
+                    list(run(stage, items))
+            else:
+                list(run(stage, items))
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        for route, binfile in items:
+            f = self.files[route]
+            f.binfile = binfile
+            f.refresh()
+            self.pending[route] = OrderedDict()
+        return [self.files[route].path for route in routes]
+
+
+def _parse_value(text, datatype):
+    if datatype is basetypes.Label:
+        return text
+    if datatype is bytes:
+        return bytes(bytearray.fromhex(text))
+    return int(text, 0)
+
+
+def _format_value(value):
+    if isinstance(value, bytes):
+        return ' '.join(['%02X' % b for b in bytearray(value)])
+    return unicode(value)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--root', default='',
+                        help='folder which contains the '
+                        'Character_<route>_HANDOVER folders')
+    profiling.add_argument(parser)
+    subparsers = parser.add_subparsers(dest='command')
+    show_parser = subparsers.add_parser('show', help='show a character in '
+                                        'every route')
+    show_parser.add_argument('pid')
+    diff_parser = subparsers.add_parser('diff', help='list the cells which '
+                                        'are not the same in all routes')
+    diff_parser.add_argument('pids', nargs='*',
+                             help='PIDs (default: all characters)')
+    set_parser = subparsers.add_parser('set', help='change a character in '
+                                       'every route')
+    set_parser.add_argument('pid')
+    set_parser.add_argument('values', nargs='+', metavar='COLUMN=VALUE')
+    set_parser.add_argument('--routes', nargs='+', choices=list(ROUTES),
+                            default=None)
+    args = parser.parse_args()
+    profiling.setup(args.profile)
+
+    family = HandoverFamily(args.root)
+    if args.command == 'show':
+        rows = family[args.pid]
+        print('%-32s %s' % ('', ' '.join(['%-16s' % r for r in rows])))
+        for column in next(iter(rows.values())):
+            print('%-32s %s' % (column[:32], ' '.join(
+                ['%-16s' % _format_value(row[column])
+                 for row in rows.values()])))
+    elif args.command == 'diff':
+        for pid in args.pids or family.pids():
+            for column, values in family.diff(pid).items():
+                print('%s\t%s\t%s' % (pid, column, '\t'.join(
+                    ['%s=%s' % (route, _format_value(value))
+                     for route, value in values.items()])))
+    elif args.command == 'set':
+        types = next(iter(family.files.values())).types
+        values = {}
+        for item in args.values:
+            column, _, text = item.partition('=')
+            if column not in types:
+                parser.error('unknown column: ' + column)
+            values[column] = _parse_value(text, types[column])
+        family.set(args.pid, values, args.routes)
+        for path in family.write():
+            print(path + ' was written.')
+    else:
+        parser.print_help()
@@ -0,0 +1,364 @@
+#!/usr/bin/env python2
+#
+# The MIT License
+#
+# Copyright (c) 2017 RainThunder.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+"""Read Nightmare modules (.nmm files) and use them to read tables from .bin
+files.
+
+A Nightmare module is a plain text file. Its header stores the table offset
+(including the 0x20-byte .bin header), the number of entries and the size of
+each entry. Each field is described by a block of five lines: name, offset,
+length, type and list file. Lines beginning with '#' are comments.
+
+Example:
+    >>> import bin, nightmare
+    >>> module = nightmare.load_module('Character/Character.nmm')
+    >>> columns = module.read_columns(bin.load_file('GameData.bin'))
+    >>> columns[8].name, columns[8].values[1]
+    ('Character Pointer', 'PID_\\u30ab\\u30e0\\u30a4\\u7537')
+"""
+
+import codecs
+import sys
+from collections import namedtuple
+from struct import unpack_from
+if sys.version_info[0] > 2:
+    xrange = range
+    unicode = str
+    long = int
+
+import basetypes
+import sjis
+
+
+class Entry(namedtuple('Entry', ['name', 'offset', 'length', 'type', 'list'])):
+    """A field in a Nightmare module."""
+    __slots__ = ()
+
+    @property
+    def datatype(self):
+        """Get the basetypes class of this field, or None for raw bytes."""
+        signed = self.type.endswith('S')
+        if self.length == 1:
+            return basetypes.S8 if signed else basetypes.U8
+        elif self.length == 2:
+            return basetypes.S16 if signed else basetypes.U16
+        elif self.length == 4:
+            return basetypes.S32 if signed else basetypes.U32
+        return None
+
+
+class Module(object):
+    """A Nightmare module."""
+
+    def __init__(self, name=u'', offset=0, count=0, size=0, list=u'NULL',
+                 entries=None):
+        """Create a new module.
+
+        `name`: Module description
+        `offset`: Table offset in the file, including the .bin header
+        `count`: Number of entries
+        `size`: Size of an entry
+        `list`: Entry name list file
+        `entries`: List of Entry objects
+        """
+        self.name = name
+        self.offset = offset
+        self.count = count
+        self.size = size
+        self.list = list
+        self.entries = [] if entries is None else entries
+        self.labels = frozenset() # Names of entries which are known labels
+        self.comments = {}        # Entry index -> comment line before it
+
+    @property
+    def data_offset(self):
+        """Get the table offset in the data region."""
+        return self.offset - 0x20
+
+    def fromstring(self, text):
+        """Load a module from text."""
+        blocks = []
+        block = []
+        for line in text.splitlines():
+            line = line.strip()
+            if line.startswith(u'#'):
+                continue
+            if line == u'':
+                if len(block) > 0:
+                    blocks.append(block)
+                block = []
+            else:
+                block.append(line)
+        if len(block) > 0:
+            blocks.append(block)
+        if len(blocks) == 0 or len(blocks[0]) < 6:
+            raise ValueError('invalid module header')
+
+        header = blocks[0]
+        self.name = header[1]
+        self.offset = int(header[2], 0)
+        self.count = int(header[3], 0)
+        self.size = int(header[4], 0)
+        self.list = header[5]
+        self.entries = []
+        self.comments = {}
+        for block in blocks[1:]:
+            if len(block) != 5:
+                raise ValueError('invalid entry: ' + repr(block))
+            self.entries.append(Entry(block[0], int(block[1], 0),
+                                      int(block[2], 0), block[3], block[4]))
+
+    def fromrowclass(self, rowclass, offset, count, name=u'', list=u'NULL',
+                     lists=None, sections=None, names=None):
+        """Create a module from a basetypes.Row subclass.
+
+        `rowclass`: Row class
+        `offset`: Table offset in the file, including the .bin header
+        `count`: Number of entries
+        `name`: Module description
+        `list`: Entry name list file
+        `lists`: Dict of field names and list files. These fields are shown
+            as drop-down lists.
+        `sections`: Dict of field names and comments, which are written
+            before these fields
+        `names`: Dict of field names and the names shown in the module, for
+            fields whose names differ only to be unique in the Row class
+
+        Sub-rows, arrays and dicts are expanded to one field per cell, except
+        byte arrays in hexadecimal format, which become a single HEXA field.
+        A Flags field becomes a single hexadecimal field. Fields whose names
+        start with an underscore are left out.
+        """
+        self.name = name
+        self.offset = offset
+        self.count = count
+        self.size = rowclass.true_size()
+        self.list = list
+        self.entries = []
+        self.comments = {}
+        self.__sections = {} if sections is None else sections
+        self.__names = {} if names is None else names
+        self.__add_row(rowclass, u'', 0, {} if lists is None else lists)
+        self.labels = frozenset([self.__names.get(name, name)
+                                 for name, t in rowclass.flatten_columns()
+                                 if t is basetypes.Label])
+
+    def __add_row(self, rowclass, prefix, offset, lists):
+        st = rowclass.structure
+        for attr in st:
+            t = st[attr].type
+            name = prefix + attr
+            if name in self.__sections:
+                self.comments[len(self.entries)] = self.__sections[name]
+            name = self.__names.get(name, name)
+            if attr.startswith(u'_'):
+                pass
+            elif issubclass(t, basetypes.Row):
+                self.__add_row(t, name + u'.', offset, lists)
+            elif issubclass(t, basetypes.Array):
+                if t.type is basetypes.U8 and \
+                        st[attr].format == basetypes.Formats.HEX:
+                    self.entries.append(Entry(name, offset, t.size, u'HEXA',
+                                              u'NULL'))
+                else:
+                    for i in xrange(t.length):
+                        self.__add_cell(t.type, u'%s.%d' % (name, i),
+                                        offset + i * t.type.size,
+                                        st[attr].format)
+            elif issubclass(t, basetypes.RestrictedDict):
+                for i in xrange(len(t.keys)):
+                    self.__add_cell(t.type, name + u'.' + t.keys[i],
+                                    offset + i * t.type.size, st[attr].format)
+            elif issubclass(t, basetypes.Flags):
+                self.entries.append(Entry(name, offset, t.size, u'NEHU',
+                                          u'NULL'))
+            else:
+                self.__add_cell(t, name, offset, st[attr].format,
+                                lists.get(attr))
+            offset += t.size
+
+    def __add_cell(self, t, name, offset, format, list=None):
+        if issubclass(t, basetypes.SignedInteger):
+            type = u'NEDS'
+        elif issubclass(t, basetypes.Label) or format == basetypes.Formats.HEX:
+            type = u'NEHU'
+        else:
+            type = u'NEDU'
+        if list is None:
+            list = u'NULL'
+        else:
+            type = u'ND' + type[2:] # Drop-down list
+        self.entries.append(Entry(name, offset, t.size, type, list))
+
+    def tostring(self, comment=None):
+        """Get the text of this module.
+
+        `comment`: Comment line at the top of the file. Default: the module
+            description
+        """
+        lines = [u'#' + (self.name if comment is None else comment), u'',
+                 u'1', self.name, u'0x%X' % self.offset, unicode(self.count),
+                 unicode(self.size), self.list, u'NULL']
+        for i, entry in enumerate(self.entries):
+            lines.append(u'')
+            if i in self.comments:
+                lines.append(u'#' + self.comments[i])
+            lines.extend([entry.name, unicode(entry.offset),
+                          unicode(entry.length), entry.type, entry.list])
+        return u'\n'.join(lines) + u'\n'
+
+    def column_names(self):
+        """Get unique column names. Duplicated entry names are suffixed with
+        their offset."""
+        seen = {}
+        for entry in self.entries:
+            seen[entry.name] = seen.get(entry.name, 0) + 1
+        return [e.name if seen[e.name] == 1 else
+                u'%s (0x%X)' % (e.name, e.offset) for e in self.entries]
+
+    def read_columns(self, binfile, offset=None, count=None):
+        """Read the table described by this module, column by column.
+
+        Pointer fields whose non-null values are all referenced in pointer
+        region 1 and point to the label region are resolved to labels. Null
+        fields which are named as pointers are treated as labels, too, as well
+        as the fields listed in `labels`.
+
+        `binfile`: A bin.BinFile object
+        `offset`: Table offset in the data region. Default: module offset
+        `count`: Number of entries. Default: module entry count
+
+        Return a list of basetypes.Column.
+        """
+        if offset is None:
+            offset = self.data_offset
+        if count is None:
+            count = self.count
+        data = binfile.data
+        label0_offset = binfile.label0_offset
+        p1_set = frozenset(binfile.ptr1_list)
+        label_dict = None
+        columns = []
+        names = self.column_names()
+        for i in xrange(len(self.entries)):
+            entry = self.entries[i]
+            datatype = entry.datatype
+            positions = [offset + j * self.size + entry.offset
+                         for j in xrange(count)]
+            if datatype is None:
+                values = [data[p:p + entry.length] for p in positions]
+                columns.append(basetypes.Column(names[i], bytes, values))
+                continue
+            fstring = '<' + datatype.fstring
+            values = [unpack_from(fstring, data, p)[0] for p in positions]
+            if entry.length != 4:
+                is_label = False
+            elif entry.name in self.labels:
+                is_label = True
+            elif any(values):
+                is_label = all(v == 0 or (p in p1_set and v >= label0_offset)
+                               for p, v in zip(positions, values))
+            else: # Unused pointer fields
+                is_label = u'pointer' in entry.name.lower()
+            if is_label:
+                if label_dict is None:
+                    label_dict = binfile.get_labels()
+                values = [label_dict[v] if v in label_dict else
+                          binfile.get_label(v) for v in values]
+                datatype = basetypes.Label
+            columns.append(basetypes.Column(names[i], datatype, values))
+        return columns
+
+    def write_row(self, binfile, row, values, types, offset=None):
+        """Write some cells of a row.
+
+        `binfile`: A bin.BinFile object
+        `row`: Row index
+        `values`: A dict of column name -> new value. Labels are unicode
+            strings and raw fields are bytes.
+        `types`: A dict of column name -> data type, as read by read_columns
+        `offset`: Table offset in the data region. Default: module offset
+
+        Raise KeyError for unknown columns, and TypeError or ValueError for
+        invalid values. Nothing is written if a value is invalid.
+        """
+        self.write_rows(binfile, [(row, values)], types, offset)
+
+    def write_rows(self, binfile, rows, types, offset=None):
+        """Write some cells of several rows. All labels are set with a single
+        relocation and all other values with a single pack.
+
+        `rows`: An iterable of (row index, dict of column name -> new value)
+
+        See write_row() for the other arguments and the errors. Nothing is
+        written if a value is invalid.
+        """
+        if offset is None:
+            offset = self.data_offset
+        entries = dict(zip(self.column_names(), self.entries))
+        labels = []
+        numbers = []
+        for row, values in rows:
+            for name, value in values.items():
+                if name not in entries:
+                    raise KeyError('unknown column: ' + name)
+                entry = entries[name]
+                position = offset + row * self.size + entry.offset
+                datatype = types[name]
+                if datatype is basetypes.Label:
+                    if not isinstance(value, unicode):
+                        raise TypeError(name + ': expected a label')
+                    sjis.encode(value)
+                    labels.append((position, value))
+                elif datatype is bytes:
+                    if not isinstance(value, bytes) or \
+                            len(value) != entry.length:
+                        raise ValueError(name + ': expected %d bytes' %
+                                         entry.length)
+                    numbers.append((position, '%ds' % entry.length, value))
+                else:
+                    if isinstance(value, bool) or \
+                            not isinstance(value, (int, long)):
+                        raise TypeError(name + ': expected an integer')
+                    datatype(value) # Range check
+                    numbers.append((position, '<' + datatype.fstring, value))
+        binfile.set_labels(labels)
+        binfile.pack_values(numbers)
+
+
+def load_module(path):
+    """Load a Nightmare module.
+
+    Parameters:
+    ``path``: Path to a .nmm file.
+    """
+    with codecs.open(path, 'r', 'utf-8') as file:
+        text = file.read()
+    module = Module()
+    module.fromstring(text)
+    return module
+
+
+if __name__ == '__main__':
+    print('This script is a library and does not mean to be used directly.')
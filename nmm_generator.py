@@ -0,0 +1,217 @@
+#!/usr/bin/env python2
+#
+# The MIT License
+#
+# Copyright (c) 2017 RainThunder.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+"""Generate the Nightmare modules of GameData.bin from Row schemas.
+
+Every module listed in gamedata_schema.TABLES is rebuilt from its Row schema,
+with the table offset and the entry count read from a GameData.bin file, so a
+layout change only needs an edit of gamedata_schema.py. The flag list files
+(Flag1-8.txt, Route.txt, ...) are generated from their bit names. Name list
+files are written by hand and are left as they are.
+
+The section comments and the names of some fields in the modules come from
+gamedata_schema too (`sections` and `module_names`), so a module generated
+from an unchanged GameData.bin is the same as the one which was written by
+hand. Existing files keep their line endings (CRLF or LF) and their final
+newline, or the lack of it, and files whose content does not change are not
+written.
+
+The support modules (Support_<id> folders) of all characters who have
+supports are generated in the same pass. Every file is written in a single
+atomic.Transaction.
+
+Usage:
+    python nmm_generator.py [-i GameData.bin] [-o folder] [--no-supports]
+
+Example:
+    >>> import gamedata, nmm_generator
+    >>> game_data = gamedata.load_file('GameData.bin')
+    >>> nmm_generator.generate(game_data)
+"""
+
+from __future__ import print_function
+import io
+import os
+import sys
+from struct import unpack_from
+if sys.version_info[0] > 2:
+    xrange = range
+
+import atomic
+import gamedata
+import gamedata_module
+import gamedata_schema
+import nightmare
+import profiling
+
+
+def table_location(game_data, schema):
+    """Get the location of a table in GameData.bin.
+
+    `game_data`: GameData object
+    `schema`: gamedata_schema.TableSchema object
+
+    Return (offset in the file including the .bin header, entry count).
+    """
+    slot, delta = schema.anchor
+    offset = unpack_from('<I', game_data.data, slot)[0] + delta
+    count = schema.count
+    if count is None:
+        info = game_data.get_table_info(schema.name)
+        count = unpack_from('<H', game_data.data, info.count_offset)[0]
+    return offset + 0x20, count
+
+
+def build_module(game_data, schema):
+    """Build the module of a table. Return a nightmare.Module object."""
+    offset, count = table_location(game_data, schema)
+    module = nightmare.Module()
+    module.fromrowclass(schema.rowclass, offset, count,
+                        schema.title + ' by RainThunder', schema.list,
+                        schema.rowclass.lists,
+                        getattr(schema.rowclass, 'sections', None),
+                        getattr(schema.rowclass, 'module_names', None))
+    return module
+
+
+def flag_list(names):
+    """Get the text of the list file of a flag byte.
+
+    `names`: Names of the bits, from the lowest bit
+    """
+    lines = [str(1 << len(names)), '0x0 None']
+    for value in xrange(1, 1 << len(names)):
+        lines.append('0x%X %s' % (value, ', '.join(
+            [names[i] for i in xrange(len(names)) if value >> i & 1])))
+    return '\n'.join(lines) + '\n'
+
+
+def table_files(game_data, schema):
+    """Build the module of a table and its generated list files.
+
+    Return a list of (path, text).
+    """
+    module = build_module(game_data, schema)
+    folder = os.path.dirname(schema.path)
+    files = [(schema.path, module.tostring(schema.title))]
+    for list_name in sorted(set(schema.rowclass.lists.values())):
+        if list_name in gamedata_schema.FLAG_LISTS:
+            files.append((os.path.join(folder, list_name),
+                          flag_list(gamedata_schema.FLAG_LISTS[list_name])))
+    return files
+
+
+@profiling.profiled('modules.generate')
+def generate(game_data, root='', transaction=None, supports=True):
+    """Generate the modules of GameData.bin.
+
+    `game_data`: GameData object
+    `root`: Folder which the module folders are written to. Default: current
+        folder
+    `transaction`: An atomic.Transaction which the files are written to. If it
+        is None, the files are written in a new transaction.
+    `supports`: If True, the support modules are generated, too.
+
+    The modules are built one after the other: building them is pure Python,
+    so threads would not make it faster.
+
+    Return the list of written paths, relative to `root`. Files whose content
+    did not change are not written.
+    """
+    results = [table_files(game_data, schema)
+               for schema in gamedata_schema.TABLES]
+    if supports:
+        tables = gamedata_module.support_tables(game_data)
+        results.extend([_support_files(game_data, index, tables)
+                        for index in gamedata_module.support_indices(
+                            game_data, tables)])
+
+    files = []
+    seen = set()
+    for result in results:
+        for path, text in result:
+            if path not in seen:
+                seen.add(path)
+                files.append((path, text))
+
+    if transaction is None:
+        if root and not os.path.isdir(root):
+            os.makedirs(root)
+        with atomic.Transaction(root) as transaction:
+            return _write_files(files, root, transaction)
+    return _write_files(files, root, transaction)
+
+
+def _support_files(game_data, index, tables):
+    return gamedata_module.support_module_files(game_data, index, tables)[1]
+
+
+def _write_files(files, root, transaction):
+    """Write the files which changed. Return their paths."""
+    written = []
+    for path, text in files:
+        full_path = os.path.join(root, path)
+        try:
+            with io.open(full_path, 'rb') as file:
+                old = file.read()
+        except (IOError, OSError):
+            old = None
+        if old is None:
+            # Same line endings as a file written in text mode
+            newline = os.linesep
+        else:
+            # Keep the line endings and the final newline of the file
+            newline = '\r\n' if b'\r\n' in old else '\n'
+            if old and not old.endswith(b'\n') and text.endswith('\n'):
+                text = text[:-1]
+        data = text.replace('\n', newline).encode(
+            gamedata_module.LIST_ENCODING)
+        if data == old:
+            continue
+        folder = os.path.dirname(full_path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        transaction.write(full_path, data)
+        written.append(path)
+    return written
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--input', default='GameData.bin',
+                        help='GameData.bin file (default: GameData.bin)')
+    parser.add_argument('-o', '--output', default='',
+                        help='folder which the modules are written to '
+                        '(default: current folder)')
+    parser.add_argument('--no-supports', action='store_true',
+                        help='do not generate the support modules')
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    profiling.setup(args.profile)
+
+    game_data = gamedata.load_file(args.input)
+    paths = generate(game_data, args.output, supports=not args.no_supports)
+    print('%d files were written.' % len(paths))
@@ -0,0 +1,398 @@
+#!/usr/bin/env python2
+#
+# The MIT License
+#
+# Copyright (c) 2017 RainThunder.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+"""Opt-in timing instrumentation for the tools in this project.
+
+Profiling is disabled by default. When it is disabled, `phase()` returns
+a shared no-op object and `profiled` functions call the wrapped function
+directly, so the instrumentation costs almost nothing.
+
+There are two ways to enable it:
+- Pass `--profile` to arc.py, castle_join.py, fst_generator.py or
+  gamedata_module.py.
+- Set the FEFATES_PROFILE environment variable.
+
+In both cases the value is the output: if it is omitted (or '1'), a summary
+is printed to stderr when the tool exits; if it is a file name, a Chrome trace
+(JSON) is written to that file, which can be opened in chrome://tracing or
+https://ui.perfetto.dev.
+
+Each phase records its wall time, number of bytes processed, and memory
+allocated (net bytes, peak bytes and net number of memory blocks) using
+tracemalloc, when it is available (peak memory requires Python 3.9+). Counting
+memory blocks takes a snapshot of all traced memory, so it is only done for
+phases which start when no other phase is open. Time spent on measuring
+memory is excluded from the recorded wall time.
+
+Example:
+    >>> import profiling
+    >>> profiling.enable()
+    >>> with profiling.phase('io.read') as p:
+    ...     raw = open('GameData.bin', 'rb').read()
+    ...     p.nbytes = len(raw)
+    >>> print(profiling.summary())
+"""
+
+from __future__ import print_function, unicode_literals
+import atexit
+import functools
+import os
+import sys
+import threading
+import time
+
+tracemalloc = None # Imported by enable(), only if memory is traced
+
+ENV_VARIABLE = 'FEFATES_PROFILE'
+
+timer = getattr(time, 'perf_counter', time.time)
+
+_enabled = False
+_trace_memory = False
+_events = []    # Finished phases: (name, start, duration, nbytes, memory,
+                # peak, blocks, thread id)
+_track_peak = False # tracemalloc can reset its peak (Python 3.9+)
+_local = threading.local() # State of the phases open in each thread
+_open = [0]     # Number of open phases in all threads
+_lock = threading.Lock()
+_counters = []  # Functions which return a dictionary of counters
+_origin = timer()
+
+
+class _NullPhase(object):
+    """Phase object used when profiling is disabled."""
+    __slots__ = ()
+    nbytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __setattr__(self, name, value):
+        pass # Ignore nbytes updates
+
+
+_NULL_PHASE = _NullPhase()
+
+
+def _thread_state():
+    """Get the phase state of the current thread.
+
+    `overhead` is the time spent on measuring memory, `peak_stack` holds the
+    peak memory carried from nested phases, one item per open phase.
+    """
+    if not hasattr(_local, 'peak_stack'):
+        _local.overhead = 0.0
+        _local.peak_stack = []
+    return _local
+
+
+def _block_count(state):
+    """Get the number of traced memory blocks."""
+    start = timer()
+    snapshot = tracemalloc.take_snapshot()
+    blocks = len(snapshot.traces)
+    del snapshot
+    state.overhead += timer() - start
+    return blocks
+
+
+class _Phase(object):
+    """A timed phase."""
+    __slots__ = ('name', 'nbytes', '_start', '_overhead', '_memory',
+                 '_blocks', '_state')
+
+    def __init__(self, name, nbytes=None):
+        self.name = name
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        state = self._state = _thread_state()
+        peak_stack = state.peak_stack
+        with _lock:
+            outermost = _open[0] == 0
+            _open[0] += 1
+        self._blocks = None
+        if _trace_memory:
+            if outermost:
+                self._blocks = _block_count(state)
+            self._memory, peak = tracemalloc.get_traced_memory()
+            if _track_peak:
+                # Carry the peak of the enclosing phase before resetting it
+                if len(peak_stack) > 0:
+                    peak_stack[-1] = max(peak_stack[-1], peak)
+                tracemalloc.reset_peak()
+        peak_stack.append(0)
+        self._overhead = state.overhead
+        self._start = timer()
+        return self
+
+    def __exit__(self, *exc_info):
+        state = self._state
+        duration = timer() - self._start - (state.overhead - self._overhead)
+        peak_stack = state.peak_stack
+        carried = peak_stack.pop()
+        memory = peak = blocks = None
+        if _trace_memory:
+            size, peak = tracemalloc.get_traced_memory()
+            memory = size - self._memory
+            if _track_peak:
+                peak = max(peak, carried)
+                if len(peak_stack) > 0:
+                    peak_stack[-1] = max(peak_stack[-1], peak)
+                tracemalloc.reset_peak()
+                peak -= self._memory
+            else:
+                peak = None
+            if self._blocks is not None:
+                blocks = _block_count(state) - self._blocks
+        with _lock:
+            _open[0] -= 1
+            _events.append((self.name, self._start - _origin, duration,
+                            self.nbytes, memory, peak, blocks,
+                            threading.current_thread().ident))
+        return False
+
+
+def phase(name, nbytes=None):
+    """Create a context manager which records a phase.
+
+    `name`: Phase name, e.g. 'bin.parse'
+    `nbytes`: Number of bytes processed. It can also be set later via the
+        `nbytes` attribute of the returned object.
+    """
+    if not _enabled:
+        return _NULL_PHASE
+    return _Phase(name, nbytes)
+
+
+def profiled(name, nbytes=None):
+    """Decorator which records every call of a function as a phase.
+
+    `name`: Phase name
+    `nbytes`: A function which takes the same arguments as the decorated
+        function and returns the number of bytes processed. It is only called
+        when profiling is enabled.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Phase(name, nbytes(*args, **kwargs) if nbytes else None):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def enable(trace_memory=True):
+    """Enable profiling.
+
+    `trace_memory`: Record memory allocations with tracemalloc (Python 3.4+).
+    """
+    global _enabled, _trace_memory, _track_peak, tracemalloc
+    _enabled = True
+    if trace_memory and tracemalloc is None:
+        try:
+            import tracemalloc
+        except ImportError: # Python 2
+            trace_memory = False
+    _trace_memory = trace_memory
+    _track_peak = _trace_memory and hasattr(tracemalloc, 'reset_peak')
+    if _trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    """Disable profiling. Recorded phases are kept."""
+    global _enabled, _trace_memory
+    _enabled = False
+    if _trace_memory:
+        tracemalloc.stop()
+    _trace_memory = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def register_counters(func):
+    """Register a function which returns a dictionary of name -> number,
+    e.g. cache hits and misses. The counters are added to summary() and
+    chrome_trace(), whether or not profiling is enabled.
+    """
+    _counters.append(func)
+
+
+def counters():
+    """Get the current values of all registered counters."""
+    values = {}
+    for func in _counters:
+        values.update(func())
+    return values
+
+
+def reset():
+    """Remove all recorded phases."""
+    with _lock:
+        del _events[:]
+
+
+def summary():
+    """Get a summary of recorded phases, grouped by name."""
+    groups = {}
+    order = []
+    with _lock:
+        events = list(_events)
+    for name, start, duration, nbytes, memory, peak, blocks, tid in events:
+        if name not in groups:
+            groups[name] = [0, 0.0, 0, None, None, None]
+            order.append(name)
+        g = groups[name]
+        g[0] += 1
+        g[1] += duration
+        g[2] += nbytes or 0
+        if memory is not None:
+            g[3] = (g[3] or 0) + memory
+        if blocks is not None:
+            g[5] = (g[5] or 0) + blocks
+        if peak is not None:
+            g[4] = max(g[4] or 0, peak)
+
+    header = '%-24s %6s %11s %12s %11s %11s %9s' % (
+        'Phase', 'Calls', 'Time (ms)', 'Throughput', 'Memory', 'Peak',
+        'Blocks')
+    lines = [header, '-' * len(header)]
+    for name in order:
+        calls, duration, nbytes, memory, peak, blocks = groups[name]
+        throughput = '-'
+        if nbytes and duration > 0:
+            throughput = _format_size(nbytes / duration) + '/s'
+        lines.append('%-24s %6d %11.3f %12s %11s %11s %9s' % (
+            name, calls, duration * 1000, throughput, _format_size(memory),
+            _format_size(peak), '-' if blocks is None else blocks))
+
+    values = counters()
+    if values:
+        lines.append('')
+        header = '%-24s %11s' % ('Counter', 'Value')
+        lines.extend([header, '-' * len(header)])
+        for name in sorted(values):
+            lines.append('%-24s %11d' % (name, values[name]))
+    return '\n'.join(lines)
+
+
+def chrome_trace():
+    """Get recorded phases in Chrome trace event format."""
+    pid = os.getpid()
+    trace_events = []
+    with _lock:
+        events = list(_events)
+    for name, start, duration, nbytes, memory, peak, blocks, tid in events:
+        args = {}
+        if nbytes is not None:
+            args['bytes'] = nbytes
+        if memory is not None:
+            args['memory'] = memory
+        if blocks is not None:
+            args['blocks'] = blocks
+        if peak is not None:
+            args['peak'] = peak
+        trace_events.append({
+            'name': name,
+            'cat': name.split('.')[0],
+            'ph': 'X',
+            'ts': start * 1e6,
+            'dur': duration * 1e6,
+            'pid': pid,
+            'tid': tid,
+            'args': args
+        })
+    values = counters()
+    if values:
+        trace_events.append({
+            'name': 'counters',
+            'ph': 'C',
+            'ts': (timer() - _origin) * 1e6,
+            'pid': pid,
+            'args': values
+        })
+    return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+
+def write_chrome_trace(path):
+    """Write recorded phases to a Chrome trace file."""
+    import atomic
+    import json
+    with atomic.atomic_path(path) as temp:
+        with open(temp, 'w') as file:
+            json.dump(chrome_trace(), file)
+
+
+def _format_size(n):
+    if n is None:
+        return '-'
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(n) < 1024:
+            return '%.1f %s' % (n, unit)
+        n /= 1024.0
+    return '%.1f GiB' % n
+
+
+def _report(output):
+    if output in (None, '', '1'):
+        print(summary(), file=sys.stderr)
+    else:
+        write_chrome_trace(output)
+        print('Profile was saved to ' + output + '.', file=sys.stderr)
+
+
+def setup(output=None):
+    """Enable profiling for a command line tool, and report the result when
+    the tool exits.
+
+    `output`: Value of the --profile option: None if the option is absent,
+        '' or '1' to print a summary, or a file name for a Chrome trace. If
+        the option is absent, the FEFATES_PROFILE environment variable is
+        used instead.
+    """
+    if output is None:
+        output = os.environ.get(ENV_VARIABLE)
+        if output is None or output == '0':
+            return
+    enable()
+    atexit.register(_report, output)
+
+
+def add_argument(parser):
+    """Add the --profile option to an argparse parser."""
+    parser.add_argument('--profile', nargs='?', const='', default=None,
+                        metavar='TRACE', help='profile this run; print a '
+                        'summary, or write a Chrome trace to TRACE')
+
+
+if __name__ == '__main__':
+    print('This script is a library and does not mean to be used directly.')
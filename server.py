@@ -0,0 +1,701 @@
+#!/usr/bin/env python3
+#
+# The MIT License
+#
+# Copyright (c) 2017 RainThunder.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+"""A local HTTP/JSON server over the data files (Python 3.5+ only).
+
+GameData.bin, the handover files, castle_join.bin and the Dispos maps are
+loaded once and kept in memory. Tables are described by the Nightmare modules
+of this repository.
+
+Usage:
+    python3 server.py [--root DIR] [--host HOST] [--port PORT]
+
+Endpoints (`doc` is "gamedata", "handover/A", "castle_join", "dispos/A005",
+etc.; names with spaces must be URL-encoded):
+    GET   /docs                                List of documents
+    GET   /docs/{doc}                          Document info and table names
+    GET   /docs/{doc}/tables/{table}           Table: columns and rows
+    GET   /docs/{doc}/tables/{table}/rows/{i}  A single row, as an object
+    PATCH /docs/{doc}/tables/{table}/rows/{i}  Change cells: {"column": value}
+    POST  /docs/{doc}/tables/{table}/rows      Append rows (GameData.bin only):
+        {"ids": [...], "names": [...]}, plus "supports" (and optionally
+        "attack" / "defense") to append characters with support data
+    GET   /docs/{doc}/bin                      Formatted .bin file
+    POST  /docs/{doc}/save                     Write the .bin file to disk,
+        and update the Nightmare modules of GameData.bin if rows were appended
+
+Every document is an immutable snapshot. Writes are applied to a copy of the
+current snapshot in a worker thread and the new snapshot replaces the old one
+when it is complete, so readers never wait for a write. Responses of GET
+requests are cached per snapshot and carry an ETag; send it back in
+If-None-Match to get a 304 response. An ETag of a table only changes when that
+table (or the layout of the file) changes.
+
+Row patches which arrive within `--batch-delay` seconds are applied together
+as one write, producing a single new snapshot.
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from struct import unpack_from
+from urllib.parse import unquote, urlsplit
+
+import atomic
+import bin
+import castle_join
+import gamedata
+import gamedata_module
+import nightmare
+
+HTTP_REASONS = {
+    200: 'OK', 201: 'Created', 304: 'Not Modified', 400: 'Bad Request',
+    404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+    500: 'Internal Server Error'
+}
+
+MAX_BODY_SIZE = 16 * 1024 * 1024
+
+
+class HTTPError(Exception):
+    """An error which is sent to the client."""
+    def __init__(self, status, message):
+        super(HTTPError, self).__init__(message)
+        self.status = status
+
+
+##############################################################################
+# Tables and documents
+##############################################################################
+class TableView(object):
+    """Locate a table described by a Nightmare module in a .bin file.
+
+    The table offset is stored relative to a pointer in the file header
+    (`anchor`), so it stays correct after rows are appended to other tables.
+    The row count is read from the file if `count_offset` is set; if
+    `count_relative` is True, `count_offset` is relative to the table offset
+    (the count is stored right before the table).
+    """
+
+    def __init__(self, module, anchor=None, count_offset=None,
+                 count_format='<H', count_relative=False):
+        self.module = module
+        self.anchor = anchor # (pointer offset, distance from its value)
+        self.count_offset = count_offset
+        self.count_format = count_format
+        self.count_relative = count_relative
+
+    def locate(self, binfile):
+        """Get (offset in the data region, row count) of the table."""
+        offset = self.module.data_offset
+        if self.anchor is not None:
+            slot, delta = self.anchor
+            offset = unpack_from('<I', binfile.data, slot)[0] + delta
+        count = self.module.count
+        if self.count_offset is not None:
+            count_offset = self.count_offset
+            if self.count_relative:
+                count_offset += offset
+            count = unpack_from(self.count_format, binfile.data,
+                                count_offset)[0]
+        return offset, count
+
+    def read(self, binfile):
+        """Read the table. Return a list of basetypes.Column."""
+        offset, count = self.locate(binfile)
+        return self.module.read_columns(binfile, offset, count)
+
+
+def _header_size(binfile):
+    """Get the size of the header of GameData.bin-like files, which is the
+    smallest value of the pointers at the beginning of the file."""
+    return min([unpack_from('<I', binfile.data, p)[0]
+                for p in binfile.ptr1_list if p < 0x100] or [0])
+
+
+def _anchor(binfile, offset):
+    """Find the header pointer with the largest value not greater than a
+    table offset. Return (pointer offset, distance) or None."""
+    data = binfile.data
+    first = _header_size(binfile)
+    best = None
+    for slot in binfile.ptr1_list:
+        if slot >= first or slot >= 0x100:
+            continue
+        value = unpack_from('<I', data, slot)[0]
+        if value <= offset and (best is None or value > best[1]):
+            best = (slot, value)
+    if best is None:
+        return None
+    return best[0], offset - best[1]
+
+
+def gamedata_views(binfile, root):
+    """Create table views of GameData.bin from the modules in `root`."""
+    views = OrderedDict()
+    header_size = _header_size(binfile)
+    for table_name, module_path in gamedata_module.MODULE_ORDER:
+        path = os.path.join(root, module_path)
+        if not os.path.isfile(path):
+            continue
+        module = nightmare.load_module(path)
+        count_offset = None
+        count_relative = False
+        try:
+            info = binfile.get_table_info(table_name)
+            count = unpack_from('<H', binfile.data, info.count_offset)[0]
+            if count == module.count:
+                count_offset = info.count_offset
+                count_relative = count_offset >= header_size
+                if count_relative:
+                    count_offset -= module.data_offset
+        except (ValueError, TypeError):
+            pass
+        views[table_name] = TableView(module,
+                                      _anchor(binfile, module.data_offset),
+                                      count_offset,
+                                      count_relative=count_relative)
+    return views
+
+
+class Snapshot(object):
+    """An immutable state of a document."""
+
+    def __init__(self, binfile, version, table_versions, appends=()):
+        self.binfile = binfile
+        self.version = version
+        self.table_versions = table_versions # Table name -> version
+        # Appended rows which are not saved yet, for the modules:
+        # (table, IDs, names, data size difference)
+        self.appends = appends
+        self.cache = {} # Key -> (ETag, body)
+        self.columns = {} # Table name -> list of basetypes.Column
+
+
+class Document(object):
+    """A .bin file and its tables."""
+
+    def __init__(self, name, path, binfile, views, appendable=False,
+                 module_root=None):
+        self.name = name
+        self.path = path
+        self.views = views
+        self.appendable = appendable
+        self.module_root = module_root # Modules updated when rows are added
+        self.snapshot = Snapshot(binfile, 0, dict.fromkeys(views, 0))
+        self.pending = [] # Queued patches: (table, row, values, future)
+        self.flush_handle = None
+        self.lock = None # Created in the event loop
+
+    def columns(self, snapshot, table):
+        """Read a table of a snapshot (cached)."""
+        if table not in snapshot.columns:
+            snapshot.columns[table] = self.views[table].read(snapshot.binfile)
+        return snapshot.columns[table]
+
+    def apply_patches(self, snapshot, patches):
+        """Apply row patches to a copy of a snapshot.
+
+        Return (new snapshot or None, list of exceptions or None per patch).
+        """
+        binfile = snapshot.binfile.copy()
+        changed = set()
+        errors = []
+        for table, row, values in patches:
+            try:
+                self._patch(snapshot, binfile, table, row, values)
+                changed.add(table)
+                errors.append(None)
+            except (KeyError, ValueError, TypeError, UnicodeError) as e:
+                errors.append(e)
+        if len(changed) == 0:
+            return None, errors
+        table_versions = dict(snapshot.table_versions)
+        for table in changed:
+            table_versions[table] += 1
+        return Snapshot(binfile, snapshot.version + 1, table_versions,
+                        snapshot.appends), errors
+
+    def _patch(self, snapshot, binfile, table, row, values):
+        view = self.views[table]
+        offset, count = view.locate(binfile)
+        if not 0 <= row < count:
+            raise ValueError('row index out of range: %d' % row)
+        types = dict([(c.name, c.type) for c in self.columns(snapshot, table)])
+        values = dict(values)
+        for name, value in values.items():
+            if types.get(name) is bytes and isinstance(value, str):
+                values[name] = bytes.fromhex(value)
+        view.module.write_row(binfile, row, values, types, offset)
+
+    def append_rows(self, snapshot, table, body):
+        """Append rows to a copy of a snapshot. Return the new snapshot."""
+        if not self.appendable:
+            raise HTTPError(405, 'rows cannot be appended to ' + self.name)
+        ids = body.get('ids')
+        names = body.get('names')
+        if not isinstance(ids, list) or not isinstance(names, list) or \
+                len(ids) != len(names) or len(names) == 0:
+            raise HTTPError(400, '"ids" and "names" must be lists of the '
+                            'same, non-zero length')
+        binfile = snapshot.binfile.copy()
+        try:
+            if 'supports' in body:
+                if table != 'Character':
+                    raise HTTPError(400, '"supports" is only valid for '
+                                    'characters')
+                binfile.append_character(ids, names, body['supports'],
+                                         body.get('attack', True),
+                                         body.get('defense', True))
+            else:
+                binfile.append(table, ids, names)
+        except (KeyError, ValueError, TypeError, IndexError, UnicodeError) as e:
+            raise HTTPError(400, '%s: %s' % (e.__class__.__name__, e))
+        # Offsets of other tables may be changed, so every table is new.
+        table_versions = dict([(t, v + 1) for t, v in
+                               snapshot.table_versions.items()])
+        appends = snapshot.appends + ((table, ids, names, len(binfile.data) -
+                                       len(snapshot.binfile.data)),)
+        return Snapshot(binfile, snapshot.version + 1, table_versions,
+                        appends)
+
+
+def load_documents(root):
+    """Load all supported files in a folder. Return a dict of documents."""
+    documents = OrderedDict()
+
+    path = os.path.join(root, 'GameData.bin')
+    if os.path.isfile(path):
+        binfile = gamedata.load_file(path)
+        documents['gamedata'] = Document('gamedata', path, binfile,
+                                         gamedata_views(binfile, root), True,
+                                         root)
+
+    for folder in sorted(glob.glob(os.path.join(root,
+                                                'Character_*_HANDOVER'))):
+        route = folder.rsplit('_', 2)[1]
+        path = os.path.join(folder, route + '_HANDOVER.bin')
+        module_path = os.path.join(folder, 'Character_' + route + '.nmm')
+        if not (os.path.isfile(path) and os.path.isfile(module_path)):
+            continue
+        module = nightmare.load_module(module_path)
+        views = OrderedDict([('Character', TableView(module,
+                                                     count_offset=0x4))])
+        name = 'handover/' + route
+        documents[name] = Document(name, path, bin.load_file(path), views)
+
+    path = os.path.join(root, 'castle_join.bin')
+    if os.path.isfile(path):
+        binfile = castle_join.load_bin(path)
+        module = nightmare.Module()
+        module.fromrowclass(castle_join.Character, 0x24,
+                            len(binfile.characters), u'castle_join')
+        views = OrderedDict([('Character', TableView(
+            module, count_offset=0x0, count_format='<I'))])
+        documents['castle_join'] = Document('castle_join', path, binfile,
+                                            views)
+
+    dispos_root = os.path.join(root, 'Dispos')
+    if os.path.isdir(dispos_root):
+        for name in sorted(os.listdir(dispos_root)):
+            path = os.path.join(dispos_root, name, name + '.bin')
+            module_path = os.path.join(dispos_root, name, name + '.nmm')
+            if not (os.path.isfile(path) and os.path.isfile(module_path)):
+                continue
+            views = OrderedDict([('Unit', TableView(
+                nightmare.load_module(module_path)))])
+            documents['dispos/' + name] = Document(
+                'dispos/' + name, path, bin.load_file(path), views)
+    return documents
+
+
+##############################################################################
+# Application
+##############################################################################
+def _json_cell(value):
+    if isinstance(value, bytes):
+        return value.hex()
+    return value
+
+
+def _encode(obj):
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+class Application(object):
+    """Route requests to documents."""
+
+    def __init__(self, documents, executor=None, batch_delay=0.01):
+        self.documents = documents
+        self.executor = executor or ThreadPoolExecutor()
+        self.batch_delay = batch_delay
+        self.epoch = '%x' % int(time.time()) # Invalidate ETags on restart
+        self._rendering = {} # (document, version, key) -> future
+
+    def _document(self, name):
+        if name not in self.documents:
+            raise HTTPError(404, 'no such document: ' + name)
+        return self.documents[name]
+
+    def _view(self, document, table):
+        if table not in document.views:
+            raise HTTPError(404, 'no such table: ' + table)
+        return document.views[table]
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def _cached(self, document, snapshot, key, etag, render):
+        """Get (ETag, body) of a snapshot, rendering it at most once."""
+        if key in snapshot.cache:
+            return snapshot.cache[key]
+        token = (document.name, snapshot.version, key)
+        future = self._rendering.get(token)
+        if future is None:
+            future = asyncio.ensure_future(self._run(render))
+            self._rendering[token] = future
+            try:
+                body = await future
+                snapshot.cache[key] = (etag, body)
+            finally:
+                del self._rendering[token]
+            return etag, body
+        return etag, await future
+
+    def _etag(self, document, *parts):
+        return '"%s-%s-%s"' % (self.epoch, document.name.replace('/', '.'),
+                               '-'.join([str(p) for p in parts]))
+
+    async def dispatch(self, method, target, headers, body):
+        """Handle a request. Return (status, headers, body)."""
+        url = urlsplit(target)
+        parts = [unquote(p) for p in url.path.strip('/').split('/') if p]
+        if len(parts) == 0 or parts[0] != 'docs':
+            raise HTTPError(404, 'not found')
+        if len(parts) == 1:
+            if method != 'GET':
+                raise HTTPError(405, 'method not allowed')
+            return self._json(200, [self._info(d) for d in
+                                    self.documents.values()])
+
+        # Document names may contain a slash
+        name = parts[1]
+        rest = parts[2:]
+        if name not in self.documents and len(parts) > 2:
+            name = parts[1] + '/' + parts[2]
+            rest = parts[3:]
+        document = self._document(name)
+
+        if len(rest) == 0:
+            self._allow(method, 'GET')
+            return self._json(200, self._info(document))
+        if rest == ['bin']:
+            self._allow(method, 'GET')
+            return await self._get_bin(document, headers)
+        if rest == ['save']:
+            self._allow(method, 'POST')
+            return await self._save(document)
+        if rest[0] != 'tables' or len(rest) < 2:
+            raise HTTPError(404, 'not found')
+        table = rest[1]
+        self._view(document, table)
+        if len(rest) == 2:
+            self._allow(method, 'GET')
+            return await self._get_table(document, table, headers)
+        if rest[2] != 'rows':
+            raise HTTPError(404, 'not found')
+        if len(rest) == 3:
+            self._allow(method, 'POST')
+            return await self._append(document, table, self._body(body))
+        try:
+            row = int(rest[3])
+        except ValueError:
+            raise HTTPError(404, 'invalid row index: ' + rest[3])
+        if method == 'GET':
+            return await self._get_row(document, table, row)
+        self._allow(method, 'PATCH')
+        return await self._patch(document, table, row, self._body(body))
+
+    @staticmethod
+    def _allow(method, allowed):
+        if method != allowed:
+            raise HTTPError(405, 'method not allowed')
+
+    @staticmethod
+    def _body(body):
+        try:
+            obj = json.loads(body.decode('utf-8'))
+        except ValueError:
+            raise HTTPError(400, 'invalid JSON')
+        if not isinstance(obj, dict):
+            raise HTTPError(400, 'expected a JSON object')
+        return obj
+
+    @staticmethod
+    def _json(status, obj, etag=None):
+        headers = [('Content-Type', 'application/json; charset=utf-8')]
+        if etag is not None:
+            headers.append(('ETag', etag))
+        return status, headers, _encode(obj)
+
+    def _info(self, document):
+        snapshot = document.snapshot
+        return OrderedDict([
+            ('name', document.name),
+            ('path', document.path),
+            ('version', snapshot.version),
+            ('size', len(snapshot.binfile)),
+            ('tables', list(document.views)),
+            ('appendable', document.appendable)
+        ])
+
+    @staticmethod
+    def _not_modified(headers, etag):
+        if etag in [t.strip() for t in
+                    headers.get('if-none-match', '').split(',')]:
+            return 304, [('ETag', etag)], b''
+        return None
+
+    async def _get_table(self, document, table, headers):
+        snapshot = document.snapshot
+        etag = self._etag(document, table.replace(' ', ''),
+                          snapshot.table_versions[table])
+        response = self._not_modified(headers, etag)
+        if response is not None:
+            return response
+
+        def render():
+            columns = document.columns(snapshot, table)
+            offset, count = document.views[table].locate(snapshot.binfile)
+            return _encode(OrderedDict([
+                ('name', table),
+                ('offset', offset + 0x20),
+                ('count', count),
+                ('columns', [OrderedDict([('name', c.name),
+                                          ('type', c.type.__name__)])
+                             for c in columns]),
+                ('rows', [[_json_cell(v) for v in row] for row in
+                          zip(*[c.values for c in columns])])
+            ]))
+        etag, body = await self._cached(document, snapshot, ('table', table),
+                                        etag, render)
+        return 200, [('Content-Type', 'application/json; charset=utf-8'),
+                     ('ETag', etag)], body
+
+    async def _get_row(self, document, table, row):
+        snapshot = document.snapshot
+        columns = await self._run(document.columns, snapshot, table)
+        if len(columns) == 0 or not 0 <= row < len(columns[0].values):
+            raise HTTPError(404, 'no such row: %d' % row)
+        return self._json(200, OrderedDict([
+            (c.name, _json_cell(c.values[row])) for c in columns]),
+            self._etag(document, table.replace(' ', ''),
+                       snapshot.table_versions[table], row))
+
+    async def _get_bin(self, document, headers):
+        snapshot = document.snapshot
+        etag = self._etag(document, 'bin', snapshot.version)
+        response = self._not_modified(headers, etag)
+        if response is not None:
+            return response
+
+        def render():
+            binfile = snapshot.binfile.copy()
+            binfile.format()
+            return binfile.tobin()
+        etag, body = await self._cached(document, snapshot, ('bin',), etag,
+                                        render)
+        return 200, [('Content-Type', 'application/octet-stream'),
+                     ('ETag', etag)], body
+
+    async def _patch(self, document, table, row, values):
+        future = asyncio.get_event_loop().create_future()
+        document.pending.append((table, row, values, future))
+        if document.flush_handle is None:
+            document.flush_handle = asyncio.get_event_loop().call_later(
+                self.batch_delay,
+                lambda: asyncio.ensure_future(self._flush(document)))
+        version = await future
+        return self._json(200, OrderedDict([('version', version)]))
+
+    async def _flush(self, document):
+        """Apply all queued patches of a document as one write."""
+        async with document.lock:
+            document.flush_handle = None
+            batch = document.pending
+            document.pending = []
+            if len(batch) == 0:
+                return
+            try:
+                snapshot, errors = await self._run(
+                    document.apply_patches, document.snapshot,
+                    [item[:3] for item in batch])
+            except Exception as e:
+                for item in batch:
+                    item[3].set_exception(e)
+                return
+            if snapshot is not None:
+                document.snapshot = snapshot
+            for item, error in zip(batch, errors):
+                if error is None:
+                    item[3].set_result(document.snapshot.version)
+                else:
+                    item[3].set_exception(HTTPError(400, '%s: %s' % (
+                        error.__class__.__name__, error)))
+
+    async def _append(self, document, table, body):
+        async with document.lock:
+            snapshot = await self._run(document.append_rows,
+                                       document.snapshot, table, body)
+            document.snapshot = snapshot
+        return self._json(201, self._info(document))
+
+    async def _save(self, document):
+        if document.flush_handle is not None:
+            document.flush_handle.cancel()
+            await self._flush(document)
+        # No row is appended while the file is written, so the appends of
+        # the saved snapshot are written exactly once
+        async with document.lock:
+            snapshot = document.snapshot
+            status, headers, body = await self._get_bin(document, {})
+
+            def write():
+                if not snapshot.appends:
+                    atomic.write_file(document.path, body)
+                    return
+                # GameData.bin and its modules are replaced together
+                root = document.module_root
+                with atomic.Transaction(root) as transaction:
+                    project = gamedata_module.ModuleProject(root, transaction)
+                    for table, ids, names, diff in snapshot.appends:
+                        project.add(table, ids, names, diff)
+                    transaction.write(document.path, body)
+                    project.save()
+            await self._run(write)
+            snapshot.appends = ()
+        return self._json(200, OrderedDict([('path', document.path),
+                                            ('version', snapshot.version),
+                                            ('size', len(body))]))
+
+
+##############################################################################
+# HTTP
+##############################################################################
+async def handle_connection(app, reader, writer):
+    """Serve HTTP/1.1 requests on a connection."""
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                method, target, version = line.decode('latin-1').split()
+            except ValueError:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                key, _, value = line.decode('latin-1').partition(':')
+                headers[key.strip().lower()] = value.strip()
+
+            try:
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY_SIZE:
+                    raise HTTPError(413, 'request body is too large')
+                body = await reader.readexactly(length) if length else b''
+                status, response_headers, payload = await app.dispatch(
+                    method, target, headers, body)
+            except HTTPError as e:
+                status, response_headers, payload = Application._json(
+                    e.status, {'error': str(e)})
+            except Exception as e:
+                status, response_headers, payload = Application._json(
+                    500, {'error': '%s: %s' % (e.__class__.__name__, e)})
+
+            keep_alive = version == 'HTTP/1.1' and \
+                headers.get('connection', '').lower() != 'close'
+            lines = ['HTTP/1.1 %d %s' % (status, HTTP_REASONS.get(status, '')),
+                     'Content-Length: %d' % len(payload),
+                     'Connection: ' + ('keep-alive' if keep_alive else 'close')]
+            lines.extend(['%s: %s' % h for h in response_headers])
+            writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+            if method != 'HEAD':
+                writer.write(payload)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(documents, host='127.0.0.1', port=8017,
+                       batch_delay=0.01):
+    """Start the server. Return (asyncio server, application)."""
+    app = Application(documents, batch_delay=batch_delay)
+    for document in documents.values():
+        document.lock = asyncio.Lock()
+    server = await asyncio.start_server(
+        lambda r, w: handle_connection(app, r, w), host, port)
+    return server, app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--root', default='.',
+                        help='folder which contains the data files and '
+                        'modules (default: current folder)')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8017,
+                        help='port to listen on (default: 8017)')
+    parser.add_argument('--batch-delay', type=float, default=0.01,
+                        help='seconds to collect row patches before they are '
+                        'applied (default: 0.01)')
+    args = parser.parse_args()
+
+    documents = load_documents(args.root)
+    print('Loaded %d document(s).' % len(documents))
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server, app = loop.run_until_complete(start_server(
+        documents, args.host, args.port, args.batch_delay))
+    print('Serving on http://%s:%d/docs' % (args.host, args.port))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        loop.run_until_complete(server.wait_closed())
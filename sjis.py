@@ -0,0 +1,146 @@
+#!/usr/bin/env python2
+#
+# The MIT License
+#
+# Copyright (c) 2017 RainThunder.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+"""Cached Shift-JIS encoding and decoding of labels.
+
+The same few thousand labels (PID_, IID_, JID_, ...) appear in GameData.bin,
+every Dispos map and most other files, so every label which is encoded or
+decoded is kept in a bounded cache shared by all tools in this project.
+
+The cache has two generations. A lookup checks the new generation, then the
+old one (and moves the entry to the new generation). When the new generation
+is full, the old one is dropped and the new one becomes the old one. The
+least recently used labels are dropped first, a lookup costs at most two
+dictionary lookups, and at most `maxsize` labels are kept.
+
+Hits and misses are counted and reported by the profiling module, see
+`stats()`. Counters are not locked, so they are approximate when several
+threads use the cache.
+
+Example:
+    >>> import sjis
+    >>> raw = sjis.encode(u'PID_A')
+    >>> sjis.decode(raw) == u'PID_A'
+    True
+"""
+
+import sys
+if sys.version_info[0] > 2:
+    unicode = str
+
+import profiling
+
+ENCODING = 'shift-jis'
+DEFAULT_MAXSIZE = 0x10000
+
+
+class LabelCache(object):
+    """A bounded cache for a single conversion function."""
+
+    def __init__(self, convert, maxsize=DEFAULT_MAXSIZE):
+        """`convert`: Function which converts a label
+        `maxsize`: Maximum number of cached labels
+        """
+        self._convert = convert
+        self._new = {}
+        self._old = {}
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._new) + len(self._old)
+
+    def get(self, label):
+        """Convert a label, using the cached result if there is one."""
+        result = self._new.get(label)
+        if result is not None:
+            self.hits += 1
+            return result
+        result = self._old.pop(label, None)
+        if result is None:
+            self.misses += 1
+            result = self._convert(label)
+        else:
+            self.hits += 1
+        if len(self._new) >= self.maxsize // 2:
+            self._old = self._new
+            self._new = {}
+        self._new[label] = result
+        return result
+
+    def clear(self):
+        """Remove all cached labels and reset the counters."""
+        self._new = {}
+        self._old = {}
+        self.hits = 0
+        self.misses = 0
+
+
+_encoder = LabelCache(lambda label: label.encode(ENCODING))
+_decoder = LabelCache(lambda raw: raw.decode(ENCODING))
+
+
+def encode(label):
+    """Encode a unicode label to Shift-JIS."""
+    return _encoder.get(label)
+
+
+def decode(raw):
+    """Decode a Shift-JIS label to unicode."""
+    return _decoder.get(raw)
+
+
+def set_maxsize(maxsize):
+    """Set the maximum number of labels kept by each cache."""
+    _encoder.maxsize = maxsize
+    _decoder.maxsize = maxsize
+    clear()
+
+
+def clear():
+    """Remove all cached labels and reset the counters."""
+    _encoder.clear()
+    _decoder.clear()
+
+
+def stats():
+    """Return a dictionary of counters: hits, misses and number of cached
+    labels for encoding and decoding.
+    """
+    return {
+        'sjis.encode.hits': _encoder.hits,
+        'sjis.encode.misses': _encoder.misses,
+        'sjis.encode.size': len(_encoder),
+        'sjis.decode.hits': _decoder.hits,
+        'sjis.decode.misses': _decoder.misses,
+        'sjis.decode.size': len(_decoder)
+    }
+
+
+profiling.register_counters(stats)
+
+
+if __name__ == '__main__':
+    print('This script is a library and does not mean to be used directly.')
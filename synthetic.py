@@ -0,0 +1,317 @@
+#!/usr/bin/env python2
+#
+# The MIT License
+#
+# Copyright (c) 2017 RainThunder.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+"""Generate large synthetic .bin, .arc and fst.bin files for stress testing.
+
+All files are built with the regular writers (`BinFile.repack`,
+`Arc.append_file` / `Arc.to_arc`, `Fst.construct`), so they are valid files
+which can be loaded by every tool in this repository. The output only depends
+on the parameters and the seed, so the same command always generates the same
+bytes, on both Python 2 and Python 3.
+
+A synthetic .bin file has the same layout as castle_join.bin: a 4-byte row
+count followed by the rows. Each row has `fields` 4-byte cells; a fraction of
+them (`pointer_density`) are label pointers, the others are integers.
+
+Usage:
+    python synthetic.py bin OUTPUT [--rows N] [--fields N] [--labels N]
+        [--label-length N] [--pointer-density F] [--seed N]
+    python synthetic.py arc OUTPUT [--files N] [--min-size N] [--max-size N]
+        [--seed N]
+    python synthetic.py fst OUTPUT [--files N] [--depth N] [--seed N]
+    python synthetic.py gamedata OUTPUT [--scale N] [--input GameData.bin]
+
+Example:
+    >>> import synthetic
+    >>> a = synthetic.generate_bin(10000, labels=5000, seed=1)
+    >>> b = synthetic.generate_bin(10000, labels=5000, seed=1)
+    >>> a.tobin() == b.tobin()
+    True
+"""
+
+from __future__ import print_function, unicode_literals
+import random
+import sys
+from collections import OrderedDict
+from struct import pack, unpack
+if sys.version_info[0] > 2:
+    xrange = range
+    unicode = str
+    unichr = chr
+
+import arc
+import atomic
+import basetypes
+import bin
+import fst_generator
+import gamedata
+
+# Characters used in generated labels. Katakana are 2 bytes in Shift-JIS,
+# like most of the labels in the game files.
+ASCII_CHARS = u'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_'
+KANA_CHARS = u''.join([unichr(c) for c in xrange(0x30A2, 0x30F3)])
+LABEL_PREFIXES = [u'PID_', u'IID_', u'JID_', u'SID_', u'MPID_', u'MIID_']
+
+
+def _randint(rng, a, b):
+    """Get a random integer N such that a <= N <= b.
+
+    random.randint is not used because its output is different between
+    Python 2 and Python 3.
+    """
+    return a + int(rng.random() * (b - a + 1))
+
+
+def generate_labels(count, length=12, seed=0):
+    """Generate a list of distinct labels.
+
+    `count`: Number of labels
+    `length`: Average label length, in characters. Actual lengths vary by
+        about 25%, but a label is never shorter than its unique suffix.
+    `seed`: Random seed
+
+    Half of the characters of a label (after its prefix) are katakana.
+    """
+    rng = random.Random(seed)
+    labels = []
+    for i in xrange(count):
+        prefix = LABEL_PREFIXES[i % len(LABEL_PREFIXES)]
+        suffix = u'_%X' % i
+        target = _randint(rng, max(1, length - length // 4),
+                          length + length // 4)
+        body = []
+        for j in xrange(target - len(prefix) - len(suffix)):
+            chars = KANA_CHARS if rng.random() < 0.5 else ASCII_CHARS
+            body.append(chars[int(rng.random() * len(chars))])
+        labels.append(prefix + u''.join(body) + suffix)
+    return labels
+
+
+def make_table_class(fields, pointer_density):
+    """Create a Table class for synthetic rows.
+
+    `fields`: Number of 4-byte cells in a row
+    `pointer_density`: Fraction of cells which are label pointers (0.0 - 1.0)
+
+    Label cells are spread evenly across the row.
+    """
+    structure = OrderedDict()
+    for i in xrange(fields):
+        if int((i + 1) * pointer_density) > int(i * pointer_density):
+            datatype = basetypes.Label
+        else:
+            datatype = basetypes.U32
+        structure['field%d' % i] = basetypes.Structure(datatype,
+                                                       basetypes.Formats.HEX)
+    rowclass = type(str('SyntheticRow'), (basetypes.Row,),
+                    {'structure': structure})
+    return type(str('SyntheticTable'), (basetypes.Table,), {'type': rowclass})
+
+
+class SyntheticBin(bin.BinFile):
+    """A .bin file with a row count and a single table of synthetic rows."""
+
+    def __init__(self, header=None, raw=None):
+        super(SyntheticBin, self).__init__(header, raw)
+        if raw is None:
+            self._data = b'\0' * 4
+
+    def get_count(self):
+        """Get the number of rows."""
+        return unpack('<I', self._data[0x0:0x4])[0]
+
+    def build(self, table):
+        """Replace the content of this file with `table`."""
+        self.repack(table, 0x4)
+        self._data = pack('<I', len(table)) + self._data[0x4:]
+
+
+def generate_bin(rows, fields=8, labels=None, label_length=12,
+                 pointer_density=0.25, null_density=0.0, seed=0):
+    """Generate a synthetic .bin file.
+
+    `rows`: Number of rows
+    `fields`: Number of 4-byte cells in a row
+    `labels`: Number of distinct labels to choose from. Default: `rows`
+    `label_length`: Average label length, in characters
+    `pointer_density`: Fraction of cells which are label pointers
+    `null_density`: Fraction of label cells which are NULL
+    `seed`: Random seed
+
+    Return a SyntheticBin object.
+    """
+    if labels is None:
+        labels = rows
+    tableclass = make_table_class(fields, pointer_density)
+    rowclass = tableclass.type
+    label_cells = [i for i, (name, datatype) in
+                   enumerate(rowclass.flatten_columns())
+                   if datatype is basetypes.Label]
+    if labels == 0 and len(label_cells) > 0:
+        null_density = 1.0
+    label_list = generate_labels(labels, label_length, seed)
+
+    rng = random.Random(seed)
+    table = tableclass()
+    for i in xrange(rows):
+        data = [int(rng.random() * 0x100000000) for j in xrange(fields)]
+        for j in label_cells:
+            if null_density > 0 and rng.random() < null_density:
+                data[j] = u'NULL'
+            else:
+                data[j] = label_list[int(rng.random() * labels)]
+        table.append(rowclass(data))
+
+    binfile = SyntheticBin()
+    binfile.build(table)
+    return binfile
+
+
+def generate_arc(files, min_size=0x40, max_size=0x440, seed=0):
+    """Generate a synthetic .arc file.
+
+    `files`: Number of files
+    `min_size`, `max_size`: Range of file sizes, in bytes
+    `seed`: Random seed
+
+    Return an arc.Arc object.
+    """
+    rng = random.Random(seed)
+    archive = arc.Arc()
+    for i in xrange(files):
+        size = _randint(rng, min_size, max_size)
+        fill = bytes(bytearray([i & 0xFF]))
+        archive.append_file(u'file%05d.bin' % i, fill * size)
+    return archive
+
+
+def generate_file_list(files, depth=3, seed=0):
+    """Generate a sorted list of distinct relative file paths, like the ones
+    in a DLC's RomFS.
+
+    `files`: Number of paths
+    `depth`: Maximum folder depth
+    `seed`: Random seed
+    """
+    rng = random.Random(seed)
+    folders = [u'']
+    paths = []
+    for i in xrange(files):
+        # Sometimes create a new folder under an existing one
+        parent = folders[int(rng.random() * len(folders))]
+        if parent.count(u'/') < depth and rng.random() < 0.1:
+            parent += u'dir%d/' % len(folders)
+            folders.append(parent)
+        paths.append(parent + u'file%d.bin.lz' % i)
+    return sorted(paths)
+
+
+def generate_fst(files, depth=3, seed=0):
+    """Generate a synthetic fst.bin file.
+
+    Return a fst_generator.Fst object.
+    """
+    fst = fst_generator.Fst()
+    fst.construct(generate_file_list(files, depth, seed))
+    return fst
+
+
+def scale_gamedata(raw, scale):
+    """Append rows to the Item and Class tables of GameData.bin until they
+    have `scale` times their original row count.
+
+    `raw`: Content of GameData.bin
+
+    Return the content of the new file.
+    """
+    game_data = gamedata.load(raw)
+    for table_name in ('Item', 'Class'):
+        info = game_data.get_table_info(table_name)
+        count = unpack('<H', game_data.data[
+            info.count_offset:info.count_offset + 2])[0]
+        extra = count * (scale - 1)
+        if extra <= 0:
+            continue
+        # IDs are 16-bit and must stay unique.
+        ids = [(0x4000 + i) & 0xFFFF for i in xrange(extra)]
+        names = [u'SYNTH%s%d' % (table_name, i) for i in xrange(extra)]
+        game_data.append(table_name, ids, names)
+    game_data.format()
+    return game_data.tobin()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('kind', choices=['bin', 'arc', 'fst', 'gamedata'],
+                        help='type of file to generate')
+    parser.add_argument('output', help='output file name')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed (default: 0)')
+    parser.add_argument('--rows', type=int, default=10000,
+                        help='(bin) number of rows (default: 10000)')
+    parser.add_argument('--fields', type=int, default=8,
+                        help='(bin) number of 4-byte cells in a row '
+                        '(default: 8)')
+    parser.add_argument('--labels', type=int, default=None,
+                        help='(bin) number of distinct labels '
+                        '(default: same as --rows)')
+    parser.add_argument('--label-length', type=int, default=12,
+                        help='(bin) average label length (default: 12)')
+    parser.add_argument('--pointer-density', type=float, default=0.25,
+                        help='(bin) fraction of cells which are label '
+                        'pointers (default: 0.25)')
+    parser.add_argument('--null-density', type=float, default=0.0,
+                        help='(bin) fraction of label cells which are NULL '
+                        '(default: 0)')
+    parser.add_argument('--files', type=int, default=10000,
+                        help='(arc, fst) number of files (default: 10000)')
+    parser.add_argument('--min-size', type=int, default=0x40,
+                        help='(arc) minimum file size (default: 64)')
+    parser.add_argument('--max-size', type=int, default=0x440,
+                        help='(arc) maximum file size (default: 1088)')
+    parser.add_argument('--depth', type=int, default=3,
+                        help='(fst) maximum folder depth (default: 3)')
+    parser.add_argument('--scale', type=int, default=10,
+                        help='(gamedata) row multiplier (default: 10)')
+    parser.add_argument('--input', default='GameData.bin',
+                        help='(gamedata) original GameData.bin')
+    args = parser.parse_args()
+
+    if args.kind == 'bin':
+        output = generate_bin(args.rows, args.fields, args.labels,
+                              args.label_length, args.pointer_density,
+                              args.null_density, args.seed).tobin()
+    elif args.kind == 'arc':
+        output = generate_arc(args.files, args.min_size, args.max_size,
+                              args.seed).to_arc()
+    elif args.kind == 'fst':
+        output = generate_fst(args.files, args.depth, args.seed).tobin()
+    else:
+        with open(args.input, 'rb') as file:
+            output = scale_gamedata(file.read(), args.scale)
+
+    atomic.write_file(args.output, output)
+    print('%s was generated (%d bytes).' % (args.output, len(output)))
@@ -10,13 +10,25 @@ You can also drag and drop the modified files to this script.
 import argparse
 from struct import unpack
 
+
+def trim(path):
+    """Trim a file to the size stored in its header.
+
+    Return True if the file was trimmed.
+    """
+    with open(path, 'r+b') as f:
+        size = unpack('<I', f.read(4))[0]
+        f.seek(0, 2)
+        if f.tell() <= size:
+            return False
+        f.truncate(size)
+        return True
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('files', nargs='+', help='input files.')
     args = parser.parse_args()
 
     for file in args.files:
-        with open(file, 'r+b') as f:
-            size = unpack('<I', f.read(4))[0]
-            f.seek(0)
-            f.truncate(size)
+        trim(file)
@@ -0,0 +1,483 @@
+#!/usr/bin/env python2
+#
+# The MIT License
+#
+# Copyright (c) 2017 RainThunder.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+"""Watch folders and rebuild edited files as soon as they are saved.
+
+Usage:
+    python watch.py [paths ...] [--dlc DIR] [--arc DIR] [-j N] [--delay S]
+        [--poll [S]]
+
+`paths` default to the current folder. When a file is changed, only the
+affected steps are run:
+- .bin files: trim the padding added by Nightmare, then check that the file
+  can be loaded and that all its labels can be read.
+- .nmm files: check that the module can be parsed, and that its table fits
+  in the .bin file next to it (or GameData.bin), if there is one.
+- Files in a DLC folder: regenerate its fst.bin (incrementally, see
+  fst_generator.py). A folder which contains fst.bin is a DLC folder.
+- Files in an arc folder: repack it to <folder>.arc. A folder is an arc
+  folder if <folder>.arc exists next to it.
+`--dlc` and `--arc` add DLC and arc folders which are not detected
+automatically.
+
+Changes are collected until nothing changes for `--delay` seconds (default:
+0.2), then processed in a pool of `--jobs` threads: first the .bin and .nmm
+checks, then the fst.bin and .arc rebuilds. Each file or folder is processed
+at most once per batch, so the amount of queued work is bounded by the number
+of watched targets.
+
+On Linux, changes are detected with inotify. On other systems, or with
+`--poll`, the folders are scanned periodically instead.
+"""
+
+from __future__ import print_function
+import errno
+import os
+import select
+import sys
+import threading
+import time
+from collections import namedtuple
+from struct import unpack_from
+if sys.version_info[0] > 2:
+    xrange = range
+    unicode = str
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+try:
+    import ctypes
+    import ctypes.util
+except ImportError:
+    ctypes = None
+
+import arc
+import atomic
+import bin
+import fst_generator
+import nightmare
+import profiling
+import trim
+
+# Steps of a batch. Tasks of a step run in parallel; steps run in order.
+CHECK_STEPS = ('bin', 'module')
+BUILD_STEPS = ('fst', 'arc')
+
+# Temporary files written by editors
+IGNORED_SUFFIXES = ('~', '.swp', '.swx', '.tmp', '.fstcache')
+
+
+class Task(namedtuple('Task', ['action', 'path'])):
+    """A unit of work: `action` is 'bin', 'module', 'fst' or 'arc', `path` is
+    the file or folder to process."""
+    __slots__ = ()
+
+
+##############################################################################
+# Watchers
+##############################################################################
+class PollingWatcher(object):
+    """Detect changes by comparing the size and modification time of all files
+    in the watched folders."""
+
+    def __init__(self, paths, interval=0.5):
+        self.paths = paths
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        for root in self.paths:
+            if os.path.isfile(root):
+                self._stat(root, snapshot)
+                continue
+            for dirpath, dirnames, filenames in os.walk(root):
+                for name in filenames:
+                    self._stat(os.path.join(dirpath, name), snapshot)
+        return snapshot
+
+    @staticmethod
+    def _stat(path, snapshot):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        snapshot[path] = (st.st_size, st.st_mtime)
+
+    def wait(self, timeout=None):
+        """Wait for changes. Return a list of changed (including created and
+        deleted) paths, which is empty if nothing changed before `timeout`."""
+        start = time.time()
+        while True:
+            delay = self.interval
+            if timeout is not None:
+                delay = min(delay, max(0, start + timeout - time.time()))
+            time.sleep(delay)
+            snapshot = self._scan()
+            old = self._snapshot
+            self._snapshot = snapshot
+            changed = [p for p in snapshot if old.get(p) != snapshot[p]]
+            changed.extend([p for p in old if p not in snapshot])
+            if len(changed) > 0 or (timeout is not None and
+                                    time.time() - start >= timeout):
+                return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(object):
+    """Detect changes with Linux's inotify."""
+    IN_MODIFY = 0x2
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+    IN_CLOEXEC = 0x80000
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | \
+        IN_DELETE
+
+    def __init__(self, paths):
+        libc_name = ctypes.util.find_library('c')
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self._fd = self._libc.inotify_init1(self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._dirs = {} # Watch descriptor -> folder path
+        self._files = {} # Watched single files: folder path -> file names
+        self.paths = paths
+        for path in paths:
+            if os.path.isfile(path):
+                folder = os.path.dirname(os.path.abspath(path))
+                self._files.setdefault(folder, set()).add(
+                    os.path.basename(path))
+                self._add_watch(folder)
+            else:
+                self._add_tree(path)
+
+    def _add_watch(self, path):
+        encoded = path if isinstance(path, bytes) else \
+            path.encode(sys.getfilesystemencoding())
+        wd = self._libc.inotify_add_watch(self._fd, encoded, self.MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), 'cannot watch ' + path)
+        self._dirs[wd] = path
+
+    def _add_tree(self, path):
+        """Watch a folder and its subfolders. Return all files in them."""
+        files = []
+        for dirpath, dirnames, filenames in os.walk(path):
+            self._add_watch(dirpath)
+            files.extend([os.path.join(dirpath, f) for f in filenames])
+        return files
+
+    def _read_events(self):
+        try:
+            buf = os.read(self._fd, 0x10000)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return []
+            raise
+        changed = []
+        offset = 0
+        while offset < len(buf):
+            wd, mask, cookie, length = unpack_from('iIII', buf, offset)
+            name = buf[offset + 16:offset + 16 + length].rstrip(b'\0')
+            offset += 16 + length
+            if mask & self.IN_Q_OVERFLOW:
+                # Events were lost; assume that everything changed.
+                for root in self.paths:
+                    changed.extend(self._add_tree(root) if
+                                   os.path.isdir(root) else [root])
+                continue
+            if mask & self.IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            folder = self._dirs.get(wd)
+            if folder is None or len(name) == 0:
+                continue
+            if not isinstance(folder, bytes):
+                name = name.decode(sys.getfilesystemencoding())
+            if folder in self._files and name not in self._files[folder]:
+                continue
+            path = os.path.join(folder, name)
+            if mask & self.IN_ISDIR:
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    # Files may be created before the folder is watched.
+                    changed.extend(self._add_tree(path))
+                changed.append(path)
+            else:
+                changed.append(path)
+        return changed
+
+    def wait(self, timeout=None):
+        """Wait for changes. Return a list of changed (including created and
+        deleted) paths, which is empty if nothing changed before `timeout`."""
+        try:
+            readable = select.select([self._fd], [], [], timeout)[0]
+        except select.error:
+            return []
+        if len(readable) == 0:
+            return []
+        return self._read_events()
+
+    def close(self):
+        os.close(self._fd)
+
+
+def create_watcher(paths, poll=None):
+    """Create an inotify watcher, or a polling watcher if inotify is not
+    available or `poll` (polling interval) is set."""
+    if poll is None and ctypes is not None and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(paths, poll or 0.5)
+
+
+##############################################################################
+# Builder
+##############################################################################
+class Builder(object):
+    """Turn changed paths into tasks and run them."""
+
+    def __init__(self, roots, dlc_dirs=(), arc_dirs=(), jobs=None,
+                 log=print):
+        """Create a builder.
+
+        `roots`: Watched files and folders
+        `dlc_dirs`: Additional DLC folders
+        `arc_dirs`: Additional arc folders
+        `jobs`: Number of worker threads. Default: CPU count
+        `log`: Function which prints messages
+        """
+        self.roots = set()
+        for path in roots:
+            path = os.path.abspath(path)
+            self.roots.add(path if os.path.isdir(path) else
+                           os.path.dirname(path))
+        self.dlc_dirs = set([os.path.abspath(p) for p in dlc_dirs])
+        self.arc_dirs = set([os.path.abspath(p) for p in arc_dirs])
+        self.log = log
+        if jobs is None:
+            jobs = getattr(os, 'cpu_count', lambda: None)() or 1
+        self._pool = None
+        if ThreadPoolExecutor is not None and jobs > 1:
+            self._pool = ThreadPoolExecutor(jobs)
+        self._lock = threading.Lock()
+        self._processed = {} # Path -> (size, mtime) after it was processed
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+
+    def _stat(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_size, st.st_mtime)
+
+    def _is_root(self, path):
+        return path in self.roots or os.path.dirname(path) == path
+
+    def classify(self, path):
+        """Get the list of tasks for a changed path."""
+        path = os.path.abspath(path)
+        name = os.path.basename(path)
+        if name.startswith('.') or name.endswith(IGNORED_SUFFIXES):
+            return []
+        tasks = []
+        if name == 'fst.bin':
+            return [] # Output of the fst task
+        if name.lower().endswith('.bin') and os.path.isfile(path):
+            with self._lock:
+                unchanged = self._processed.get(path) == self._stat(path)
+            if not unchanged:
+                tasks.append(Task('bin', path))
+        elif name.lower().endswith('.nmm') and os.path.isfile(path):
+            tasks.append(Task('module', path))
+
+        # Find the DLC and arc folders which contain this path
+        folder = os.path.dirname(path)
+        while True:
+            if folder in self.dlc_dirs or \
+                    os.path.isfile(os.path.join(folder, 'fst.bin')):
+                tasks.append(Task('fst', folder))
+            if folder in self.arc_dirs or os.path.isfile(folder + '.arc'):
+                tasks.append(Task('arc', folder))
+            if self._is_root(folder):
+                break
+            folder = os.path.dirname(folder)
+        return tasks
+
+    def run(self, task):
+        """Run a task. Return a message."""
+        start = time.time()
+        if task.action == 'bin':
+            trimmed = trim.trim(task.path)
+            binfile = bin.load_file(task.path)
+            binfile.get_labels()
+            with self._lock:
+                self._processed[task.path] = self._stat(task.path)
+            message = '%s is valid%s' % (task.path,
+                                         ' (trimmed)' if trimmed else '')
+        elif task.action == 'module':
+            module = nightmare.load_module(task.path)
+            message = task.path + ' is valid'
+            table_end = module.offset + module.count * module.size
+            bin_path = self._find_bin(task.path)
+            if bin_path is not None:
+                size = self._stat(bin_path)[0]
+                if table_end > size:
+                    raise ValueError('table ends at 0x%X, after the end of '
+                                     '%s (0x%X)' % (table_end, bin_path, size))
+        elif task.action == 'fst':
+            added, removed = fst_generator.generate(
+                task.path, fst_generator.get_manifest_path(task.path))
+            message = '%s: fst.bin generated (%d added, %d removed)' % (
+                task.path, len(added), len(removed))
+        elif task.action == 'arc':
+            archive = arc.load_folder(task.path)
+            with atomic.atomic_open(task.path + '.arc', 'wb') as arc_file:
+                archive.write(arc_file)
+            message = task.path + '.arc was created'
+        else:
+            raise ValueError('Unknown action: ' + task.action)
+        return '%s (%.0f ms)' % (message, (time.time() - start) * 1000)
+
+    def _find_bin(self, module_path):
+        """Find the .bin file which is edited with a module."""
+        stem = os.path.splitext(module_path)[0]
+        if os.path.isfile(stem + '.bin'):
+            return stem + '.bin'
+        folder = os.path.dirname(module_path)
+        while True:
+            path = os.path.join(folder, 'GameData.bin')
+            if os.path.isfile(path):
+                return path
+            if self._is_root(folder):
+                return None
+            folder = os.path.dirname(folder)
+
+    def _run_safe(self, task):
+        try:
+            with profiling.phase('watch.' + task.action):
+                return True, self.run(task)
+        except Exception as e:
+            return False, '%s: %s: %s' % (task.path, e.__class__.__name__, e)
+
+    def process(self, tasks):
+        """Run a batch of tasks: checks first, then rebuilds.
+
+        Return the number of failed tasks.
+        """
+        failures = 0
+        for steps in (CHECK_STEPS, BUILD_STEPS):
+            batch = sorted(set([t for t in tasks if t.action in steps]))
+            if len(batch) == 0:
+                continue
+            if self._pool is not None and len(batch) > 1:
+                results = self._pool.map(self._run_safe, batch)
+            else:
+                results = [self._run_safe(t) for t in batch]
+            for ok, message in results:
+                if not ok:
+                    failures += 1
+                self.log(('' if ok else 'ERROR: ') + message)
+        return failures
+
+
+def watch(paths, dlc_dirs=(), arc_dirs=(), jobs=None, delay=0.2, poll=None,
+          log=print):
+    """Watch files and folders until interrupted.
+
+    See the module documentation for the parameters.
+    """
+    roots = list(paths) + list(dlc_dirs) + list(arc_dirs)
+    builder = Builder(roots, dlc_dirs, arc_dirs, jobs, log)
+    watcher = create_watcher(roots, poll)
+    log('Watching %s (%s). Press Ctrl+C to stop.' % (
+        ', '.join(roots), 'polling' if isinstance(watcher, PollingWatcher)
+        else 'inotify'))
+    pending = set()
+    last_change = None
+    try:
+        while True:
+            timeout = None
+            if len(pending) > 0:
+                timeout = max(0, last_change + delay - time.time())
+            changed = watcher.wait(timeout)
+            if len(changed) > 0:
+                for path in changed:
+                    pending.update(builder.classify(path))
+                last_change = time.time()
+            elif len(pending) > 0 and time.time() - last_change >= delay:
+                tasks = pending
+                pending = set()
+                builder.process(tasks)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        builder.close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('paths', nargs='*', default=['.'],
+                        help='files and folders to watch (default: current '
+                        'folder)')
+    parser.add_argument('--dlc', action='append', default=[], metavar='DIR',
+                        help='DLC folder; its fst.bin is regenerated when a '
+                        'file is added or removed')
+    parser.add_argument('--arc', action='append', default=[], metavar='DIR',
+                        help='folder which is repacked to DIR.arc when it '
+                        'changes')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker threads (default: CPU count)')
+    parser.add_argument('--delay', type=float, default=0.2,
+                        help='seconds without changes before a batch is '
+                        'processed (default: 0.2)')
+    parser.add_argument('--poll', type=float, nargs='?', const=0.5,
+                        default=None, metavar='S',
+                        help='scan for changes every S seconds instead of '
+                        'using inotify (default: 0.5)')
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    profiling.setup(args.profile)
+
+    watch(args.paths, args.dlc, args.arc, args.jobs, args.delay, args.poll)